@@ -0,0 +1,222 @@
+"""Toelatingscontrole per API-sleutel: token bucket, in-flight-limiet en prioriteitsbanen.
+
+Elk verzoek kost tokens uit de bucket van zijn sleutel (de `X-API-KEY`,
+of het IP-adres voor de publieke webapp-endpoints). Is de bucket leeg,
+dan volgt meteen een 429 met `Retry-After`; er wordt nooit gewacht.
+
+De bucket is een GCRA: per sleutel één getal, het theoretische tijdstip
+waarop de bucket weer vol is. Dat maakt elke beslissing O(1) en laat zich
+atomair bijwerken in gedeelde opslag, zodat de limiet geldt voor alle
+workers samen:
+
+- `shm`: lezen en schrijven onder de bestandslock van het mmap-bestand;
+- `redis`: een klein Lua-script;
+- anders per proces.
+
+Daarnaast is het aantal gelijktijdige verzoeken per worker begrensd (de
+threadpool is ook per worker). Er zijn twee banen: `interactive` (chat,
+vragen van de gebruiker) mag de volle limiet gebruiken, `background`
+(timer-tikken, vooruit ophalen) maar een deel ervan, en moet bovendien een
+reserve in de bucket laten staan voor interactief werk.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache_backends import SharedMemoryCache
+from metrics import Counter, Gauge
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+ADMISSION_DECISIONS = Counter(
+    "travelbot_admission_total", "Toelatingsbeslissingen per baan (admitted, rate_limited, overloaded)",
+    labelnames=("lane", "outcome"),
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "travelbot_admission_in_flight", "Toegelaten verzoeken die nog lopen in dit proces, per baan",
+    labelnames=("lane",),
+)
+
+
+class Rejected(Exception):
+    """Het verzoek wordt niet toegelaten; probeer het over `retry_after` seconden opnieuw."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}: probeer het over {retry_after:.1f}s opnieuw")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def gcra(tat, now, interval, capacity, cost):
+    """Eén stap van de token bucket als GCRA; geeft `(toegelaten, nieuwe_tat, wachttijd)`.
+
+    `tat` is het tijdstip waarop de bucket weer vol is (None voor een nieuwe
+    sleutel), `interval` de tijd per token en `capacity` het aantal tokens
+    dat tegelijk op mag.
+    """
+    tat = max(tat or now, now)
+    new_tat = tat + cost * interval
+    excess = new_tat - now - capacity * interval
+    if excess > 0:
+        return False, tat, excess
+    return True, new_tat, 0.0
+
+
+class LocalBuckets:
+    """Buckets in het geheugen van dit proces, begrensd tot `max_keys` sleutels (LRU)."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._tats = OrderedDict()
+
+    def take(self, key, now, interval, capacity, cost):
+        with self._lock:
+            allowed, tat, wait = gcra(self._tats.get(key), now, interval, capacity, cost)
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+            if len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return allowed, wait
+
+
+class SharedMemoryBuckets:
+    """Buckets in het gedeelde mmap-bestand; alle workers op deze host delen ze."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def take(self, key, now, interval, capacity, cost):
+        def step(tat):
+            allowed, new_tat, wait = gcra(tat, now, interval, capacity, cost)
+            return new_tat, (allowed, wait)
+
+        return self.cache.update(f"admission:{key}", step, timeout=math.ceil(capacity * interval) + 1)
+
+
+# KEYS[1] = sleutel; ARGV = now, interval, capacity, cost, ttl (zelfde rekensom als `gcra`)
+REDIS_GCRA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local new_tat = tat + tonumber(ARGV[4]) * interval
+local excess = new_tat - now - tonumber(ARGV[3]) * interval
+if excess > 0 then return {0, tostring(excess)} end
+redis.call('SET', KEYS[1], tostring(new_tat), 'EX', ARGV[5])
+return {1, '0'}
+"""
+
+
+class RedisBuckets:
+    """Buckets in Redis, bijgewerkt met één Lua-aanroep per verzoek."""
+
+    def __init__(self, client, prefix="travelbot:admission:"):
+        self.prefix = prefix
+        self._script = client.register_script(REDIS_GCRA)
+
+    def take(self, key, now, interval, capacity, cost):
+        allowed, wait = self._script(keys=[self.prefix + key],
+                                     args=[now, interval, capacity, cost, math.ceil(capacity * interval) + 1])
+        return bool(allowed), float(wait)
+
+
+def bucket_store(backend):
+    """Kies de opslag voor de buckets bij de backend van de gedeelde cache."""
+    if isinstance(backend, SharedMemoryCache):
+        return SharedMemoryBuckets(backend)
+    if type(backend).__name__ == "RedisCache":
+        return RedisBuckets(backend._write_client)
+    return LocalBuckets()
+
+
+class AdmissionController:
+    """Laat verzoeken toe of weigert ze meteen; thread-safe en O(1) per verzoek."""
+
+    def __init__(self, buckets, rate=2.0, burst=40, max_in_flight=64, background_share=0.5,
+                 background_reserve=0.25, enabled=True, clock=time.time):
+        self.buckets = buckets
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.enabled = enabled
+        self._clock = clock
+        self._capacity = {INTERACTIVE: burst, BACKGROUND: burst * (1 - background_reserve)}
+        self._in_flight_limit = {INTERACTIVE: max_in_flight,
+                                 BACKGROUND: max(1, int(max_in_flight * background_share))}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._lanes = dict.fromkeys(LANES, 0)
+
+    @classmethod
+    def from_env(cls, backend, prefix="ADMISSION", rate=2, burst=40, max_in_flight=64):
+        """Instellingen uit `<prefix>_RATE`, `<prefix>_BURST`, enzovoort, met deze standaardwaarden."""
+        return cls(
+            bucket_store(backend),
+            rate=float(os.getenv(f"{prefix}_RATE", str(rate))),
+            burst=float(os.getenv(f"{prefix}_BURST", str(burst))),
+            max_in_flight=int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", str(max_in_flight))),
+            background_share=float(os.getenv(f"{prefix}_BACKGROUND_SHARE", "0.5")),
+            background_reserve=float(os.getenv(f"{prefix}_BACKGROUND_RESERVE", "0.25")),
+            enabled=os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes"),
+        )
+
+    def admit(self, key, lane=INTERACTIVE, cost=1):
+        """Laat een verzoek toe of gooi `Rejected`; na toelating volgt altijd `release(lane)`."""
+        if lane not in self._capacity:
+            lane = INTERACTIVE
+        with self._lock:
+            if self.enabled and self._in_flight >= self._in_flight_limit[lane]:
+                ADMISSION_DECISIONS.inc(lane=lane, outcome="overloaded")
+                raise Rejected("overloaded", 1.0)
+            self._in_flight += 1
+            self._lanes[lane] += 1
+            ADMISSION_IN_FLIGHT.set(self._lanes[lane], lane=lane)
+        try:
+            self.charge(key, lane, cost)
+        except Rejected:
+            self.release(lane)
+            raise
+        ADMISSION_DECISIONS.inc(lane=lane, outcome="admitted")
+        return lane
+
+    def charge(self, key, lane=INTERACTIVE, cost=1):
+        """Neem `cost` tokens uit de bucket van `key`, ook voor extra werk binnen een toegelaten verzoek."""
+        if not self.enabled:
+            return
+        if lane not in self._capacity:
+            lane = INTERACTIVE
+        try:
+            allowed, wait = self.buckets.take(key, self._clock(), 1.0 / self.rate, self._capacity[lane], cost)
+        except Exception:
+            return  # gedeelde opslag onbereikbaar: liever doorlaten dan alles weigeren
+        if not allowed:
+            ADMISSION_DECISIONS.inc(lane=lane, outcome="rate_limited")
+            raise Rejected("rate_limited", wait)
+
+    def release(self, lane):
+        with self._lock:
+            self._in_flight -= 1
+            self._lanes[lane] -= 1
+            ADMISSION_IN_FLIGHT.set(self._lanes[lane], lane=lane)
+
+    def stats(self):
+        with self._lock:
+            in_flight = dict(self._lanes)
+        return {
+            "enabled": self.enabled,
+            "buckets": type(self.buckets).__name__,
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": in_flight,
+            "decisions": {
+                lane: {outcome: ADMISSION_DECISIONS.value(lane=lane, outcome=outcome)
+                       for outcome in ("admitted", "rate_limited", "overloaded")}
+                for lane in LANES
+            },
+        }
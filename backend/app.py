@@ -5,33 +5,76 @@ vraagt OpenAI om een korte opmerking over de locatie. Het resultaat wordt als
 JSON teruggestuurd naar de telefoon zodat Text-to-Speech het kan voorlezen.
 """
 
-from flask import Flask, request, jsonify, session, send_from_directory
-import requests
+from flask import Flask, request, jsonify, session, send_file, Response, stream_with_context, abort, g
 import os
-from flasgger import Swagger
 from flask_cors import CORS
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.middleware.proxy_fix import ProxyFix
 import asyncio
+import hashlib
+import math
+import atexit
+import threading
+import time
 import httpx
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import logging
 import json
+import random
 from dotenv import load_dotenv
-from flask_caching import Cache
 import secrets
-import aiofiles
-from PIL import Image
+import hmac
+import sqlite3
+from geo_cache import TTLCache, geo_cell
+from cache_backends import SharedCache, init_cache
+from async_runtime import runtime
+from llm_client import LLMClient, LLMError, LLM_FALLBACKS
+from streaming import format_event, iter_sentences
+from response_cache import ResponseCache, fingerprint, store_from_env
+from persona_registry import PersonaRegistry, slugify
+from marketplace_index import MarketplaceIndex
+from image_pipeline import ImagePipeline
+from single_flight import AsyncSingleFlight, SingleFlight
+from github_commits import CommitFeed
+from geo_proxy import GeoProxy, RateLimited, distance_m
+from instrumentation import COMMENT_STAGES, COMMENT_TIERS, GENERATIONS_AVOIDED, UPSTREAM_ERRORS, instrument_app
+from metrics import Counter, Gauge, render as render_metrics
+from prompt_templates import PERSONAS, builtin_persona, chat_system_prompt, compile_template, offline_line
+from resilience import CircuitBreaker, CircuitOpenError, Deadline
+from admission import BACKGROUND, INTERACTIVE, AdmissionController, Rejected
+from session_store import SessionStore
+from prefetch import PrefetchQueue, ahead_points
+from lazy import Lazy
+from docs import init_docs
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Voeg CORS-ondersteuning toe
-Swagger(app)  # Voeg Swagger-documentatie toe
+# Aantal reverse proxies vóór de app (Render: 1). Alleen zoveel X-Forwarded-For-adressen
+# van rechts worden vertrouwd; request.remote_addr is daarna de echte client.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+if os.getenv("ENABLE_SWAGGER", "1").lower() in ("1", "true", "yes"):
+    init_docs(app)  # Swagger-documentatie, pas opgebouwd bij het eerste bezoek aan /apidocs
+instrument_app(app)  # Duur per endpoint, lopende verzoeken en optionele profilering
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-# Ensure OPENAI_API_KEY is set
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY environment variable is missing")
+
+
+def create_llm_client():
+    """Maak de LLM-client aan; zonder OPENAI_API_KEY geeft elke completion het standaardantwoord."""
+    if not OPENAI_API_KEY:
+        raise LLMError("not_configured", "OPENAI_API_KEY ontbreekt")
+    return LLMClient.from_env(OPENAI_API_KEY)
+
+
+# Gedeelde, gepoolde client voor alle chat-completions; pas bij de eerste completion aangemaakt,
+# zodat workers die alleen persona's of afbeeldingen serveren geen sleutel nodig hebben
+llm_client = Lazy(create_llm_client)
 
 app.secret_key = os.getenv("SECRET_KEY", "default_secret_key")  # Set a secret key for session management
 
@@ -45,11 +88,179 @@ ADMIN_TOKEN = secrets.token_hex(16)
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+if not OPENAI_API_KEY:
+    logger.warning("OPENAI_API_KEY ontbreekt; opmerkingen krijgen het standaardantwoord")
 
 # Configure caching
-app.config['CACHE_TYPE'] = 'SimpleCache'  # Use SimpleCache for development
-app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # Cache timeout in seconds
-cache = Cache(app)
+# De backend (simple, shm, filesystem of redis) komt uit CACHE_BACKEND, zodat
+# meerdere workers dezelfde cache kunnen delen.
+cache = init_cache(app)
+shared_cache = SharedCache(cache)
+
+# Upstream-endpoints; overschrijfbaar voor tests en benchmarks met stubservers
+# (GitHub: zie github_commits.py)
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+WIKIPEDIA_REST_URL = os.getenv("WIKIPEDIA_REST_URL", "https://en.wikipedia.org/api/rest_v1")
+
+# Geo-getegelde caches voor Wikipedia: het dichtstbijzijnde artikel per
+# rastercel en de samenvatting per artikeltitel, elk met een eigen TTL.
+# Verlopen items blijven nog WIKI_STALE_TTL seconden bruikbaar terwijl ze
+# op de achtergrond ververst worden.
+GEO_CELL_SIZE = float(os.getenv("GEO_CELL_SIZE", "0.002"))
+WIKI_STALE_TTL = int(os.getenv("WIKI_STALE_TTL", str(7 * 86400)))
+nearest_article_cache = TTLCache(
+    maxsize=int(os.getenv("WIKI_GEO_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("WIKI_GEO_TTL", "3600")),
+    stale_ttl=WIKI_STALE_TTL,
+)
+summary_cache = TTLCache(
+    maxsize=int(os.getenv("WIKI_SUMMARY_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("WIKI_SUMMARY_TTL", "86400")),
+    stale_ttl=WIKI_STALE_TTL,
+)
+
+# Tijdsbudget per /comment-verzoek in seconden; wat er dan nog niet is, komt
+# uit een lagere laag (verlopen cache, lokale persona-regel).
+COMMENT_LATENCY_BUDGET = float(os.getenv("COMMENT_LATENCY_BUDGET", "8"))
+
+
+def wikipedia_failure(exc):
+    """Netwerkfouten, 429 en 5xx tellen als storing van Wikipedia; een 404 niet."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.RequestError)
+
+
+def openai_failure(exc):
+    """Fouten van OpenAI zelf; een volle wachtrij of ontbrekende sleutel niet."""
+    reason = getattr(exc, "reason", "")
+    if reason in ("overloaded", "not_configured") or (reason.startswith("http_4") and reason != "http_429"):
+        return False
+    return True
+
+
+# Per upstream een circuit breaker: na herhaalde storingen wordt de upstream
+# een tijd overgeslagen in plaats van dat elk verzoek op de timeout wacht.
+wikipedia_breaker = CircuitBreaker.from_env("wikipedia", is_failure=wikipedia_failure)
+openai_breaker = CircuitBreaker.from_env("openai", is_failure=openai_failure)
+
+# Gelijktijdige identieke upstream-aanroepen worden samengevoegd: per rastercel,
+# artikeltitel of prompt is er hoogstens één verzoek onderweg.
+geosearch_flights = AsyncSingleFlight("wikipedia_geosearch")
+summary_flights = AsyncSingleFlight("wikipedia_summary")
+completion_flights = SingleFlight("openai_completion")
+async_completion_flights = AsyncSingleFlight("openai_completion_async")
+
+# Optionele lokale POI-index (zie poi_index.py); binnen het gedekte gebied
+# vervangt die de live geosearch.
+GEOSEARCH_RADIUS = 10000
+poi_index = None
+if os.getenv("POI_INDEX_PATH"):
+    from poi_index import POIIndex
+    poi_index = POIIndex(os.getenv("POI_INDEX_PATH"))
+    logger.info(f"POI-index geladen met {len(poi_index)} items uit {poi_index.path}")
+
+# Persona's worden één keer ingelezen en bij wijzigingen opnieuw geladen
+persona_registry = PersonaRegistry(
+    {
+        "personas": os.path.join(os.path.dirname(__file__), 'personas'),
+        "marketplace": os.path.join(os.path.dirname(__file__), 'marketplace'),
+    },
+    check_interval=float(os.getenv("PERSONA_RELOAD_INTERVAL", "2")),
+)
+# Doorzoekbare catalogus voor /marketplace, bijgewerkt per gewijzigd bestand;
+# pas bij het eerste verzoek geopend en gesynchroniseerd
+marketplace_index = Lazy(lambda: MarketplaceIndex.from_env(persona_registry.directories))
+
+# Cache voor gegenereerde opmerkingen: een pool van varianten per
+# (artikel, stijl, taal, vraag)
+response_cache = ResponseCache(
+    store_from_env(),
+    variants=int(os.getenv("RESPONSE_CACHE_VARIANTS", "3")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+    stale_ttl=int(os.getenv("RESPONSE_CACHE_STALE_TTL", str(7 * 86400))),
+)
+# Verlopen pools worden in deze threads op de achtergrond ververst
+refresh_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("REFRESH_CONCURRENCY", "2")), thread_name_prefix="travelbot-refresh"
+)
+background_tasks = set()
+
+# Limieten voor /comments/batch: Wikipedia-opvragingen lopen gelijktijdig op de
+# gedeelde loop, completions in een begrensde threadpool.
+BATCH_MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", "50"))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_LLM_CONCURRENCY", "4")), thread_name_prefix="travelbot-batch"
+)
+
+# Commits voor /commits: een snapshot in het geheugen, op de achtergrond ververst
+# met conditionele verzoeken; pas bij het eerste verzoek opgehaald.
+commit_feed = CommitFeed.from_env()
+atexit.register(commit_feed.stop)
+
+# Proxy voor Nominatim en Overpass: per geo-cel gecachet in de gedeelde cache,
+# samengevoegd en begrensd tot het tempo dat de publieke diensten toestaan.
+geo_proxy = GeoProxy.from_env(shared_cache)
+atexit.register(geo_proxy.close)
+
+# Context per webapp-sessie (recente plekken en chatbeurten), begrensd in aantal en tijd
+session_store = SessionStore.from_env()
+
+# Vooruit ophalen langs de route: een begrensde wachtrij, dichtstbijzijnde plek eerst
+PREFETCH_HORIZON = int(os.getenv("PREFETCH_HORIZON", "300"))
+PREFETCH_STEP = int(os.getenv("PREFETCH_STEP", "60"))
+PREFETCH_MAX_ROUTE_POINTS = 500
+
+
+def prefetch_place(lat, lon, style, language):
+    """Vul de caches voor een plek langs de route: samenvatting en één opmerking.
+
+    Vooruit ophalen is speculatief, dus hooguit één completion per plek en
+    geen als er al een variant (vers of verlopen) in de cache staat. De
+    volgende opmerking daar komt uit die variant; de rest van de pool wordt
+    dan pas op de achtergrond aangevuld.
+    """
+    title, summary = runtime.run(lookup_place(lat, lon))
+    if not title:
+        return
+    cache_key = fingerprint(title, style, language)
+    if response_cache.peek(cache_key):
+        return
+    prompt = build_prompt(summary, None, style, language)
+    if completion_flights.busy(prompt):
+        return  # een live verzoek maakt deze opmerking al
+    with openai_breaker.guard():
+        text = llm_client.chat(build_messages(prompt), temperature=0.8)
+    response_cache.add(cache_key, text)
+
+
+prefetch_queue = PrefetchQueue.from_env(prefetch_place)
+atexit.register(prefetch_queue.stop)
+
+# Afbeeldingsvarianten worden in een procespool gemaakt, niet in de request.
+# Bij het opstarten van de server (of het eerste verzoek) worden ze
+# (optioneel) alvast op de achtergrond aangemaakt; niet bij het importeren.
+image_pipeline = ImagePipeline.from_env(app.root_path)
+atexit.register(image_pipeline.shutdown)
+
+
+def start_image_prewarm():
+    """Start het voorverwarmen in een achtergrondthread; False als het uit staat of er geen bronnen zijn."""
+    if os.getenv("IMAGE_PREWARM", "1").lower() not in ("1", "true", "yes") \
+            or not os.path.isdir(image_pipeline.source_dir):
+        return False
+    thread = threading.Thread(target=image_pipeline.warm_once, name="travelbot-image-warm", daemon=True)
+    thread.start()
+    return thread
+
+
+image_prewarm = Lazy(start_image_prewarm)
+
+
+@app.before_request
+def prewarm_images_once():
+    image_prewarm.resolve()  # één keer per proces; onder ASGI al gedaan in de lifespan
 
 
 def admin_required(f):
@@ -71,19 +282,124 @@ def login_required(f):
     return decorated_function
 
 
+# Endpoints zonder X-API-KEY: /metrics controleert zelf (token of API-sleutel),
+# de geo-proxy kost niets (gecachet en zelf gedoseerd richting Nominatim en
+# Overpass) en /api/session geeft de webapp een sessietoken.
+PUBLIC_ENDPOINTS = {'metrics', 'geocode_reverse', 'geocode_search', 'nearby_pois', 'webapp_session'}
+# De webapp draait in de browser en kan geen API-sleutel geheimhouden. Deze
+# endpoints kosten completions en vragen daarom een API-sleutel of een
+# sessietoken van /api/session; met een token gelden de strengere limieten
+# van `webapp_admission`, per ondertekende sessie. Nieuwe sessies ophalen
+# kost tokens per IP-adres.
+SESSION_ENDPOINTS = {'location_comment', 'persona_chat', 'prefetch'}
+
+
+# Toelatingscontrole: token bucket per sleutel (gedeeld tussen workers bij
+# CACHE_BACKEND=shm of redis), een limiet op lopende verzoeken per worker en
+# een achtergrondbaan die voorrang geeft aan interactief werk.
+admission = AdmissionController.from_env(cache.cache)
+webapp_admission = AdmissionController.from_env(cache.cache, prefix="ADMISSION_WEBAPP", rate=0.5, burst=24,
+                                                max_in_flight=16)
+# Tokens per verzoek; endpoints die een completion kunnen kosten wegen zwaarder
+ADMISSION_COSTS = {'comment': 4, 'comment_stream': 4, 'comments_batch': 8, 'location_comment': 4,
+                   'persona_chat': 4, 'prefetch': 1, 'webapp_session': 4}
+# /api/prefetch betaalt daarnaast per plek die het in de wachtrij zet
+PREFETCH_POINT_COST = 2
+BACKGROUND_ENDPOINTS = {'prefetch'}
+ADMISSION_EXEMPT = {'metrics', 'static'}
+
+# Sessietokens zijn ondertekend met SECRET_KEY, zodat elke worker ze kan controleren
+session_tokens = URLSafeTimedSerializer(app.secret_key, salt="travelbot-webapp-session")
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", "86400"))
+if app.secret_key == "default_secret_key":
+    logger.warning("SECRET_KEY is niet gezet; sessietokens van /api/session zijn zo te vervalsen")
+
+
+def admission_key(api_key, remote_addr):
+    """Bucket van een client: een hash van de API-sleutel, anders het IP-adres."""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"ip:{remote_addr}"
+
+
+def forwarded_client(peer, forwarded_for):
+    """Client-IP volgens dezelfde regel als ProxyFix, voor routes buiten Flask (zie asgi.py)."""
+    if TRUSTED_PROXIES and forwarded_for:
+        hops = forwarded_for.split(",")
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES].strip()
+    return peer
+
+
+def request_lane(endpoint, priority):
+    """Achtergrondwerk (vooruit ophalen, of `X-Priority: background`) krijgt de lage baan."""
+    if endpoint in BACKGROUND_ENDPOINTS or (priority or "").lower() == BACKGROUND:
+        return BACKGROUND
+    return INTERACTIVE
+
+
+def too_many_requests(rejection):
+    """429 met Retry-After in hele seconden."""
+    response = jsonify(error="Te veel verzoeken; probeer het later opnieuw.", reason=rejection.reason)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(rejection.retry_after)))
+    return response
+
+
+def session_from_token(token):
+    """Sessie-id uit een geldig, niet verlopen sessietoken; anders None."""
+    if not token:
+        return None
+    try:
+        session_id = session_tokens.loads(token, max_age=SESSION_TOKEN_TTL)
+    except BadSignature:
+        return None
+    return session_id if isinstance(session_id, str) else None
+
+
 @app.before_request
 def validate_api_key():
+    if request.endpoint in ADMISSION_EXEMPT:
+        return None
     user_api_key = request.headers.get('X-API-KEY')
-    logger.info(f"Received API key: {user_api_key}")  # Log the received API key
-    if not user_api_key:
+    controller = admission
+    if not user_api_key and request.endpoint in SESSION_ENDPOINTS:
+        g.session_id = session_from_token(request.headers.get('X-Session-Token'))
+        if g.session_id is None:
+            return jsonify({"error": "API key or session token is required"}), 401
+        controller = webapp_admission
+    elif not user_api_key and request.endpoint not in PUBLIC_ENDPOINTS:
         logger.warning("API key is missing")  # Log a warning if the API key is missing
         return jsonify({"error": "API key is required"}), 401
+    elif request.endpoint == 'webapp_session':
+        controller = webapp_admission
 
     # Optionally, validate the format or length of the API key here
     # Example: if len(user_api_key) != 32:
     #             logger.error("Invalid API key format")
     #             return jsonify({"error": "Invalid API key format"}), 401
 
+    client = admission_key(user_api_key, request.remote_addr)
+    if g.get('session_id') is not None:
+        # Eén bucket per sessie: achter één NAT of proxy delen reizigers zo geen limiet
+        client = "session:" + hashlib.sha256(g.session_id.encode("utf-8")).hexdigest()[:16]
+    elif controller is webapp_admission:
+        client = "webapp:" + client  # eigen buckets naast die van de gewone limiet per IP
+    try:
+        lane = controller.admit(client, request_lane(request.endpoint, request.headers.get('X-Priority')),
+                                ADMISSION_COSTS.get(request.endpoint, 1))
+    except Rejected as e:
+        return too_many_requests(e)
+    g.admission = (controller, lane, client)
+
+
+@app.teardown_request
+def release_admission(exc):
+    admitted = g.pop('admission', None)
+    if admitted is not None:
+        controller, lane, _ = admitted
+        controller.release(lane)
+
 
 @app.route('/comment', methods=['POST'])
 def comment():
@@ -110,6 +426,11 @@ def comment():
         type: string
         required: false
         description: Stijl van de opmerking (bijv. 'Jordanees').
+      - name: language
+        in: body
+        type: string
+        required: false
+        description: Taal van de opmerking ('nl' of 'en').
     responses:
       200:
         description: Een opmerking over de locatie.
@@ -125,114 +446,522 @@ def comment():
     lon = data.get('lon')
     question = data.get('question')
     style = data.get('style', 'Jordanees')
+    language = data.get('language', 'nl')
 
     if not lat or not lon:
         return jsonify(error="Latitude en longitude zijn verplicht."), 400
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    place_summary = loop.run_until_complete(get_wikipedia_summary(lat, lon))
-    prompt = build_prompt(place_summary, question, style)
-    response_text = query_openai(prompt)
+    deadline = Deadline(COMMENT_LATENCY_BUDGET)
+    with COMMENT_STAGES.time(stage="total"):
+        title, place_summary = runtime.run(lookup_place(lat, lon, deadline))
+        response_text = generate_comment(title, place_summary, question, style, language, deadline)
 
     return jsonify(text=response_text)
 
 
-async def get_wikipedia_summary(lat, lon):
+@app.route('/comment/stream', methods=['POST'])
+def comment_stream():
+    """Streamende variant van /comment: het antwoord komt per zin binnen.
+    ---
+    parameters:
+      - name: lat
+        in: body
+        type: number
+        required: true
+        description: Latitude van de locatie.
+      - name: lon
+        in: body
+        type: number
+        required: true
+        description: Longitude van de locatie.
+      - name: question
+        in: body
+        type: string
+        required: false
+        description: Optionele vraag om mee te sturen.
+      - name: style
+        in: body
+        type: string
+        required: false
+        description: Stijl van de opmerking (bijv. 'Jordanees').
+      - name: language
+        in: body
+        type: string
+        required: false
+        description: Taal van de opmerking ('nl' of 'en').
+    produces:
+      - text/event-stream
+      - application/x-ndjson
+    responses:
+      200:
+        description: >
+          Server-sent events: een `sentence`-event per zin en een afsluitend
+          `done`-event met de volledige tekst. Met `Accept: application/x-ndjson`
+          komt elk event als JSON-regel.
+    """
+    data = request.get_json()
+    lat = data.get('lat')
+    lon = data.get('lon')
+    question = data.get('question')
+    style = data.get('style', 'Jordanees')
+    language = data.get('language', 'nl')
+
+    if not lat or not lon:
+        return jsonify(error="Latitude en longitude zijn verplicht."), 400
+
+    title, place_summary = runtime.run(lookup_place(lat, lon, Deadline(COMMENT_LATENCY_BUDGET)))
+    ndjson = 'application/x-ndjson' in request.headers.get('Accept', '')
+    cache_key = fingerprint(title, style, language, question) if title else None
+    cached = response_cache.pick(cache_key) if cache_key else None
+    if cached is not None:
+        events = stream_cached(cached, ndjson)
+    else:
+        prompt = build_prompt(place_summary, question, style, language)
+        events = stream_openai(prompt, ndjson, cache_key, (title, place_summary, style, language))
+
+    return Response(
+        stream_with_context(events),
+        mimetype='application/x-ndjson' if ndjson else 'text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/comments/batch', methods=['POST'])
+def comments_batch():
+    """Endpoint dat in één keer opmerkingen geeft voor een hele route.
+    ---
+    parameters:
+      - name: points
+        in: body
+        type: array
+        required: true
+        description: Geordende lijst van {lat, lon}-punten (geplande route of GPS-spoor).
+      - name: question
+        in: body
+        type: string
+        required: false
+        description: Optionele vraag om mee te sturen.
+      - name: style
+        in: body
+        type: string
+        required: false
+        description: Stijl van de opmerking (bijv. 'Jordanees').
+      - name: language
+        in: body
+        type: string
+        required: false
+        description: Taal van de opmerking ('nl' of 'en').
+    responses:
+      200:
+        description: >
+          Eén opmerking per unieke plek, in de volgorde van de route. Punten
+          in dezelfde geo-cel of bij hetzelfde artikel worden samengevoegd;
+          `index` verwijst naar het eerste punt van die plek. Plekken zonder
+          artikel met dezelfde samenvatting delen één opmerking.
+        schema:
+          type: object
+          properties:
+            comments:
+              type: array
+              items:
+                type: object
+                properties:
+                  index:
+                    type: integer
+                  title:
+                    type: string
+                  text:
+                    type: string
+      400:
+        description: Ongeldige of te lange lijst met punten.
+    """
+    data = request.get_json() or {}
+    points = data.get('points')
+    question = data.get('question')
+    style = data.get('style', 'Jordanees')
+    language = data.get('language', 'nl')
+
+    if not isinstance(points, list) or not points:
+        return jsonify(error="Een lijst met punten is verplicht."), 400
+    if len(points) > BATCH_MAX_POINTS:
+        return jsonify(error=f"Maximaal {BATCH_MAX_POINTS} punten per verzoek."), 400
+    try:
+        coords = [(float(point['lat']), float(point['lon'])) for point in points]
+    except (TypeError, KeyError, ValueError):
+        return jsonify(error="Elk punt heeft een numerieke lat en lon nodig."), 400
+
+    # Punten die vlak bij elkaar liggen vallen in dezelfde cel
+    first_in_cell = {}
+    for index, (lat, lon) in enumerate(coords):
+        first_in_cell.setdefault(geo_cell(lat, lon, GEO_CELL_SIZE), index)
+    indices = list(first_in_cell.values())
+    lookups = runtime.run(lookup_places([coords[i] for i in indices], BATCH_FETCH_CONCURRENCY))
+
+    # Verschillende cellen kunnen bij hetzelfde artikel uitkomen
+    places, seen_titles, untitled = [], set(), {}
+    for index, (title, summary) in zip(indices, lookups):
+        if title:
+            if title in seen_titles:
+                continue
+            seen_titles.add(title)
+            future = batch_executor.submit(generate_comment, title, summary, question, style, language)
+        else:
+            # Zonder artikel is er geen cache; zulke plekken delen per samenvatting één completion
+            future = untitled.get(summary)
+            if future is None:
+                future = untitled[summary] = batch_executor.submit(
+                    generate_comment, None, summary, question, style, language)
+        places.append((index, title, future))
+
+    comments = [
+        {"index": index, "lat": coords[index][0], "lon": coords[index][1],
+         "title": title, "text": future.result()}
+        for index, title, future in places
+    ]
+    return jsonify(comments=comments)
+
+
+async def lookup_places(coords, concurrency):
+    """Zoek meerdere plekken gelijktijdig op, met hooguit `concurrency` tegelijk."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(lat, lon):
+        async with semaphore:
+            return await lookup_place(lat, lon)
+
+    return await asyncio.gather(*(bounded(lat, lon) for lat, lon in coords))
+
+
+async def get_wikipedia_summary(lat, lon, deadline=None):
     """Geef een korte samenvatting van de plek op basis van Wikipedia."""
+    title, summary = await lookup_place(lat, lon, deadline)
+    return summary
+
+
+def spawn(coro):
+    """Start een achtergrondtaak op de huidige loop en houd er een verwijzing naar vast."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def cached_upstream(cache, flights, key, fetch, deadline=None):
+    """Haal `key` uit `cache` of van Wikipedia, in lagen.
+
+    Een vers item komt direct uit de cache. Een verlopen item wordt ook
+    meteen teruggegeven, terwijl een achtergrondtaak het ververst. Anders
+    wordt er binnen het budget van `deadline` opgehaald; de circuit breaker
+    slaat een gestoorde upstream meteen over (`CircuitOpenError`) en een
+    verlopen budget geeft `TimeoutError`. Het ophalen zelf loopt dan door
+    en vult de cache voor het volgende verzoek.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    async def refresh():
+        with wikipedia_breaker.guard():
+            value = await fetch()
+        cache.set(key, value)
+        return value
+
+    stale = cache.get_stale(key)
+    if stale is not None:
+        async def revalidate():
+            try:
+                await flights.do(key, refresh)
+            except Exception as e:
+                app.logger.info(f"Verversen van {flights.name} mislukt: {e!r}")
+
+        if not flights.busy(key):
+            spawn(revalidate())
+        return stale
+
+    timeout = deadline.remaining() if deadline is not None else None
+    return await asyncio.wait_for(flights.do(key, refresh), timeout)
+
+
+async def lookup_place(lat, lon, deadline=None):
+    """Zoek het dichtstbijzijnde artikel op en geef `(titel, samenvatting)` terug.
+
+    Binnen het gebied van de lokale POI-index wordt die gebruikt; anders de
+    live geosearch. De titel is None als er geen artikel is of het ophalen
+    mislukte; de samenvatting is dan een korte melding die in de prompt kan.
+    """
     try:
-        geo_url = f"https://en.wikipedia.org/w/api.php?action=query&list=geosearch&gscoord={lat}%7C{lon}&gsradius=10000&gslimit=1&format=json"
-        async with httpx.AsyncClient() as client:
-            geo_resp = await client.get(geo_url)
-            geo_resp.raise_for_status()  # Controleer op HTTP-fouten
-            geo_data = geo_resp.json()
-            pages = geo_data.get("query", {}).get("geosearch", [])
-            if not pages:
-                return "Er is hier niet veel bijzonders."
-
-            title = pages[0]["title"]
-            summary_url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{title}"
-            summary_resp = await client.get(summary_url)
-            summary_resp.raise_for_status()  # Controleer op HTTP-fouten
-            summary_data = summary_resp.json()
-            return summary_data.get("extract", f"Iets over {title}.")
+        with COMMENT_STAGES.time(stage="geosearch"):
+            title = None
+            if poi_index is not None and poi_index.covers(float(lat), float(lon)):
+                title, summary = poi_index.lookup(float(lat), float(lon), GEOSEARCH_RADIUS) or ("", "")
+                if summary:
+                    return title, summary
+            if title is None:
+                title = await cached_upstream(nearest_article_cache, geosearch_flights,
+                                              geo_cell(lat, lon, GEO_CELL_SIZE),
+                                              lambda: fetch_nearest_title(lat, lon), deadline)
+        if not title:
+            return None, "Er is hier niet veel bijzonders."
+
+        with COMMENT_STAGES.time(stage="summary"):
+            summary = await cached_upstream(summary_cache, summary_flights, title,
+                                            lambda: fetch_summary(title), deadline)
+        return title, summary
+    except CircuitOpenError:
+        UPSTREAM_ERRORS.inc(upstream="wikipedia", reason="circuit_open")
+        return None, "Kon geen informatie ophalen; Wikipedia is even niet bereikbaar."
+    except asyncio.TimeoutError:
+        UPSTREAM_ERRORS.inc(upstream="wikipedia", reason="deadline")
+        app.logger.warning("Wikipedia gaf niet binnen het tijdsbudget antwoord")
+        return None, "Kon geen informatie ophalen; Wikipedia reageert te traag."
     except httpx.RequestError as e:
+        UPSTREAM_ERRORS.inc(upstream="wikipedia", reason="network")
         app.logger.error(f"HTTP-fout bij het ophalen van Wikipedia-gegevens: {e}")
-        return "Kon geen informatie ophalen vanwege een netwerkfout."
+        return None, "Kon geen informatie ophalen vanwege een netwerkfout."
     except Exception as e:
+        reason = f"http_{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else "unexpected"
+        UPSTREAM_ERRORS.inc(upstream="wikipedia", reason=reason)
         app.logger.error(f"Onverwachte fout: {e}")
-        return "Er is een onverwachte fout opgetreden bij het ophalen van informatie."
+        return None, "Er is een onverwachte fout opgetreden bij het ophalen van informatie."
+
+
+async def fetch_nearest_title(lat, lon):
+    """Vraag de titel van het dichtstbijzijnde artikel op, of '' als er geen is."""
+    geo_url = f"{WIKIPEDIA_API_URL}?action=query&list=geosearch&gscoord={lat}%7C{lon}&gsradius={GEOSEARCH_RADIUS}&gslimit=1&format=json"
+    geo_resp = await runtime.client.get(geo_url)
+    geo_resp.raise_for_status()  # Controleer op HTTP-fouten
+    pages = geo_resp.json().get("query", {}).get("geosearch", [])
+    return pages[0]["title"] if pages else ""
+
+
+async def fetch_summary(title):
+    """Haal de samenvatting van een Wikipedia-artikel op."""
+    summary_url = f"{WIKIPEDIA_REST_URL}/page/summary/{title}"
+    summary_resp = await runtime.client.get(summary_url)
+    summary_resp.raise_for_status()  # Controleer op HTTP-fouten
+    summary_data = summary_resp.json()
+    return summary_data.get("extract", f"Iets over {title}.")
 
 
 def build_prompt(summary, question=None, style='Jordanees', language='nl'):
-    """Stel een prompt samen voor het taalmodel."""
-    if style == 'Belg':
-        persona = 'Je bent Heino, een vrolijke Belg uit Antwerpen met een zachte G.'
-    elif style == 'Brabander':
-        persona = 'Je bent Heino, een gemoedelijke Brabander die met een zachte G praat.'
-    else:
-        persona = '''
-        Je bent Heino, een Amsterdammer van 58 uit de Jordaan met een grote bek en een droog gevoel voor humor. 
-        Je hebt een pleurishekel aan Italië, maar weet er alles over. Je refereert vaak aan je mysterieuze verleden daar, 
-        waarbij je hint naar maffiose praktijken zonder het expliciet te maken. Je praat met een Jordanees accent en gebruikt 
-        typische Amsterdamse uitdrukkingen zoals "pleuris", "gozer", en "hou je bek". 
+    """Stel een prompt samen voor het taalmodel.
 
-        Je houdt ervan om mensen te verrassen met je kennis over obscure Italiaanse gerechten en steden, maar je maakt er 
-        altijd een sarcastische opmerking bij. Bijvoorbeeld: "Wist je dat ze in Napels pizza's maken die zo dun zijn dat je 
-        ze door de brievenbus kan gooien? Maar ja, wat verwacht je van een land dat espresso in shotglaasjes serveert?"
+    Naast de ingebouwde stijlen kan `style` de naam van een persona uit
+    `personas/` zijn; dan wordt diens voorgecompileerde prompttekst gebruikt.
+    """
+    return prompt_template(style, language).render(summary, question)
 
-        Je bent ook een beetje mysterieus over je verleden. Als iemand vraagt wat je in Italië deed, zeg je dingen als: 
-        "Ach, laten we zeggen dat ik daar een paar zaken heb afgehandeld. Niks illegaals hoor... meestal." Je hint naar 
-        connecties met de maffia, maar je geeft nooit details.
 
-        Je hebt een zwak voor oude Italiaanse films en noemt vaak obscure referenties, zoals: "Dit doet me denken aan die 
-        scène in 'La Dolce Vita', maar dan zonder de glamour." Je bent een wandelende encyclopedie over Italië, maar je 
-        laat nooit je afkeer voor het land los.
+def prompt_template(style, language='nl'):
+    """Geef het gecompileerde template voor een stijl en taal."""
+    return compile_template(persona_text(style, language), language)
 
-        Je zucht vaak tijdens gesprekken, vooral als het over Italië gaat. Je vindt de Italiaanse keuken niet te vreten 
-        en maakt daar constant grappen over. Bijvoorbeeld: "Pasta? Dat is toch gewoon deeg met water? Geef mij maar een 
-        broodje bal, dat vult tenminste."
-        '''
 
-    base = f"""{persona}
-Je praat graag over cultuur en hebt altijd een grappige opmerking.
+def persona_text(style, language='nl'):
+    """Prompttekst van een ingebouwde persona of een persona uit `personas/`."""
+    registered = None if style in PERSONAS else persona_registry.get(style)
+    return registered.prompt if registered is not None else builtin_persona(style, language)
 
-Samenvatting van de plek:
-{summary}
 
-"""
-    if question:
-        base += f"Iemand vraagt je: '{question}'. Wat zeg je?"
-    else:
-        base += "Geef één humoristische zin over deze plek."
+FALLBACK_REPLY = "Ik weet effe niks zinnigs te zeggen, maat."
 
-    if language == 'en':
-        base = base.replace('Je', 'You').replace('praat', 'talk').replace('grappige opmerking', 'funny remark')
 
-    return base
+def build_messages(prompt):
+    """Zet een prompt om in chat-berichten voor het taalmodel."""
+    return [
+        {"role": "system", "content": "Je bent Heino, een Amsterdammer uit de Jordaan."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def log_llm_failure(error):
+    """Log en tel een completion die geen antwoord gaf."""
+    logger.warning(f"OpenAI gaf geen antwoord ({error.reason}): {error}")
+    UPSTREAM_ERRORS.inc(upstream="openai", reason=error.reason)
+    LLM_FALLBACKS.inc(reason=error.reason)
+
+
+def fallback_reply(error):
+    """Log een mislukte completion en geef het standaardantwoord terug."""
+    log_llm_failure(error)
+    return FALLBACK_REPLY
+
+
+def degraded_reply(error, title, summary, variant, style, language):
+    """Antwoord als er geen nieuwe completion komt: een variant uit de cache,
+    anders een lokale persona-regel over het artikel, anders het standaardantwoord."""
+    log_llm_failure(error)
+    if variant is not None:
+        COMMENT_TIERS.inc(tier="stale")
+        return variant
+    if title:
+        COMMENT_TIERS.inc(tier="template")
+        return offline_line(title, summary, style, language)
+    COMMENT_TIERS.inc(tier="error")
+    return FALLBACK_REPLY
 
 
 def query_openai(prompt):
     """Stuur de prompt naar OpenAI en geef het antwoord terug."""
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "system", "content": "Je bent Heino, een Amsterdammer uit de Jordaan."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8
-        }
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        with openai_breaker.guard():
+            return completion_flights.do(prompt, lambda: llm_client.chat(build_messages(prompt), temperature=0.8))
+    except (LLMError, CircuitOpenError) as e:
+        return fallback_reply(e)
+
+
+def generate_comment(title, summary, question=None, style='Jordanees', language='nl', deadline=None):
+    """Geef een opmerking over de plek, in lagen.
+
+    Eerst een volle, verse pool uit de responscache; dan een verlopen of nog
+    niet volle pool, die op de achtergrond wordt aangevuld; dan een nieuwe completion binnen
+    het budget van `deadline`. Komt die er niet (fout, open circuit breaker
+    of budget op), dan volgt `degraded_reply`. Alleen echte antwoorden over
+    een bekend artikel worden bewaard.
+    """
+    cache_key = fingerprint(title, style, language, question) if title else None
+    status, cached = response_cache.lookup(cache_key) if cache_key else (None, None)
+    if status == "fresh":
+        COMMENT_TIERS.inc(tier="fresh")
+        return cached
+
+    with COMMENT_STAGES.time(stage="prompt"):
+        prompt = build_prompt(summary, question, style, language)
+
+    def complete(budget=None):
+        with openai_breaker.guard():
+            text = llm_client.chat(build_messages(prompt), temperature=0.8, budget=budget)
+        if cache_key:
+            response_cache.add(cache_key, text)
+        return text
+
+    if status in ("stale", "partial"):
+        if not completion_flights.busy(prompt):
+            refresh_executor.submit(refresh_quietly, completion_flights, prompt, complete)
+        COMMENT_TIERS.inc(tier=status)
+        return cached
+
+    # Gelijktijdige aanvragers met dezelfde prompt delen één completion
+    budget = deadline.remaining() if deadline is not None else None
+    try:
+        with COMMENT_STAGES.time(stage="openai"):
+            text = completion_flights.do(prompt, lambda: complete(budget), timeout=budget)
+    except (LLMError, CircuitOpenError) as e:
+        return degraded_reply(e, title, summary, cached, style, language)
+    except TimeoutError:
+        return degraded_reply(LLMError("deadline", "tijdsbudget op"), title, summary, cached, style, language)
+    COMMENT_TIERS.inc(tier="live")
+    return text
+
+
+def refresh_quietly(flights, key, fn):
+    """Ververs op de achtergrond; een mislukking is hier alleen een logregel."""
+    try:
+        flights.do(key, fn)
     except Exception as e:
-        return "Ik weet effe niks zinnigs te zeggen, maat."
+        logger.info(f"Verversen van {flights.name} mislukt: {e!r}")
+
+
+async def generate_comment_async(title, summary, question=None, style='Jordanees', language='nl',
+                                 deadline=None):
+    """Asynchrone tegenhanger van `generate_comment` voor de ASGI-modus (zie asgi.py).
+
+    De completion loopt over de gedeelde `httpx`-client; de responscache,
+    die een blokkerende backend kan hebben, wordt in een thread aangesproken.
+    Is het budget op, dan loopt de completion door en vult ze de cache.
+    """
+    cache_key = fingerprint(title, style, language, question) if title else None
+    status, cached = await asyncio.to_thread(response_cache.lookup, cache_key) if cache_key else (None, None)
+    if status == "fresh":
+        COMMENT_TIERS.inc(tier="fresh")
+        return cached
+
+    with COMMENT_STAGES.time(stage="prompt"):
+        prompt = build_prompt(summary, question, style, language)
+
+    async def complete():
+        with openai_breaker.guard():
+            text = await llm_client.achat(runtime.client, build_messages(prompt), temperature=0.8)
+        if cache_key:
+            await asyncio.to_thread(response_cache.add, cache_key, text)
+        return text
+
+    if status in ("stale", "partial"):
+        async def revalidate():
+            try:
+                await async_completion_flights.do(prompt, complete)
+            except Exception as e:
+                logger.info(f"Verversen van {async_completion_flights.name} mislukt: {e!r}")
+
+        if not async_completion_flights.busy(prompt):
+            spawn(revalidate())
+        COMMENT_TIERS.inc(tier=status)
+        return cached
+
+    timeout = deadline.remaining() if deadline is not None else None
+    try:
+        with COMMENT_STAGES.time(stage="openai"):
+            text = await asyncio.wait_for(async_completion_flights.do(prompt, complete), timeout)
+    except (LLMError, CircuitOpenError) as e:
+        return degraded_reply(e, title, summary, cached, style, language)
+    except asyncio.TimeoutError:
+        return degraded_reply(LLMError("deadline", "tijdsbudget op"), title, summary, cached, style, language)
+    COMMENT_TIERS.inc(tier="live")
+    return text
+
+
+async def comment_async(data):
+    """Verwerk een /comment-verzoek volledig asynchroon; geeft `(status, body)` terug."""
+    if not isinstance(data, dict):
+        return 400, {"error": "Ongeldige JSON."}
+    lat = data.get('lat')
+    lon = data.get('lon')
+    if not lat or not lon:
+        return 400, {"error": "Latitude en longitude zijn verplicht."}
+
+    deadline = Deadline(COMMENT_LATENCY_BUDGET)
+    with COMMENT_STAGES.time(stage="total"):
+        title, place_summary = await lookup_place(lat, lon, deadline)
+        text = await generate_comment_async(title, place_summary, data.get('question'),
+                                            data.get('style', 'Jordanees'), data.get('language', 'nl'),
+                                            deadline)
+    return 200, {"text": text}
+
+
+def stream_openai(prompt, ndjson=False, cache_key=None, place=None):
+    """Stream het antwoord van OpenAI per zin als events.
+
+    Elke zin wordt als `sentence`-event verstuurd zodra hij compleet is;
+    tot slot volgt een `done`-event met de volledige tekst. Met een
+    `cache_key` wordt een volledig ontvangen antwoord in de responscache gezet.
+    Komt er niets binnen, dan volgt `degraded_reply` voor `place`
+    (titel, samenvatting, stijl, taal).
+    """
+    sentences = []
+    try:
+        with openai_breaker.guard():
+            for sentence in iter_sentences(llm_client.stream_chat(build_messages(prompt), temperature=0.8)):
+                sentences.append(sentence)
+                yield format_event("sentence", {"text": sentence}, ndjson)
+    except (LLMError, CircuitOpenError) as e:
+        if not sentences:
+            title, summary, style, language = place or (None, None, None, None)
+            variant = response_cache.lookup(cache_key)[1] if cache_key else None
+            sentences.append(degraded_reply(e, title, summary, variant, style, language))
+            yield format_event("sentence", {"text": sentences[0]}, ndjson)
+        else:
+            log_llm_failure(e)
+    else:
+        if cache_key:
+            response_cache.add(cache_key, " ".join(sentences))
+    yield format_event("done", {"text": " ".join(sentences)}, ndjson)
+
+
+def stream_cached(text, ndjson=False):
+    """Stuur een antwoord uit de cache in hetzelfde eventformaat als `stream_openai`."""
+    for sentence in iter_sentences([text]):
+        yield format_event("sentence", {"text": sentence}, ndjson)
+    yield format_event("done", {"text": text}, ndjson)
 
 
 @app.route('/login', methods=['POST'])
@@ -304,29 +1033,99 @@ def admin_access():
         return jsonify({"error": "Unauthorized"}), 403
 
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Endpoint met hit/miss-tellers van de caches en de stand van de circuit breakers."""
+    return jsonify({
+        **cache_counters(),
+        "poi_index": {"items": len(poi_index)} if poi_index is not None else None,
+        "coalescing": {
+            flights.name: flights.stats()
+            for flights in (geosearch_flights, summary_flights, completion_flights, async_completion_flights)
+        },
+        "commits": commit_feed.stats(),
+        "admission": admission.stats(),
+        "sessions": session_store.stats(),
+        "generations_avoided": {
+            reason: sum(GENERATIONS_AVOIDED.value(reason=reason, reply=reply) for reply in ("variant", "nothing_new"))
+            for reason in ("stationary", "same_place")
+        },
+        "prefetch": prefetch_queue.stats(),
+        "marketplace": marketplace_index.stats() if marketplace_index.loaded else None,
+        "circuits": {breaker.name: breaker.stats() for breaker in (wikipedia_breaker, openai_breaker)},
+    })
+
+
+def cache_counters():
+    """Tellers van alle caches, op naam."""
+    return {
+        "wikipedia_nearest": nearest_article_cache.stats(),
+        "wikipedia_summary": summary_cache.stats(),
+        "responses": response_cache.stats(),
+        "shared": shared_cache.stats(),
+    }
+
+
+CACHE_HIT_RATIO = Gauge(
+    "travelbot_cache_hit_ratio", "Aandeel hits per cache sinds het opstarten",
+    labelnames=("cache",),
+    callback=lambda: [({"cache": name}, stats["hit_ratio"]) for name, stats in cache_counters().items()],
+)
+CACHE_LOOKUPS = Counter(
+    "travelbot_cache_lookups_total", "Opvragingen per cache en resultaat",
+    labelnames=("cache", "result"),
+    callback=lambda: [
+        ({"cache": name, "result": result}, stats[field])
+        for name, stats in cache_counters().items()
+        for result, field in (("hit", "hits"), ("miss", "misses"))
+    ],
+)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Alleen met METRICS_PUBLIC=1 is /metrics zonder token of API-sleutel te lezen
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0").lower() in ("1", "true", "yes")
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Endpoint met alle metrics in het Prometheus-tekstformaat.
+    ---
+    description: >
+      Vraagt `Authorization: Bearer <METRICS_TOKEN>` of een X-API-KEY,
+      tenzij METRICS_PUBLIC=1 is gezet.
+    responses:
+      200:
+        description: Metrics in text/plain; version=0.0.4.
+      401:
+        description: Ontbrekend of onjuist token en geen API-sleutel.
+    """
+    if not METRICS_PUBLIC and not request.headers.get('X-API-KEY'):
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not METRICS_TOKEN or not hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode()):
+            abort(401)
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def persona_listing_response(source):
+    """Voorgebouwde lijst met ETag; geeft 304 als de client hem al heeft."""
+    body, etag = persona_registry.listing(source)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 @app.route('/personas', methods=['GET'])
-@cache.cached(timeout=300)
 def get_personas():
     """Endpoint to list all available personas."""
-    personas_dir = os.path.join(os.path.dirname(__file__), 'personas')
-    personas = []
-    for filename in os.listdir(personas_dir):
-        if filename.endswith('.json'):
-            with open(os.path.join(personas_dir, filename), 'r') as f:
-                persona = json.load(f)
-                personas.append({"name": persona["name"], "description": persona["description"]})
-    return jsonify(personas)
+    return persona_listing_response('personas')
 
 
 @app.route('/load-persona/<persona_name>', methods=['GET'])
 def load_persona(persona_name):
     """Endpoint to load a specific persona."""
-    personas_dir = os.path.join(os.path.dirname(__file__), 'personas')
-    persona_file = os.path.join(personas_dir, f'{persona_name}.json')
-    if os.path.exists(persona_file):
-        with open(persona_file, 'r') as f:
-            persona = json.load(f)
-        return jsonify(persona)
+    persona = persona_registry.get(persona_name)
+    if persona is not None:
+        return jsonify(persona.to_dict())
     return jsonify({"error": "Persona not found"}), 404
 
 
@@ -355,10 +1154,21 @@ def upload_persona():
 
         if not name or not description:
             return jsonify({'error': 'Name and description are required'}), 400
-
-        # Save persona to a file or database (example: saving to a JSON file)
-        with open(f'personas/{name}.json', 'w') as f:
-            json.dump(persona, f)
+        slug = slugify(name)
+        if not slug:
+            return jsonify({'error': 'Name must contain letters or digits'}), 400
+
+        path = os.path.join(persona_registry.directory('personas'), f'{slug}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(persona, f, ensure_ascii=False)
+        persona_registry.invalidate()
+        try:
+            # Nog niet geopend: de eerste sync neemt het bestand vanzelf mee
+            if marketplace_index.loaded:
+                marketplace_index.add('personas', slug, persona, os.stat(path))
+        except (sqlite3.Error, TypeError, AttributeError) as e:
+            # Het bestand is de bron; de volgende sync neemt het alsnog op
+            logger.warning(f"Upload {slug} niet in de marketplace-index: {e}")
 
         return jsonify({'message': 'Persona uploaded successfully'}), 200
     except Exception as e:
@@ -368,6 +1178,9 @@ def upload_persona():
 @app.route('/commits', methods=['GET'])
 def get_commits():
     """Endpoint to fetch the latest commits from the GitHub repository.
+
+    Served from a snapshot that is refreshed in the background with
+    conditional requests; supports `If-None-Match`.
     ---
     responses:
       200:
@@ -387,84 +1200,545 @@ def get_commits():
                 type: string
                 format: date-time
                 description: The date of the commit.
+      304:
+        description: The client's copy (ETag) is still current.
+      502:
+        description: GitHub could not be reached and there is no snapshot yet.
     """
     try:
-        # Replace with your GitHub repository details
-        repo_owner = "michligtenberg2"
-        repo_name = "travelbot"
-        url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/commits"
-
-        # Optional: Add your GitHub token for authentication
-        headers = {"Authorization": "token YOUR_GITHUB_TOKEN"}
-
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        commits = response.json()
-        commit_data = [
-            {
-                "message": commit["commit"]["message"],
-                "author": commit["commit"]["author"]["name"],
-                "date": commit["commit"]["author"]["date"]
-            }
-            for commit in commits[:5]  # Limit to the latest 5 commits
-        ]
-
-        return jsonify(commit_data), 200
+        snapshot = commit_feed.snapshot()
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": f"Commits ophalen mislukt: {e}"}), 502
+    response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def geo_response(lookup, max_age):
+    """JSON-antwoord van de geo-proxy; 503 met Retry-After als de dienst vol zit."""
+    try:
+        data = lookup()
+    except RateLimited as e:
+        response = jsonify(error=str(e))
+        response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+        return response, 503
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.warning(f"Geo-opvraging mislukt: {e}")
+        return jsonify(error="De kaartdienst is niet bereikbaar."), 502
+    response = jsonify(data)
+    response.headers['Cache-Control'] = f'public, max-age={min(max_age, 3600)}'
+    return response
+
+
+@app.route('/api/geocode/reverse', methods=['GET'])
+def geocode_reverse():
+    """Reverse geocoding via de cachende Nominatim-proxy.
+    ---
+    parameters:
+      - name: lat
+        in: query
+        type: number
+        required: true
+      - name: lon
+        in: query
+        type: number
+        required: true
+      - name: zoom
+        in: query
+        type: integer
+        required: false
+      - name: accept-language
+        in: query
+        type: string
+        required: false
+    responses:
+      200:
+        description: Het Nominatim-antwoord voor de geo-cel van de coördinaat.
+      503:
+        description: De rate limit van Nominatim is bereikt; zie Retry-After.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify(error="Latitude en longitude zijn verplicht."), 400
+    zoom = request.args.get('zoom', 18, type=int)
+    language = request.args.get('accept-language', 'nl')
+    return geo_response(lambda: geo_proxy.reverse(lat, lon, zoom, language), geo_proxy.reverse_ttl)
+
+
+@app.route('/api/geocode/search', methods=['GET'])
+def geocode_search():
+    """Zoeken op plaatsnaam of adres via de cachende Nominatim-proxy.
+    ---
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+      - name: limit
+        in: query
+        type: integer
+        required: false
+      - name: countrycodes
+        in: query
+        type: string
+        required: false
+    responses:
+      200:
+        description: De Nominatim-zoekresultaten.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(error="Een zoekterm (q) is verplicht."), 400
+    limit = min(request.args.get('limit', 1, type=int), 10)
+    countrycodes = request.args.get('countrycodes', 'nl,be,de')
+    return geo_response(lambda: geo_proxy.search(query, limit, countrycodes), geo_proxy.search_ttl)
+
+
+@app.route('/api/pois', methods=['GET'])
+def nearby_pois():
+    """Bezienswaardigheden in de buurt via de cachende Overpass-proxy.
+    ---
+    parameters:
+      - name: lat
+        in: query
+        type: number
+        required: true
+      - name: lon
+        in: query
+        type: number
+        required: true
+      - name: radius
+        in: query
+        type: integer
+        required: false
+        description: Straal in meters (standaard 200, hooguit POI_MAX_RADIUS).
+      - name: limit
+        in: query
+        type: integer
+        required: false
+    responses:
+      200:
+        description: Overpass-elementen binnen de straal, dichtstbijzijnde eerst.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify(error="Latitude en longitude zijn verplicht."), 400
+    radius = request.args.get('radius', 200, type=int)
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return geo_response(lambda: geo_proxy.pois(lat, lon, radius, limit), geo_proxy.poi_ttl)
+
+
+# Persona-namen van de webapp en de stijlen waar ze bij horen
+WEBAPP_PERSONAS = {"amsterdammer": "Jordanees", "belg": "Belg", "brabander": "Brabander"}
+CHAT_MESSAGE_MAX_LENGTH = 500
+
+# Binnen deze afstand (meters) van de vorige opmerking, of bij hetzelfde artikel,
+# is er niets nieuws te melden; na NOVELTY_REPEAT_AFTER seconden mag het weer
+NOVELTY_MIN_DISTANCE = float(os.getenv("NOVELTY_MIN_DISTANCE", "150"))
+NOVELTY_REPEAT_AFTER = float(os.getenv("NOVELTY_REPEAT_AFTER", "3600"))
+
+
+def resolve_style(persona):
+    """Stijl voor een persona uit de webapp; bekende stijlen en persona's uit `personas/` blijven zoals ze zijn."""
+    if not isinstance(persona, str) or not persona:
+        return 'Jordanees'
+    if persona in PERSONAS or persona_registry.get(persona) is not None:
+        return persona
+    return WEBAPP_PERSONAS.get(persona.lower(), 'Jordanees')
+
+
+def repeat_reply(session_id, title, style, language, reason):
+    """Antwoord zonder nieuwe generatie: een in deze sessie nog niet gezegde variant uit de cache, anders None."""
+    unsaid = session_store.unsaid(session_id, response_cache.peek(fingerprint(title, style, language))) if title else []
+    if not unsaid:
+        GENERATIONS_AVOIDED.inc(reason=reason, reply="nothing_new")
+        return None
+    GENERATIONS_AVOIDED.inc(reason=reason, reply="variant")
+    text = random.choice(unsaid)
+    session_store.add_turn(session_id, "assistant", text)
+    return text
+
+
+@app.route('/api/session', methods=['POST'])
+def webapp_session():
+    """Sessietoken voor de webapp, nodig voor /api/location-comment, /api/persona-chat en /api/prefetch.
+    ---
+    parameters:
+      - name: session_id
+        in: body
+        type: string
+        required: false
+        description: Bestaande sessie die het token moet voortzetten; anders een nieuwe.
+    responses:
+      200:
+        description: Token voor de header `X-Session-Token`, de sessie en de geldigheid in seconden.
+        schema:
+          type: object
+          properties:
+            token:
+              type: string
+            session_id:
+              type: string
+            expires_in:
+              type: integer
+    """
+    data = request.get_json(silent=True)
+    session_id = session_store.resolve(data.get('session_id') if isinstance(data, dict) else None)
+    return jsonify(token=session_tokens.dumps(session_id), session_id=session_id, expires_in=SESSION_TOKEN_TTL)
+
+
+@app.route('/api/location-comment', methods=['POST'])
+def location_comment():
+    """Opmerking van de persona over de huidige plek, voor de webapp.
+    ---
+    parameters:
+      - name: persona
+        in: body
+        type: string
+        required: false
+        description: Persona uit de webapp (bijv. 'amsterdammer') of een stijl.
+      - name: context
+        in: body
+        type: object
+        required: true
+        description: Context met `lat` en `lon` en/of `locationName`.
+      - name: language
+        in: body
+        type: string
+        required: false
+        description: Taal van de opmerking ('nl' of 'en').
+      - name: session_id
+        in: body
+        type: string
+        required: false
+        description: Sessie van de webapp; ontbreekt hij, dan komt er een nieuwe terug.
+    responses:
+      200:
+        description: Een opmerking over de plek; `comment` is null als er niets nieuws is.
+        schema:
+          type: object
+          properties:
+            comment:
+              type: string
+            novel:
+              type: boolean
+              description: False als er geen nieuwe opmerking is gemaakt omdat de plek niet veranderde.
+            session_id:
+              type: string
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Ongeldige JSON."), 400
+    context = data.get('context') if isinstance(data.get('context'), dict) else {}
+    name = context.get('locationName').strip() if isinstance(context.get('locationName'), str) else ''
+    try:
+        lat, lon = float(context['lat']), float(context['lon'])
+    except (KeyError, TypeError, ValueError):
+        lat = lon = None
+    if lat is None and not name:
+        return jsonify(error="Locatie (lat/lon of locationName) is verplicht."), 400
+
+    style = resolve_style(data.get('persona'))
+    language = data.get('language') or context.get('language') or 'nl'
+    session_id = g.get('session_id') or session_store.resolve(data.get('session_id'))
+
+    # Niets nieuws als de reiziger nauwelijks verplaatst is (dan ook geen opzoeking)
+    # of als de dichtstbijzijnde plek dezelfde is als bij de vorige opmerking
+    last = session_store.last_comment(session_id, NOVELTY_REPEAT_AFTER)
+    repeat = None
+    if last is not None and lat is not None and last[0] is not None \
+            and distance_m(last[0], last[1], lat, lon) < NOVELTY_MIN_DISTANCE:
+        title, repeat = last[2], "stationary"
+    else:
+        deadline = Deadline(COMMENT_LATENCY_BUDGET)
+        with COMMENT_STAGES.time(stage="total"):
+            title, place_summary = runtime.run(lookup_place(lat, lon, deadline)) if lat is not None else (None, None)
+            if not title and name:
+                # Zonder artikel praat de persona over de naam die de webapp toont
+                title = place_summary = name
+            # Zonder titel (geen artikel en geen naam) is er niets om te vergelijken
+            if title and last is not None and title == last[2]:
+                repeat = "same_place"
+            else:
+                text = generate_comment(title, place_summary, None, style, language, deadline)
+    if repeat:
+        text = repeat_reply(session_id, title, style, language, repeat)
+        return jsonify(comment=text, novel=False, persona=data.get('persona'), title=title, session_id=session_id)
+
+    session_store.record_comment(session_id, lat, lon, title, text)
+    return jsonify(comment=text, novel=True, persona=data.get('persona'), title=title, session_id=session_id)
+
+
+@app.route('/api/persona-chat', methods=['POST'])
+def persona_chat():
+    """Chat met de persona; de context van de sessie blijft op de server.
+    ---
+    parameters:
+      - name: message
+        in: body
+        type: string
+        required: true
+        description: Bericht van de gebruiker.
+      - name: persona
+        in: body
+        type: string
+        required: false
+        description: Persona uit de webapp (bijv. 'amsterdammer') of een stijl.
+      - name: language
+        in: body
+        type: string
+        required: false
+        description: Taal van het antwoord ('nl' of 'en').
+      - name: session_id
+        in: body
+        type: string
+        required: false
+        description: Sessie van de webapp; ontbreekt hij, dan komt er een nieuwe terug.
+    responses:
+      200:
+        description: Het antwoord van de persona.
+        schema:
+          type: object
+          properties:
+            response:
+              type: string
+            session_id:
+              type: string
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Ongeldige JSON."), 400
+    message = data.get('message')
+    if not isinstance(message, str) or not message.strip():
+        return jsonify(error="Bericht is verplicht."), 400
+    message = message.strip()[:CHAT_MESSAGE_MAX_LENGTH]
+
+    style = resolve_style(data.get('persona'))
+    language = data.get('language') or 'nl'
+    session_id = g.get('session_id') or session_store.resolve(data.get('session_id'))
+
+    # Alleen de recente plekken en de beurten binnen het tokenbudget gaan mee
+    system = chat_system_prompt(persona_text(style, language), language, session_store.places(session_id))
+    messages = [{"role": "system", "content": system}, *session_store.history(session_id),
+                {"role": "user", "content": message}]
+    deadline = Deadline(COMMENT_LATENCY_BUDGET)
+    try:
+        with COMMENT_STAGES.time(stage="chat"), openai_breaker.guard():
+            reply = llm_client.chat(messages, temperature=0.8, budget=deadline.remaining())
+    except (LLMError, CircuitOpenError) as e:
+        return jsonify(response=fallback_reply(e), session_id=session_id)
+
+    session_store.add_turn(session_id, "user", message)
+    session_store.add_turn(session_id, "assistant", reply)
+    return jsonify(response=reply, session_id=session_id)
+
+
+@app.route('/api/prefetch', methods=['POST'])
+def prefetch():
+    """Haal plekken langs de route alvast op, zodat de volgende opmerking uit de cache komt.
+    ---
+    parameters:
+      - name: lat
+        in: body
+        type: number
+        required: true
+      - name: lon
+        in: body
+        type: number
+        required: true
+      - name: heading
+        in: body
+        type: number
+        required: false
+        description: Koers in graden vanaf het noorden.
+      - name: speed
+        in: body
+        type: number
+        required: false
+        description: Snelheid in km/u.
+      - name: route
+        in: body
+        type: array
+        required: false
+        description: Actieve route als lijst van [lat, lon]-punten.
+      - name: persona
+        in: body
+        type: string
+        required: false
+      - name: language
+        in: body
+        type: string
+        required: false
+    responses:
+      202:
+        description: Aantal punten en wat er met de taken gebeurde.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Ongeldige JSON."), 400
+    try:
+        lat, lon = float(data['lat']), float(data['lon'])
+        heading = float(data['heading']) if data.get('heading') is not None else None
+        speed = float(data.get('speed') or 0)
+        route = [(float(point[0]), float(point[1]))
+                 for point in (data.get('route') or [])[:PREFETCH_MAX_ROUTE_POINTS]]
+    except (KeyError, TypeError, ValueError, IndexError):
+        return jsonify(error="lat en lon zijn verplicht; heading, speed en route moeten getallen zijn."), 400
+
+    style = resolve_style(data.get('persona') or data.get('style'))
+    language = data.get('language') or 'nl'
+    outcomes = {"queued": 0, "duplicate": 0, "dropped": 0, "rate_limited": 0}
+    points = ahead_points(lat, lon, heading, speed, PREFETCH_HORIZON, PREFETCH_STEP, route)
+    controller, _, client = g.admission
+    now = time.monotonic()
+    for index, (eta, point_lat, point_lon) in enumerate(points):
+        # De punten lopen op in aankomsttijd: is de bucket op, dan vallen de verste af
+        try:
+            controller.charge(client, BACKGROUND, PREFETCH_POINT_COST)
+        except Rejected:
+            outcomes["rate_limited"] = len(points) - index
+            break
+        key = (geo_cell(point_lat, point_lon, GEO_CELL_SIZE), style, language)
+        # Een plek is waardeloos als de reiziger er al een tijdstap voorbij is
+        outcome = prefetch_queue.submit(key, eta, now + eta + PREFETCH_STEP, point_lat, point_lon, style, language)
+        outcomes[outcome] += 1
+    return jsonify(points=len(points), **outcomes), 202
 
 
 @app.route('/marketplace', methods=['GET'])
-@cache.cached()
 def marketplace():
-    """Endpoint to list all available personas in the marketplace."""
-    marketplace_dir = os.path.join(os.path.dirname(__file__), 'marketplace')
-    personas = []
-    for filename in os.listdir(marketplace_dir):
-        if filename.endswith('.json'):
-            with open(os.path.join(marketplace_dir, filename), 'r') as f:
-                persona = json.load(f)
-                personas.append({"name": persona["name"], "description": persona.get("description", "")})
-    return jsonify(personas)
-
+    """Endpoint to browse and search the personas in the marketplace.
 
-@app.route('/async_marketplace', methods=['GET'])
-async def async_marketplace():
-    """Asynchronous endpoint to list all available personas in the marketplace."""
-    marketplace_dir = os.path.join(os.path.dirname(__file__), 'marketplace')
-    personas = []
-
-    async def load_persona(file_path):
-        async with aiofiles.open(file_path, mode='r') as f:
-            return json.loads(await f.read())
-
-    tasks = [
-        load_persona(os.path.join(marketplace_dir, filename))
-        for filename in os.listdir(marketplace_dir) if filename.endswith('.json')
-    ]
+    Paginated with an opaque cursor; the response is gzip-compressed when
+    the client accepts it and supports `If-None-Match`.
+    ---
+    parameters:
+      - name: q
+        in: query
+        type: string
+        description: Full-text search over name, description and traits (prefix match on every word).
+      - name: sort
+        in: query
+        type: string
+        enum: [name, newest, relevance]
+        description: Defaults to relevance with q, otherwise name.
+      - name: cursor
+        in: query
+        type: string
+        description: The next_cursor of the previous page.
+      - name: limit
+        in: query
+        type: integer
+        description: Page size (at most MARKETPLACE_MAX_PAGE_SIZE).
+      - name: source
+        in: query
+        type: string
+        enum: [marketplace, personas]
+    responses:
+      200:
+        description: One page of personas with items, total, sort and next_cursor (null on the last page).
+      304:
+        description: The client's copy (ETag) is still current.
+      400:
+        description: Unknown sort or invalid cursor.
+    """
+    try:
+        listing = marketplace_index.listing(
+            q=request.args.get('q'),
+            sort=request.args.get('sort'),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int),
+            source=request.args.get('source'),
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if listing.gzipped is not None and request.accept_encodings['gzip']:
+        response = Response(listing.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(f'{listing.etag}-gzip')
+    else:
+        response = Response(listing.body, mimetype='application/json')
+        response.set_etag(listing.etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    for persona in await asyncio.gather(*tasks):
-        personas.append({"name": persona["name"], "description": persona.get("description", "")})
 
-    return jsonify(personas)
+@app.route('/async_marketplace', methods=['GET'])
+def async_marketplace():
+    """Alias van /marketplace voor oudere clients."""
+    return marketplace()
 
 
-def compress_image(input_path, output_path, quality=85):
-    with Image.open(input_path) as img:
-        img.save(output_path, "JPEG", optimize=True, quality=quality)
+IMAGE_MAX_AGE = 365 * 24 * 3600
 
 
 @app.route('/compress/<filename>', methods=['GET'])
-@cache.cached(timeout=3600, query_string=True)
 def serve_compressed_image(filename):
-    input_path = os.path.join('static/images', filename)
-    output_path = os.path.join('static/compressed', filename)
-
-    if not os.path.exists(output_path):
-        compress_image(input_path, output_path)
-
-    return send_from_directory('static/compressed', filename)
+    """Endpoint dat een gecomprimeerde variant van een afbeelding geeft.
+    ---
+    parameters:
+      - name: filename
+        in: path
+        type: string
+        required: true
+        description: Bestandsnaam in static/images.
+      - name: w
+        in: query
+        type: integer
+        required: false
+        description: Gewenste breedte; wordt afgerond naar de eerstvolgende vooraf gemaakte breedte.
+      - name: fmt
+        in: query
+        type: string
+        required: false
+        description: avif, webp of jpeg. Zonder fmt wordt gekozen op basis van de Accept-header.
+      - name: q
+        in: query
+        type: integer
+        required: false
+        description: Gewenste kwaliteit; wordt afgerond naar een vooraf bepaald niveau.
+    responses:
+      200:
+        description: De afbeelding. Content-Location wijst naar de onveranderlijke URL onder /images.
+      400:
+        description: Formaat niet beschikbaar.
+      404:
+        description: Afbeelding niet gevonden.
+    """
+    try:
+        path = image_pipeline.get(
+            filename,
+            width=request.args.get('w', type=int),
+            fmt=request.args.get('fmt'),
+            quality=request.args.get('q', type=int),
+            accept=request.headers.get('Accept', ''),
+        )
+    except FileNotFoundError:
+        return jsonify({"error": "Image not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = send_file(path, conditional=True, etag=True, max_age=86400)
+    response.vary.add('Accept')
+    response.headers['Content-Location'] = f"/images/{os.path.basename(path)}"
+    return response
+
+
+@app.route('/images/<name>', methods=['GET'])
+def serve_image_variant(name):
+    """Endpoint voor een variant op zijn content-hash-naam; die inhoud verandert nooit."""
+    try:
+        path = image_pipeline.variant_path(name)
+    except FileNotFoundError:
+        return jsonify({"error": "Image not found"}), 404
+    response = send_file(path, conditional=True, etag=True, max_age=IMAGE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == '__main__':
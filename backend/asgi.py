@@ -0,0 +1,146 @@
+"""ASGI-ingang voor Travelbot, voor productie onder uvicorn.
+
+`/comment` is hier een native async route: Wikipedia en OpenAI worden via
+de gedeelde `httpx`-client aangesproken, zodat een wachtend verzoek geen
+thread bezet houdt en één proces honderden trage completions tegelijk kan
+hebben openstaan. Alle andere routes gaan via de WSGI-adapter van a2wsgi
+naar de bestaande Flask-app en draaien in een threadpool van
+`WSGI_THREADS` threads.
+
+Bij het opstarten neemt de gedeelde runtime de loop van de server over
+(zie `AsyncRuntime.attach`), zodat beide soorten routes één client delen.
+
+Gebruik (aantal workers via --workers of WEB_CONCURRENCY):
+    uvicorn --app-dir backend asgi:application --host 0.0.0.0 --port 5000 --workers 4 --no-proxy-headers
+    python backend/asgi.py
+
+Achter een reverse proxy zet je TRUSTED_PROXIES op het aantal proxies; de
+app bepaalt dan zelf het client-IP uit X-Forwarded-For. Uvicorn moet de
+header niet ook verwerken (`--no-proxy-headers`), anders telt hij dubbel.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+
+import app as travelbot
+from admission import Rejected
+from async_runtime import runtime
+from instrumentation import HTTP_IN_FLIGHT, HTTP_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+wsgi_application = WSGIMiddleware(travelbot.app, workers=int(os.getenv("WSGI_THREADS", "32")))
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),  # zoals flask_cors voor de Flask-routes
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def comment(scope, receive, send):
+    """Native async versie van POST /comment."""
+    headers = {name.lower(): value for name, value in scope["headers"]}
+    api_key = headers.get(b"x-api-key")
+    if not api_key:
+        return 401, {"error": "API key is required"}
+    # Dezelfde toelatingscontrole als `validate_api_key` voor de Flask-routes
+    admission = travelbot.admission
+    client = travelbot.forwarded_client((scope.get("client") or ("", 0))[0],
+                                        headers.get(b"x-forwarded-for", b"").decode("latin-1"))
+    try:
+        lane = admission.admit(travelbot.admission_key(api_key.decode("latin-1"), client),
+                               travelbot.request_lane("comment", headers.get(b"x-priority", b"").decode("latin-1")),
+                               travelbot.ADMISSION_COSTS["comment"])
+    except Rejected as e:
+        return 429, {"error": "Te veel verzoeken; probeer het later opnieuw.", "reason": e.reason}, [
+            (b"retry-after", str(max(1, math.ceil(e.retry_after))).encode())]
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b"null")
+        except ValueError:
+            return 400, {"error": "Ongeldige JSON."}
+        return await travelbot.comment_async(data)
+    finally:
+        admission.release(lane)
+
+
+# (methode, pad) -> async handler die (status, body) of (status, body, headers) teruggeeft
+NATIVE_ROUTES = {
+    ("POST", "/comment"): ("comment", comment),
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await runtime.attach()
+                travelbot.image_prewarm.resolve()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await runtime.detach()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    route = NATIVE_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if route is None:
+        await wsgi_application(scope, receive, send)
+        return
+
+    endpoint, handler = route
+    start = time.perf_counter()
+    with HTTP_IN_FLIGHT.track_inprogress(endpoint=endpoint):
+        try:
+            status, payload, *headers = await handler(scope, receive, send)
+        except Exception:
+            logger.exception(f"Fout in {endpoint}")
+            status, payload, headers = 500, {"error": "Interne fout"}, []
+        await send_json(send, status, payload, *headers)
+    HTTP_REQUESTS.observe(time.perf_counter() - start, endpoint=endpoint, method=scope["method"], status=status)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "asgi:application",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "5000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        # X-Forwarded-For wordt in de app zelf verwerkt (TRUSTED_PROXIES); uvicorn laat hem staan
+        proxy_headers=False,
+    )
@@ -0,0 +1,189 @@
+"""Gedeelde event loop met een gepoolde httpx-client voor upstream-verkeer.
+
+Flask-routes zijn synchroon. In plaats van per verzoek een nieuwe event loop
+en een nieuwe `httpx.AsyncClient` aan te maken (met elke keer DNS en een
+TLS-handshake) draait er per proces één loop in een achtergrondthread. Die
+loop bezit één keep-alive client die alle verzoeken delen.
+
+Onder een ASGI-server (zie asgi.py) is er al een loop; daar neemt `attach()`
+de loop van de server over in plaats van een eigen thread te starten, zodat
+async routes en gewone Flask-routes dezelfde client delen.
+"""
+
+import asyncio
+import atexit
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram(
+    "travelbot_event_loop_lag_seconds", "Vertraging van de gedeelde event loop ten opzichte van het schema",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LOOP_LAG_LAST = Gauge(
+    "travelbot_event_loop_lag_last_seconds", "Laatst gemeten vertraging van de gedeelde event loop",
+)
+
+
+class AsyncRuntime:
+    """Langlevende event loop in een achtergrondthread met één gedeelde client."""
+
+    def __init__(self, max_connections=100, max_keepalive=20, keepalive_expiry=30.0,
+                 timeout=10.0, connect_timeout=5.0, http2=False, lag_interval=0.5):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 gevraagd maar het pakket 'h2' ontbreekt; HTTP/1.1 wordt gebruikt")
+            http2 = False
+        self.http2 = http2
+        self.lag_interval = lag_interval
+        self._lag_monitor = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Maak een runtime aan met instellingen uit omgevingsvariabelen."""
+        return cls(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+            http2=os.getenv("HTTP2", "0").lower() in ("1", "true", "yes"),
+            lag_interval=float(os.getenv("LOOP_LAG_INTERVAL", "0.5")),
+        )
+
+    @property
+    def loop(self):
+        self.start()
+        return self._loop
+
+    @property
+    def client(self):
+        """De gedeelde client; alleen te gebruiken vanuit coroutines op `loop`."""
+        self.start()
+        return self._client
+
+    def start(self):
+        """Start de loop-thread als die nog niet (in dit proces) draait."""
+        if self._loop is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+            # Na een fork (bijv. gunicorn --preload) bestaat de thread niet meer.
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(
+                target=self._run_loop, args=(loop, ready), name="travelbot-async", daemon=True
+            )
+            thread.start()
+            ready.wait()
+            client = asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+            self._client = client
+            if self.lag_interval > 0:
+                self._lag_monitor = asyncio.run_coroutine_threadsafe(self._monitor_lag(), loop)
+            self._thread = thread
+            self._pid = os.getpid()
+            self._loop = loop
+
+    @staticmethod
+    def _run_loop(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    async def _monitor_lag(self):
+        """Meet hoeveel later dan gepland de loop een korte slaap afrondt.
+
+        Blokkerend werk op de loop (of een overvolle loop) laat deze
+        vertraging oplopen en raakt alle lopende upstream-verzoeken.
+        """
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - start - self.lag_interval)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+
+    async def _create_client(self):
+        return httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+
+    async def attach(self):
+        """Gebruik de lopende loop (van de ASGI-server) als gedeelde loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is loop:
+                return
+            if self._loop is not None and self._pid == os.getpid():
+                raise RuntimeError("De runtime draait al op een andere loop")
+            self._client = await self._create_client()
+            self._thread = None
+            self._pid = os.getpid()
+            self._loop = loop
+            if self.lag_interval > 0:
+                self._lag_monitor = asyncio.ensure_future(self._monitor_lag())
+
+    async def detach(self):
+        """Sluit de client op een overgenomen loop; de loop zelf blijft van de server."""
+        with self._lock:
+            client, monitor = self._client, self._lag_monitor
+            self._loop = self._thread = self._client = self._lag_monitor = None
+        if monitor is not None:
+            monitor.cancel()
+        if client is not None:
+            await client.aclose()
+
+    def submit(self, coro):
+        """Plan een coroutine in op de gedeelde loop en geef een Future terug."""
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("Blokkerend wachten op de gedeelde loop vanaf die loop zelf; gebruik await")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro, timeout=None):
+        """Voer een coroutine uit op de gedeelde loop en wacht op het resultaat."""
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self):
+        """Sluit de client en stop de loop netjes."""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            if loop is None or thread is None or self._pid != os.getpid():
+                return  # niet gestart, of de loop is van de ASGI-server (zie detach)
+            self._loop = self._thread = self._client = None
+            monitor, self._lag_monitor = self._lag_monitor, None
+        if monitor is not None:
+            monitor.cancel()
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(5)
+        except Exception as e:
+            logger.warning(f"Kon HTTP-client niet netjes sluiten: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+runtime = AsyncRuntime.from_env()
+atexit.register(runtime.shutdown)
@@ -0,0 +1,93 @@
+"""Benchmark: nieuwe event loop + client per verzoek versus de gedeelde runtime.
+
+Beide varianten doen de twee Wikipedia-opvragingen van `/comment`
+(geosearch en samenvatting) tegen een lokale stubserver, vanuit een pool
+threads zoals de Flask-workers dat doen. De geo-cache wordt omzeild zodat
+alleen het transport wordt gemeten.
+
+Gebruik:
+    python backend/benchmarks/bench_event_loop.py --requests 500 --threads 8
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from stubs import WikipediaStub, start_stub
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def old_lookup(base_url):
+    """De oude situatie: per verzoek een nieuwe loop en een nieuwe client."""
+    async def lookup():
+        async with httpx.AsyncClient() as client:
+            geo = await client.get(f"{base_url}/w/api.php?action=query&list=geosearch"
+                                   f"&gscoord=52.37%7C4.88&gsradius=10000&gslimit=1&format=json")
+            title = geo.json()["query"]["geosearch"][0]["title"]
+            summary = await client.get(f"{base_url}/api/rest_v1/page/summary/{title}")
+            return summary.json()["extract"]
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(lookup())
+    finally:
+        # De oude code lekte de loop; hier sluiten we hem zodat de
+        # benchmark niet op file descriptors vastloopt.
+        loop.close()
+
+
+def new_lookup(app_module):
+    """De nieuwe situatie: gedeelde loop met een gepoolde keep-alive client."""
+    async def lookup():
+        title = await app_module.fetch_nearest_title(52.37, 4.88)
+        return await app_module.fetch_summary(title)
+
+    return app_module.runtime.run(lookup())
+
+
+def measure(fn, total, threads):
+    """Voer `fn` `total` keer uit over `threads` threads en geef req/s terug."""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: fn(), range(min(threads, total))))  # opwarmen
+        start = time.perf_counter()
+        list(pool.map(lambda _: fn(), range(total)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="kunstmatige upstream-latency per verzoek in seconden")
+    args = parser.parse_args()
+
+    server, base_url = start_stub(WikipediaStub, latency=args.latency)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["WIKIPEDIA_API_URL"] = f"{base_url}/w/api.php"
+    os.environ["WIKIPEDIA_REST_URL"] = f"{base_url}/api/rest_v1"
+    import app as app_module
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    before = measure(lambda: old_lookup(base_url), args.requests, args.threads)
+    after = measure(lambda: new_lookup(app_module), args.requests, args.threads)
+    app_module.runtime.shutdown()
+    server.shutdown()
+
+    print(f"verzoeken={args.requests} threads={args.threads} latency={args.latency}s")
+    print(f"voor  (loop + client per verzoek): {before:8.1f} req/s")
+    print(f"na    (gedeelde runtime):          {after:8.1f} req/s")
+    print(f"versnelling: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Loadtest van de backend tegen lokale stubs voor Wikipedia, OpenAI en GitHub.
+
+De Flask-app draait in dit proces achter een threaded WSGI-server; alle
+upstreams zijn stubservers (zie stubs.py) met instelbare latency, jitter
+en foutkans. Per scenario en concurrency-niveau worden doorvoer,
+p50/p95/p99-latency, fouten, upstream-aanroepen en geheugengebruik gemeten.
+Het resultaat gaat als JSON naar `benchmarks/results/`, zodat runs van
+verschillende commits met `--baseline` vergeleken kunnen worden.
+
+Gebruik:
+    python backend/benchmarks/bench_load.py --concurrency 1,8,32 --requests 400
+    python backend/benchmarks/bench_load.py --scenarios comment --llm-latency 0.2 \\
+        --baseline backend/benchmarks/results/bench-abc1234-20240101-120000.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from stubs import GitHubStub, OpenAIStub, WikipediaStub, start_stub
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+API_HEADERS = {"X-API-KEY": "benchmark"}
+IMAGE_NAME = "bench.jpg"
+
+
+def comment_request(i, points):
+    lat, lon = points[i % len(points)]
+    return "POST", "/comment", {"lat": lat, "lon": lon, "style": "Jordanees"}, {}
+
+
+# Scenario -> functie die voor verzoek i (method, pad, json-body, headers) geeft
+SCENARIOS = {
+    "comment": comment_request,
+    "personas": lambda i, points: ("GET", "/personas", None, {}),
+    "marketplace": lambda i, points: ("GET", "/marketplace", None, {}),
+    "compress": lambda i, points: ("GET", f"/compress/{IMAGE_NAME}?w=640", None, {"Accept": "image/webp,*/*"}),
+    "commits": lambda i, points: ("GET", "/commits", None, {}),
+}
+
+
+def percentile(values, q):
+    """Percentiel volgens nearest-rank van een gesorteerde lijst."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def rss_mb():
+    """Huidig en piek-RSS van dit proces in MB (huidig alleen op Linux)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == "darwin":
+        peak /= 1024  # macOS geeft bytes in plaats van KB
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        current = None
+    return current, peak
+
+
+def drive(base_url, make_request, indices, concurrency, points):
+    """Stuur de verzoeken `indices` met `concurrency` threads; geef metingen en wandkloktijd."""
+    latencies = []
+    statuses = {}
+    counter = iter(indices)
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        session.headers.update(API_HEADERS)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, body, headers = make_request(i, points)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, headers=headers, timeout=30)
+                response.content
+                status = str(response.status_code)
+            except requests.RequestException:
+                status = "exception"
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+        session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def run_level(base_url, scenario, concurrency, total, warmup, points):
+    """Warm op en meet daarna `total` verzoeken op één concurrency-niveau."""
+    make_request = SCENARIOS[scenario]
+    if warmup:
+        drive(base_url, make_request, range(warmup), concurrency, points)
+    latencies, statuses, elapsed = drive(base_url, make_request, range(warmup, warmup + total),
+                                         concurrency, points)
+    errors = sum(n for status, n in statuses.items() if status == "exception" or not 200 <= int(status) < 300)
+    ms = sorted(v * 1000 for v in latencies)
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 2) if ms else 0.0,
+            "p50": round(percentile(ms, 50), 2),
+            "p95": round(percentile(ms, 95), 2),
+            "p99": round(percentile(ms, 99), 2),
+            "max": round(ms[-1], 2) if ms else 0.0,
+        },
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def compare(results, baseline_path):
+    """Print per scenario en niveau het verschil met een eerdere run."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nvergeleken met {baseline['meta']['commit']} ({baseline_path}):")
+    for result in results:
+        before = old.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        rps = result["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        p95 = result["latency_ms"]["p95"] - before["latency_ms"]["p95"]
+        print(f"  {result['scenario']:<12} c={result['concurrency']:<4} "
+              f"doorvoer {rps:+7.1%}   p95 {p95:+9.2f} ms")
+
+
+def configure_environment(args, urls, image_dir):
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["OPENAI_BASE_URL"] = f"{urls['openai']}/v1"
+    os.environ["WIKIPEDIA_API_URL"] = f"{urls['wikipedia']}/w/api.php"
+    os.environ["WIKIPEDIA_REST_URL"] = f"{urls['wikipedia']}/api/rest_v1"
+    os.environ["GITHUB_API_URL"] = urls["github"]
+    os.environ["IMAGE_SOURCE_DIR"] = os.path.join(image_dir, "images")
+    os.environ["IMAGE_OUTPUT_DIR"] = os.path.join(image_dir, "compressed")
+    os.environ["IMAGE_PREWARM"] = "0"
+    # Alle verzoeken delen één API-sleutel; met toelatingscontrole zou de
+    # benchmark de rate limiter meten in plaats van de server.
+    os.environ["ADMISSION_ENABLED"] = "0"
+
+    from PIL import Image
+
+    os.makedirs(os.environ["IMAGE_SOURCE_DIR"])
+    rng = random.Random(args.seed)
+    Image.frombytes("RGB", (1600, 1200), rng.randbytes(1600 * 1200 * 3)).save(
+        os.path.join(os.environ["IMAGE_SOURCE_DIR"], IMAGE_NAME), quality=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"komma-gescheiden selectie uit {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="komma-gescheiden concurrency-niveaus")
+    parser.add_argument("--requests", type=int, default=400, help="gemeten verzoeken per niveau")
+    parser.add_argument("--warmup", type=int, default=20, help="ongemeten verzoeken vooraf per niveau")
+    parser.add_argument("--points", type=int, default=200, help="aantal verschillende locaties voor /comment")
+    parser.add_argument("--places", type=int, default=50, help="aantal verschillende Wikipedia-artikelen")
+    parser.add_argument("--wiki-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--github-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="pad voor het resultaatbestand (standaard in benchmarks/results/)")
+    parser.add_argument("--baseline", help="eerder resultaatbestand om mee te vergelijken")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"onbekende scenario's: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    servers = {
+        "wikipedia": start_stub(WikipediaStub, latency=args.wiki_latency, places=args.places),
+        "openai": start_stub(OpenAIStub, latency=args.llm_latency, jitter=args.llm_jitter,
+                             error_rate=args.llm_error_rate),
+        "github": start_stub(GitHubStub, latency=args.github_latency),
+    }
+    image_dir = tempfile.TemporaryDirectory()
+    configure_environment(args, {name: url for name, (_, url) in servers.items()}, image_dir.name)
+
+    from werkzeug.serving import make_server
+
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    http_server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{http_server.server_port}"
+
+    rng = random.Random(args.seed)
+    points = [(round(52.30 + rng.random() * 0.15, 5), round(4.80 + rng.random() * 0.2, 5))
+              for _ in range(args.points)]
+
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            calls_before = {name: server.calls for name, (server, _) in servers.items()}
+            result = run_level(base_url, scenario, concurrency, args.requests, args.warmup, points)
+            current, peak = rss_mb()
+            result = {
+                "scenario": scenario,
+                "concurrency": concurrency,
+                **result,
+                "upstream_calls": {name: server.calls - calls_before[name] for name, (server, _) in servers.items()},
+                "memory_mb": {"rss": round(current, 1) if current is not None else None, "peak_rss": round(peak, 1)},
+            }
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"{scenario:<12} c={concurrency:<4} {result['throughput_rps']:9.1f} req/s   "
+                  f"p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  p99 {latency['p99']:8.2f} ms   "
+                  f"fouten {result['errors']:<4} rss {result['memory_mb']['rss']} MB")
+
+    http_server.shutdown()
+    app_module.image_pipeline.shutdown()
+    app_module.runtime.shutdown()
+    for server, _ in servers.values():
+        server.shutdown()
+    image_dir.cleanup()
+
+    commit, dirty = git_revision()
+    now = datetime.now(timezone.utc)
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": now.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{commit}-{now:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresultaat geschreven naar {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    failed = [f"{r['scenario']} c={r['concurrency']}: {r['statuses']}" for r in results if r["errors"]]
+    if failed:
+        # Metingen met mislukte verzoeken zeggen niets over de server
+        print("\nverzoeken zonder 2xx-antwoord:\n  " + "\n  ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark: de marketplace-catalogus bij 10.000+ persona's.
+
+Schrijft `--personas` JSON-bestanden in een tijdelijke map en meet:
+
+- de oude aanpak: alle bestanden inlezen en één lijst als JSON opbouwen;
+- de eerste `sync` van de index (alles parsen) en daarna een sync zonder
+  en met één gewijzigd bestand;
+- pagina's uit de index: de eerste, een diepe pagina via de cursor, zoeken
+  op naam/beschrijving/kenmerken, en een herhaalde vraag uit de
+  paginacache; plus de grootte van de JSON- en gzip-body.
+
+Gebruik:
+    python backend/benchmarks/bench_marketplace.py --personas 10000 --rounds 200
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marketplace_index import MarketplaceIndex  # noqa: E402
+
+WORDS = ("fiets", "molen", "haven", "kaas", "tulp", "gracht", "polder", "dijk", "trein", "markt",
+         "kerk", "strand", "bos", "heide", "brug", "sluis", "boer", "visser", "schilder", "koopman")
+
+
+def write_personas(directory, count, rng):
+    for i in range(count):
+        words = rng.sample(WORDS, 6)
+        persona = {
+            "name": f"{words[0].capitalize()} {words[1]} {i}",
+            "description": f"Vertelt graag over {words[2]}, {words[3]} en de {words[4]} in de buurt.",
+            "traits": {"hobby": words[5], "accent": rng.choice(("Brabants", "Limburgs", "Gronings"))},
+        }
+        with open(os.path.join(directory, f"persona_{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(persona, f, ensure_ascii=False)
+
+
+def old_listing(directory):
+    """De oude situatie: elke keer alle bestanden lezen en één lijst opbouwen."""
+    personas = []
+    for filename in os.listdir(directory):
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            data = json.load(f)
+        personas.append({"name": data["name"], "description": data["description"]})
+    return json.dumps(personas, ensure_ascii=False).encode("utf-8")
+
+
+def timed(fn, rounds=1):
+    """Gemiddelde duur van `fn` in milliseconden over `rounds` aanroepen."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--personas", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "marketplace")
+        os.mkdir(directory)
+        write_personas(directory, args.personas, rng)
+        index = MarketplaceIndex(os.path.join(tmp, "index.sqlite3"), {"marketplace": directory},
+                                 sync_interval=0, page_size=args.limit)
+
+        old_ms, old_body = timed(lambda: old_listing(directory), rounds=3)
+        initial_ms, _ = timed(lambda: index.sync(force=True))
+        noop_ms, _ = timed(lambda: index.sync(force=True), rounds=5)
+        with open(os.path.join(directory, "persona_7.json"), "w", encoding="utf-8") as f:
+            json.dump({"name": "Gewijzigd 7", "description": "Net aangepast."}, f)
+        changed_ms, changed = timed(lambda: index.sync(force=True))
+
+        index.sync_interval = 3600
+        first_ms, first = timed(lambda: index.search(limit=args.limit), args.rounds)
+        cursor = None
+        for _ in range(min(250, args.personas // args.limit - 1)):
+            cursor = index.search(cursor=cursor, limit=args.limit)["next_cursor"]
+        deep_ms, _ = timed(lambda: index.search(cursor=cursor, limit=args.limit), args.rounds)
+        queries = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.rounds)]
+        search_ms = sum(timed(lambda q=q: index.search(q=q, limit=args.limit))[0] for q in queries) / len(queries)
+        newest_ms = sum(timed(lambda q=q: index.search(q=q, sort="newest", limit=args.limit))[0]
+                        for q in queries) / len(queries)
+        index.listing(limit=args.limit)
+        cached_ms, listing = timed(lambda: index.listing(limit=args.limit), args.rounds)
+
+    print(f"persona's={args.personas} paginagrootte={args.limit}")
+    print(f"oud   (alles inlezen, één lijst):   {old_ms:9.2f} ms  body {len(old_body) / 1024:8.1f} KiB")
+    print(f"index eerste sync (alles parsen):   {initial_ms:9.2f} ms")
+    print(f"index sync zonder wijzigingen:      {noop_ms:9.2f} ms")
+    print(f"index sync met één wijziging:       {changed_ms:9.2f} ms  ({changed} bijgewerkt)")
+    print(f"eerste pagina:                      {first_ms:9.3f} ms  (totaal {first['total']})")
+    print(f"diepe pagina via cursor:            {deep_ms:9.3f} ms")
+    print(f"zoeken (relevantie):                {search_ms:9.3f} ms")
+    print(f"zoeken (nieuwste eerst):            {newest_ms:9.3f} ms")
+    print(f"herhaalde pagina uit de cache:      {cached_ms:9.3f} ms  "
+          f"body {len(listing.body)} B, gzip {len(listing.gzipped or b'')} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Lokale stubservers die upstream-API's nabootsen voor benchmarks.
+
+De stubs draaien in een achtergrondthread op 127.0.0.1 en spreken HTTP/1.1
+met keep-alive, zodat verbindingshergebruik meetbaar is.
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Basis-handler: subklassen implementeren `route(method, path, body)`.
+
+    `route` geeft `(status, payload)` of `(status, payload, headers)`; een
+    payload van None betekent een lege body (bijvoorbeeld bij een 304).
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    jitter = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        try:
+            self._respond(method)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # de client gaf het op, bijvoorbeeld na een timeout
+
+    def _respond(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        with self.server.lock:
+            self.request_index = self.server.calls
+            self.server.calls += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        status, payload, *extra = self.route(method, urlparse(self.path), body)
+        if isinstance(payload, Iterator):
+            self._stream(status, payload)
+            return
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        for name, value in (extra[0] if extra else {}).items():
+            self.send_header(name, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, status, chunks):
+        """Stuur een server-sent-events-respons in chunks."""
+        self.send_response(status)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def route(self, method, url, body):
+        return 404, {"error": "not found"}
+
+
+class WikipediaStub(StubHandler):
+    """Bootst `list=geosearch` en `page/summary/{title}` na.
+
+    Met `places` groter dan 1 geeft geosearch per coördinaat een van zoveel
+    verschillende titels, zodat caches per artikel ook missers krijgen.
+    """
+
+    places = 1
+
+    def route(self, method, url, body):
+        if url.path == "/w/api.php":
+            title = "Westerkerk"
+            if self.places > 1:
+                coord = parse_qs(url.query).get("gscoord", [""])[0]
+                title = f"Plek {zlib.crc32(coord.encode('utf-8')) % self.places}"
+            return 200, {"query": {"geosearch": [{"title": title, "dist": 12.5}]}}
+        if url.path.startswith("/api/rest_v1/page/summary/"):
+            title = unquote(url.path.rsplit("/", 1)[-1])
+            return 200, {"title": title, "extract": f"{title} is een kerk in Amsterdam."}
+        return 404, {"error": "not found"}
+
+
+class OpenAIStub(StubHandler):
+    """Bootst `POST /v1/chat/completions` na, ook met `stream: true`.
+
+    `script` is een lijst statuscodes die eerst (in volgorde) worden
+    teruggegeven; daarna faalt elk verzoek met kans `error_rate` met een 503.
+    """
+
+    reply = "Gozer, dit is een nepantwoord."
+    script = ()
+    error_rate = 0.0
+    token_delay = 0.0
+
+    def route(self, method, url, body):
+        if method != "POST" or url.path != "/v1/chat/completions":
+            return 404, {"error": "not found"}
+        index = self.request_index
+        if index < len(self.script) and self.script[index] != 200:
+            return self.script[index], {"error": {"message": "gescript"}}
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {"error": {"message": "overbelast"}}
+        if json.loads(body or b"{}").get("stream"):
+            return 200, self._stream_reply()
+        return 200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}}]}
+
+    def _stream_reply(self):
+        for token in self.reply.split(" "):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            delta = {"choices": [{"index": 0, "delta": {"content": token + " "}}]}
+            yield f"data: {json.dumps(delta)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+class GitHubStub(StubHandler):
+    """Bootst `GET /repos/{owner}/{repo}/commits` na, met `per_page`, ETag en rate limit.
+
+    Een verzoek met een kloppende `If-None-Match` krijgt een 304 en telt,
+    net als bij GitHub, niet mee voor `rate_limit`. Met `error_status` faalt
+    elk verzoek met die status.
+    """
+
+    commits = 30
+    rate_limit = 60
+    error_status = None
+
+    def route(self, method, url, body):
+        if method != "GET" or not url.path.startswith("/repos/") or not url.path.endswith("/commits"):
+            return 404, {"message": "Not Found"}
+        if self.error_status:
+            return self.error_status, {"message": "Server Error"}
+        per_page = int(parse_qs(url.query).get("per_page", ["30"])[0])
+        commits = [
+            {
+                "sha": f"{i:040x}",
+                "commit": {
+                    "message": f"Commit {i}",
+                    "author": {"name": "Heino", "date": f"2024-01-{i % 28 + 1:02d}T12:00:00Z"},
+                },
+            }
+            for i in range(self.commits - 1, max(-1, self.commits - 1 - per_page), -1)
+        ]
+        etag = f'"{zlib.crc32(json.dumps(commits).encode("utf-8")):08x}"'
+        with self.server.lock:
+            if self.headers.get("If-None-Match") == etag:
+                self.server.not_modified = getattr(self.server, "not_modified", 0) + 1
+                return 304, None, {"ETag": etag}
+            used = self.server.rate_used = getattr(self.server, "rate_used", 0) + 1
+        return 200, commits, {"ETag": etag, "X-RateLimit-Remaining": str(max(0, self.rate_limit - used))}
+
+
+class NominatimStub(StubHandler):
+    """Bootst `/reverse` en `/search` van Nominatim na."""
+
+    def route(self, method, url, body):
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/reverse":
+            lat, lon = params["lat"], params["lon"]
+            return 200, {
+                "lat": lat, "lon": lon, "display_name": f"Stubstraat, Amsterdam ({lat}, {lon})",
+                "address": {"road": "Stubstraat", "city": "Amsterdam", "country": "Nederland"},
+            }
+        if url.path == "/search":
+            return 200, [{"lat": "52.3731", "lon": "4.8924", "display_name": params.get("q", "")}]
+        return 404, {"error": "not found"}
+
+
+class OverpassStub(StubHandler):
+    """Bootst de Overpass-interpreter na: een raster van POI's binnen de gevraagde bbox."""
+
+    spacing = 0.002
+
+    def route(self, method, url, body):
+        query = parse_qs(body.decode("utf-8")).get("data", [body.decode("utf-8")])[0]
+        match = re.search(r"\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)", query)
+        if method != "POST" or match is None:
+            return 400, {"remark": "geen bbox"}
+        south, west, north, east = (float(v) for v in match.groups())
+        elements = []
+        lat = math.ceil(south / self.spacing) * self.spacing
+        while lat <= north:
+            lon = math.ceil(west / self.spacing) * self.spacing
+            while lon <= east:
+                elements.append({"type": "node", "id": len(elements) + 1, "lat": round(lat, 6), "lon": round(lon, 6),
+                                 "tags": {"name": f"Café {round(lat, 4)},{round(lon, 4)}", "amenity": "cafe"}})
+                lon += self.spacing
+            lat += self.spacing
+        return 200, {"elements": elements}
+
+
+def start_stub(handler_cls, **attrs):
+    """Start een stubserver en geef `(server, base_url)` terug.
+
+    Extra keyword-argumenten worden als klasse-attributen op een subklasse
+    van `handler_cls` gezet, bijvoorbeeld `latency=0.05`.
+    """
+    handler = type(handler_cls.__name__, (handler_cls,), attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
@@ -0,0 +1,321 @@
+"""Gedeelde cache voor alle workers, te kiezen met `CACHE_BACKEND`.
+
+Met Flask's `SimpleCache` heeft elke gunicorn-worker een eigen, koude
+kopie. Deze module configureert Flask-Caching met een van:
+
+- `simple`: per proces (standaard, voor ontwikkeling)
+- `shm`: gedeeld geheugen via een mmap-bestand, voor meerdere workers op één host
+- `filesystem`: een map op schijf
+- `redis`: een Redis-compatibele server
+
+`SharedCache.get_or_compute` voorkomt bovendien een stormloop: als een
+sleutel ontbreekt, rekent maar één aanroeper (over alle workers heen) hem
+opnieuw uit en wachten de anderen op het resultaat.
+"""
+
+import hashlib
+import importlib.util
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+
+BACKENDS = {
+    "simple": "SimpleCache",
+    "shm": "cache_backends.SharedMemoryCache",
+    "filesystem": "FileSystemCache",
+    "redis": "RedisCache",
+}
+
+
+def cache_config_from_env():
+    """Flask-Caching-configuratie op basis van omgevingsvariabelen."""
+    backend = os.getenv("CACHE_BACKEND", "simple").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Onbekende CACHE_BACKEND: {backend}")
+    if backend == "shm" and not shm_supported():
+        raise ValueError("CACHE_BACKEND=shm vereist fcntl (Linux/macOS); kies simple, filesystem of redis")
+    config = {
+        "CACHE_TYPE": BACKENDS[backend],
+        "CACHE_DEFAULT_TIMEOUT": int(os.getenv("CACHE_DEFAULT_TIMEOUT", "300")),
+        "CACHE_KEY_PREFIX": "travelbot:",
+    }
+    if backend == "filesystem":
+        config["CACHE_DIR"] = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "travelbot-cache"))
+    elif backend == "redis":
+        config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    elif backend == "shm":
+        config["CACHE_SHM_PATH"] = os.getenv("CACHE_SHM_PATH")
+        config["CACHE_SHM_SLOTS"] = int(os.getenv("CACHE_SHM_SLOTS", "4096"))
+        config["CACHE_SHM_SLOT_SIZE"] = int(os.getenv("CACHE_SHM_SLOT_SIZE", "16384"))
+    return config
+
+
+def shm_supported():
+    """Of `SharedMemoryCache` op dit platform kan (flock via fcntl, dus niet op Windows)."""
+    return importlib.util.find_spec("fcntl") is not None
+
+
+def init_cache(app):
+    """Configureer Flask-Caching voor `app` en geef het `Cache`-object terug."""
+    app.config.update(cache_config_from_env())
+    return Cache(app)
+
+
+class SharedMemoryCache(BaseCache):
+    """Cache in een gedeeld mmap-bestand met vaste slots.
+
+    Elke sleutel hoort bij precies één slot (via een hash); een botsing
+    overschrijft het oude item, zoals bij een direct-mapped cache. Alle
+    workers openen hetzelfde bestand en serialiseren toegang met `flock`.
+    Het begin van het bestand legt de indeling vast; een worker met andere
+    `slots` of `slot_size` weigert het bestand in plaats van het verkeerd te lezen.
+    """
+
+    HEADER = struct.Struct("<16sdI")  # sleutelhash, verlooptijd (0 = nooit), lengte
+    LAYOUT = struct.Struct("<8sII")  # magic, slots, slot_size
+    MAGIC = b"TBSHM\x00\x00\x01"
+    DATA_OFFSET = 64  # slots beginnen na de indeling
+
+    def __init__(self, path=None, slots=4096, slot_size=16384, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        if not shm_supported():
+            raise RuntimeError("SharedMemoryCache vereist fcntl (Linux/macOS)")
+        import fcntl  # pas hier, zodat de module ook op Windows importeert
+
+        self._fcntl = fcntl
+        if path is None:
+            base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(base, "travelbot-cache")
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        size = self.DATA_OFFSET + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self.LAYOUT.pack(self.MAGIC, slots, slot_size), 0)
+            else:
+                self._check_layout(os.pread(self._fd, self.LAYOUT.size, 0), size)
+        except BaseException:
+            os.close(self._fd)  # geeft ook het slot vrij
+            raise
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._thread_lock = threading.Lock()
+
+    def _check_layout(self, raw, size):
+        magic, slots, slot_size = self.LAYOUT.unpack(raw) if len(raw) == self.LAYOUT.size else (None, 0, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{self.path} is geen SharedMemoryCache-bestand (of van een oudere versie); "
+                             f"verwijder het of kies een ander CACHE_SHM_PATH")
+        if (slots, slot_size) != (self.slots, self.slot_size) or os.fstat(self._fd).st_size != size:
+            raise ValueError(f"{self.path} heeft {slots} slots van {slot_size} bytes, deze worker verwacht "
+                             f"{self.slots} van {self.slot_size}; geef alle workers dezelfde CACHE_SHM_SLOTS "
+                             f"en CACHE_SHM_SLOT_SIZE")
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(
+            path=config.get("CACHE_SHM_PATH"),
+            slots=config.get("CACHE_SHM_SLOTS", 4096),
+            slot_size=config.get("CACHE_SHM_SLOT_SIZE", 16384),
+            default_timeout=config.get("CACHE_DEFAULT_TIMEOUT", 300),
+        )
+
+    @contextmanager
+    def _locked(self, exclusive):
+        # flock geldt per proces; threads binnen een proces sluiten we apart uit
+        with self._thread_lock:
+            fcntl = self._fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        return digest, self.DATA_OFFSET + (int.from_bytes(digest[:8], "little") % self.slots) * self.slot_size
+
+    def _read(self, digest, offset):
+        stored, expires, length = self.HEADER.unpack_from(self._map, offset)
+        if stored != digest or (expires and expires <= time.time()):
+            return None
+        start = offset + self.HEADER.size
+        return self._map[start:start + length]
+
+    def _write(self, digest, offset, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.slot_size - self.HEADER.size:
+            return False
+        timeout = self._normalize_timeout(timeout)
+        expires = time.time() + timeout if timeout else 0.0
+        start = offset + self.HEADER.size
+        self._map[start:start + len(data)] = data
+        self.HEADER.pack_into(self._map, offset, digest, expires, len(data))
+        return True
+
+    def get(self, key):
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=False):
+            data = self._read(digest, offset)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, timeout=None):
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=True):
+            return self._write(digest, offset, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=True):
+            if self._read(digest, offset) is not None:
+                return False
+            return self._write(digest, offset, value, timeout)
+
+    def update(self, key, fn, timeout=None):
+        """Lees en schrijf één sleutel atomair, ook over workers heen.
+
+        `fn` krijgt de huidige waarde (of None) en geeft `(nieuwe waarde, resultaat)`
+        terug; het resultaat is de returnwaarde van `update`.
+        """
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=True):
+            data = self._read(digest, offset)
+            value, result = fn(pickle.loads(data) if data is not None else None)
+            self._write(digest, offset, value, timeout)
+        return result
+
+    def delete(self, key):
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=True):
+            if self._read(digest, offset) is None:
+                return False
+            self.HEADER.pack_into(self._map, offset, b"\0" * 16, 0.0, 0)
+            return True
+
+    def has(self, key):
+        digest, offset = self._slot(key)
+        with self._locked(exclusive=False):
+            return self._read(digest, offset) is not None
+
+    def clear(self):
+        with self._locked(exclusive=True):
+            self._map[self.DATA_OFFSET:] = b"\0" * (len(self._map) - self.DATA_OFFSET)
+        return True
+
+    def used_slots(self):
+        """Aantal slots met een (niet verlopen) item."""
+        now = time.time()
+        used = 0
+        with self._locked(exclusive=False):
+            for offset in range(self.DATA_OFFSET, len(self._map), self.slot_size):
+                digest, expires, _ = self.HEADER.unpack_from(self._map, offset)
+                if digest != b"\0" * 16 and (not expires or expires > now):
+                    used += 1
+        return used
+
+
+class SharedCache:
+    """Laag boven de Flask-Caching-backend met statistieken en single-flight."""
+
+    def __init__(self, cache, lock_timeout=30.0, poll_interval=0.05):
+        self.cache = cache
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._local_locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.computes = 0
+        self.waits = 0
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    @contextmanager
+    def _local_lock(self, key):
+        with self._locks_guard:
+            lock, users = self._local_locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._local_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._locks_guard:
+                lock, users = self._local_locks[key]
+                if users == 1:
+                    del self._local_locks[key]
+                else:
+                    self._local_locks[key] = (lock, users - 1)
+
+    def get_or_compute(self, key, compute, timeout=None):
+        """Geef de gecachte waarde, of reken hem (één keer) uit en sla hem op.
+
+        Binnen een proces wachten gelijktijdige aanroepers op een lock per
+        sleutel. Tussen workers dient een `add` op `lock:<sleutel>` als
+        lock; wie hem niet krijgt, wacht tot de waarde verschijnt (of de
+        lock verloopt) in plaats van zelf upstream te gaan.
+        """
+        value = self.cache.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+        self._count("misses")
+        with self._local_lock(key):
+            value = self.cache.get(key)
+            if value is not None:
+                self._count("waits")
+                return value
+            lock_key = f"lock:{key}"
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.lock_timeout
+            while not self.cache.add(lock_key, token, timeout=int(self.lock_timeout)):
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(self.poll_interval)
+                value = self.cache.get(key)
+                if value is not None:
+                    self._count("waits")
+                    return value
+            try:
+                value = compute()
+                self._count("computes")
+                if value is not None:
+                    self.cache.set(key, value, timeout=timeout)
+                return value
+            finally:
+                if self.cache.get(lock_key) == token:
+                    self.cache.delete(lock_key)
+
+    def stats(self):
+        backend = self.cache.cache
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": type(backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "computes": self.computes,
+                "waits": self.waits,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        if isinstance(backend, SharedMemoryCache):
+            stats["slots"] = backend.slots
+            stats["used_slots"] = backend.used_slots()
+        return stats
@@ -0,0 +1,55 @@
+"""Swagger-documentatie die pas bij het eerste bezoek wordt opgebouwd.
+
+flasgger (met jsonschema) kost bij het importeren meer tijd dan de rest van
+de app samen. Deze WSGI-middleware laat alle gewone verzoeken direct door en
+bouwt pas bij het eerste verzoek naar de documentatie een aparte Flask-app
+met Swagger op, met dezelfde routes en docstrings als de echte app.
+"""
+
+import threading
+
+DOCS_PREFIXES = ("/apidocs", "/apispec", "/flasgger_static")
+
+
+class LazySwaggerDocs:
+    """WSGI-middleware die `/apidocs` en de spec pas bij gebruik opbouwt."""
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self._docs_app = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._docs_app is not None
+
+    def docs_app(self):
+        if self._docs_app is None:
+            with self._lock:
+                if self._docs_app is None:
+                    self._docs_app = self._build()
+        return self._docs_app
+
+    def _build(self):
+        from flask import Flask
+        from flasgger import Swagger
+
+        docs = Flask(self.app.import_name)
+        for rule in self.app.url_map.iter_rules():
+            if rule.endpoint != "static":
+                docs.add_url_rule(rule.rule, rule.endpoint, self.app.view_functions[rule.endpoint],
+                                  methods=rule.methods)
+        Swagger(docs)
+        return docs
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(DOCS_PREFIXES):
+            return self.docs_app().wsgi_app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+
+def init_docs(app):
+    """Hang de luie Swagger-documentatie in de WSGI-keten van `app`."""
+    app.wsgi_app = LazySwaggerDocs(app, app.wsgi_app)
+    return app.wsgi_app
@@ -0,0 +1,105 @@
+"""Geo-getegelde caches voor Wikipedia-opvragingen.
+
+Telefoons die een paar meter verschuiven vragen steeds hetzelfde artikel op.
+Door coördinaten op een vast raster af te ronden (een "geo-cel") kunnen we
+het dichtstbijzijnde artikel en de samenvatting hergebruiken in plaats van
+bij elk verzoek opnieuw naar Wikipedia te gaan.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def geo_cell(lat, lon, cell_size=0.002):
+    """Rond een coördinaat af naar de rastercel waar hij in valt.
+
+    Met de standaard celgrootte van 0.002 graden is een cel in Nederland
+    ongeveer 220 bij 135 meter.
+    """
+    return (math.floor(float(lat) / cell_size), math.floor(float(lon) / cell_size))
+
+
+class TTLCache:
+    """Thread-safe LRU-cache waarin elk item na `ttl` seconden verloopt.
+
+    Met `stale_ttl` blijft een verlopen item nog zo lang bewaard; `get` ziet
+    het niet meer, maar `get_stale` geeft het terug, zodat een verzoek
+    daarmee antwoord kan geven terwijl het op de achtergrond ververst wordt.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+
+    def get(self, key, default=None):
+        """Geef de waarde voor `key` terug, of `default` bij een miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            now = self._clock()
+            if expires <= now:
+                if expires + self.stale_ttl <= now:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, default=None):
+        """Geef de waarde ook als die verlopen is, zolang hij binnen `stale_ttl` valt."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires + self.stale_ttl <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            self.stale_hits += 1
+            return value
+
+    def set(self, key, value):
+        """Sla `value` op en verwijder zo nodig het minst recent gebruikte item."""
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Tellers voor monitoring: hits, misses, evictions en hit-ratio."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
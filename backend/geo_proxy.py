@@ -0,0 +1,213 @@
+"""Cachende proxy voor Nominatim (reverse geocoding en zoeken) en Overpass (POI's).
+
+De webapp vroeg deze publieke diensten rechtstreeks vanaf elke telefoon
+aan; in drukke gebieden herhaalde iedereen dezelfde opvragingen en liepen
+we tegen de gebruiksvoorwaarden aan. Via de backend gaat er per geo-cel
+hooguit één verzoek naar buiten:
+
+- Antwoorden staan per geo-cel in de gedeelde cache (zie cache_backends.py),
+  met een TTL per soort opvraging. Reverse geocoding vraagt het midden van
+  de cel op, zodat elke telefoon in de cel hetzelfde antwoord krijgt.
+- `SharedCache.get_or_compute` voegt gelijktijdige opvragingen van dezelfde
+  sleutel samen, ook over workers heen.
+- Een `OutboundRateLimiter` per dienst houdt alle workers samen onder het
+  toegestane tempo (Nominatim: 1 verzoek per seconde).
+- Overpass wordt per tegel van `POI_TILE_SIZE` graden bevraagd, met een rand
+  van de maximale straal. Alle telefoons in die tegel delen dat ene
+  antwoord; per aanvrager wordt er op afstand gefilterd.
+"""
+
+import logging
+import math
+import os
+import time
+
+import httpx
+
+from geo_cache import geo_cell
+from instrumentation import UPSTREAM_ERRORS
+from lazy import Lazy
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+GEO_UPSTREAM_REQUESTS = Counter(
+    "travelbot_geo_upstream_requests_total", "Verzoeken aan Nominatim en Overpass per dienst",
+    labelnames=("service",),
+)
+GEO_RATE_LIMITED = Counter(
+    "travelbot_geo_rate_limited_total", "Opvragingen die te lang op een vrije plek bij de dienst wachtten",
+    labelnames=("service",),
+)
+
+POI_FILTERS = (
+    '["amenity"~"^(restaurant|cafe|museum|theatre|cinema|attraction)$"]',
+    '["tourism"~"^(attraction|museum)$"]',
+)
+EARTH_RADIUS_M = 6371000
+
+
+class RateLimited(Exception):
+    """Er kwam binnen de wachttijd geen plek vrij bij de upstream-dienst."""
+
+    def __init__(self, service, retry_after):
+        super().__init__(f"{service}: te veel verzoeken, probeer het over {retry_after:.0f}s opnieuw")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class OutboundRateLimiter:
+    """Hooguit `rate` verzoeken per seconde naar één dienst, over alle workers heen.
+
+    De tijd is verdeeld in vakjes van 1/rate seconden; wie met `cache.add`
+    als eerste de sleutel van het huidige vakje zet, mag gaan. De rest wacht
+    op het volgende vakje. Met een gedeelde cachebackend (shm of redis)
+    geldt de limiet voor alle workers samen, anders per proces.
+    """
+
+    def __init__(self, cache, service, rate=1.0, max_wait=5.0, clock=time.time, sleep=time.sleep):
+        self.cache = cache
+        self.service = service
+        self.interval = 1.0 / rate
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+
+    def acquire(self):
+        """Wacht op een vrij vakje; gooit `RateLimited` na `max_wait` seconden."""
+        give_up = self._clock() + self.max_wait
+        while True:
+            now = self._clock()
+            slot = int(now / self.interval)
+            if self.cache.add(f"ratelimit:{self.service}:{slot}", 1, timeout=max(1, math.ceil(2 * self.interval))):
+                return
+            next_slot = (slot + 1) * self.interval
+            if next_slot > give_up:
+                GEO_RATE_LIMITED.inc(service=self.service)
+                raise RateLimited(self.service, next_slot - now)
+            self._sleep(next_slot - now)
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Afstand in meters over de aardbol (haversine)."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GeoProxy:
+    """Nominatim- en Overpass-opvragingen via cache, samenvoegen en rate limiting."""
+
+    def __init__(self, shared_cache, nominatim_url="https://nominatim.openstreetmap.org",
+                 overpass_url="https://overpass-api.de/api/interpreter", user_agent="TravelBot",
+                 reverse_cell_size=0.0005, reverse_ttl=86400, search_ttl=7 * 86400,
+                 poi_tile_size=0.01, poi_ttl=86400, poi_max_radius=1000,
+                 nominatim_rate=1.0, overpass_rate=1.0, max_wait=5.0, timeout=10.0):
+        self.shared_cache = shared_cache
+        self.nominatim_url = nominatim_url.rstrip("/")
+        self.overpass_url = overpass_url
+        self.reverse_cell_size = reverse_cell_size
+        self.reverse_ttl = reverse_ttl
+        self.search_ttl = search_ttl
+        self.poi_tile_size = poi_tile_size
+        self.poi_ttl = poi_ttl
+        self.poi_max_radius = poi_max_radius
+        self.limiters = {
+            "nominatim": OutboundRateLimiter(shared_cache.cache, "nominatim", nominatim_rate, max_wait),
+            "overpass": OutboundRateLimiter(shared_cache.cache, "overpass", overpass_rate, max_wait),
+        }
+        # Nominatim eist een herkenbare User-Agent per toepassing; de client komt er pas bij het eerste verzoek
+        self._client = Lazy(lambda: httpx.Client(timeout=timeout, headers={"User-Agent": user_agent}))
+
+    @classmethod
+    def from_env(cls, shared_cache):
+        return cls(
+            shared_cache,
+            nominatim_url=os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org"),
+            overpass_url=os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter"),
+            user_agent=os.getenv("GEO_USER_AGENT", "TravelBot/3.0 (+https://github.com/michligtenberg2/travelbot)"),
+            reverse_cell_size=float(os.getenv("GEOCODE_CELL_SIZE", "0.0005")),
+            reverse_ttl=int(os.getenv("GEOCODE_TTL", "86400")),
+            search_ttl=int(os.getenv("GEOCODE_SEARCH_TTL", str(7 * 86400))),
+            poi_tile_size=float(os.getenv("POI_TILE_SIZE", "0.01")),
+            poi_ttl=int(os.getenv("POI_TTL", "86400")),
+            poi_max_radius=int(os.getenv("POI_MAX_RADIUS", "1000")),
+            nominatim_rate=float(os.getenv("NOMINATIM_RATE", "1")),
+            overpass_rate=float(os.getenv("OVERPASS_RATE", "1")),
+            max_wait=float(os.getenv("GEO_MAX_WAIT", "5")),
+        )
+
+    def _fetch(self, service, method, url, **kwargs):
+        self.limiters[service].acquire()
+        GEO_UPSTREAM_REQUESTS.inc(service=service)
+        try:
+            response = self._client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            reason = f"http_{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            UPSTREAM_ERRORS.inc(upstream=service, reason=reason)
+            raise
+
+    def reverse(self, lat, lon, zoom=18, language="nl"):
+        """Nominatim-reverse voor het midden van de geo-cel waar (lat, lon) in valt."""
+        size = self.reverse_cell_size
+        row, col = geo_cell(lat, lon, size)
+        key = f"geo:reverse:{size}:{row}:{col}:{zoom}:{language}"
+        params = {"format": "json", "lat": f"{(row + 0.5) * size:.6f}", "lon": f"{(col + 0.5) * size:.6f}",
+                  "zoom": zoom, "addressdetails": 1, "accept-language": language}
+        return self.shared_cache.get_or_compute(
+            key, lambda: self._fetch("nominatim", "GET", f"{self.nominatim_url}/reverse", params=params),
+            timeout=self.reverse_ttl,
+        )
+
+    def search(self, query, limit=1, countrycodes="nl,be,de"):
+        """Nominatim-zoekopdracht; hoofdletters en witruimte maken geen verschil voor de cache."""
+        normalized = " ".join(query.split()).casefold()
+        key = f"geo:search:{limit}:{countrycodes}:{normalized}"
+        params = {"format": "json", "q": normalized, "limit": limit, "countrycodes": countrycodes}
+        return self.shared_cache.get_or_compute(
+            key, lambda: self._fetch("nominatim", "GET", f"{self.nominatim_url}/search", params=params),
+            timeout=self.search_ttl,
+        )
+
+    def tile_bbox(self, tile):
+        """(zuid, west, noord, oost) van een tegel, met een rand van de maximale straal."""
+        row, col = tile
+        size = self.poi_tile_size
+        south, west = row * size, col * size
+        margin_lat = self.poi_max_radius / 111320
+        margin_lon = margin_lat / max(0.01, math.cos(math.radians(south + size / 2)))
+        return (round(south - margin_lat, 6), round(west - margin_lon, 6),
+                round(south + size + margin_lat, 6), round(west + size + margin_lon, 6))
+
+    def tile_elements(self, tile):
+        """Alle POI's van één tegel, met één Overpass-verzoek voor iedereen in die tegel."""
+        bbox = ",".join(str(v) for v in self.tile_bbox(tile))
+        query = "[out:json][timeout:25];(" + "".join(f"node{f}({bbox});" for f in POI_FILTERS) + ");out;"
+
+        def fetch():
+            return self._fetch("overpass", "POST", self.overpass_url, data={"data": query})["elements"]
+
+        size = self.poi_tile_size
+        return self.shared_cache.get_or_compute(f"geo:pois:{size}:{tile[0]}:{tile[1]}", fetch,
+                                                timeout=self.poi_ttl)
+
+    def pois(self, lat, lon, radius=200, limit=10):
+        """POI's binnen `radius` meter, dichtstbijzijnde eerst, in het formaat van Overpass."""
+        radius = min(radius, self.poi_max_radius)
+        nearby = []
+        for element in self.tile_elements(geo_cell(lat, lon, self.poi_tile_size)):
+            if "lat" not in element or "lon" not in element:
+                continue
+            distance = distance_m(lat, lon, element["lat"], element["lon"])
+            if distance <= radius:
+                nearby.append((distance, element))
+        nearby.sort(key=lambda item: item[0])
+        return {"elements": [element for _, element in nearby[:limit]]}
+
+    def close(self):
+        if self._client.loaded:
+            self._client.close()
@@ -0,0 +1,167 @@
+"""Laatste commits van de GitHub-repository, als snapshot in het geheugen.
+
+`/commits` vraagt niet meer bij elk verzoek de GitHub-API aan. Een
+achtergrondthread ververst de snapshot elke `refresh_interval` seconden met
+een conditioneel verzoek (`If-None-Match` met de vorige ETag). Is er niets
+veranderd, dan geeft GitHub een 304, en die telt niet mee voor de rate
+limit (60 verzoeken per uur zonder token). De voorgebouwde JSON-body heeft
+een eigen ETag, zodat ook clients een 304 kunnen krijgen.
+
+Mislukt verversen, dan blijft de vorige snapshot staan; alleen als er nog
+nooit een geslaagd antwoord was krijgt de aanvrager een fout.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from instrumentation import UPSTREAM_ERRORS
+from lazy import Lazy
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+GITHUB_REQUESTS = Counter(
+    "travelbot_github_requests_total", "Verzoeken aan de GitHub-API per uitkomst (ok, not_modified, error)",
+    labelnames=("outcome",),
+)
+GITHUB_RATE_REMAINING = Gauge(
+    "travelbot_github_rate_limit_remaining", "Resterende GitHub-verzoeken volgens X-RateLimit-Remaining",
+)
+
+
+class CommitSnapshot:
+    """Eén geslaagde stand van de commitlijst, met JSON-body en ETag."""
+
+    __slots__ = ("commits", "body", "etag", "upstream_etag", "fetched_at")
+
+    def __init__(self, commits, upstream_etag, fetched_at):
+        self.commits = commits
+        self.body = json.dumps(commits, ensure_ascii=False).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.upstream_etag = upstream_etag
+        self.fetched_at = fetched_at
+
+
+class CommitFeed:
+    """Houdt de laatste commits bij en ververst ze op de achtergrond."""
+
+    def __init__(self, api_url, repo, token=None, page_size=5, refresh_interval=300.0, timeout=10.0,
+                 background=True):
+        self.url = f"{api_url.rstrip('/')}/repos/{repo}/commits"
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.background = background
+        self._headers = {"Accept": "application/vnd.github+json"}
+        if token:
+            self._headers["Authorization"] = f"token {token}"
+        self._client = Lazy(lambda: httpx.Client(timeout=timeout))  # pas bij de eerste ophaalactie
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_error = None
+        self.checked_at = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("GITHUB_API_URL", "https://api.github.com"),
+            os.getenv("GITHUB_REPO", "michligtenberg2/travelbot"),
+            token=os.getenv("GITHUB_TOKEN") or None,
+            page_size=int(os.getenv("COMMITS_PAGE_SIZE", "5")),
+            refresh_interval=float(os.getenv("COMMITS_REFRESH_INTERVAL", "300")),
+            background=os.getenv("COMMITS_BACKGROUND_REFRESH", "1").lower() in ("1", "true", "yes"),
+        )
+
+    def snapshot(self):
+        """De actuele snapshot; de eerste aanroep haalt hem op en start het verversen.
+
+        Gooit de fout van GitHub als er nog nooit een geslaagd antwoord was.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._refresh_unlocked(raise_errors=True)
+                if self.background and self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="travelbot-commits", daemon=True)
+                    self._thread.start()
+            return self._snapshot
+
+    def refresh(self):
+        """Ververs de snapshot nu; geeft True als GitHub iets nieuws had."""
+        with self._lock:
+            return self._refresh_unlocked()
+
+    def _refresh_unlocked(self, raise_errors=False):
+        headers = dict(self._headers)
+        previous = self._snapshot
+        if previous is not None and previous.upstream_etag:
+            headers["If-None-Match"] = previous.upstream_etag
+        try:
+            response = self._client.get(self.url, params={"per_page": self.page_size}, headers=headers)
+            self._record_rate_limit(response)
+            if response.status_code == 304 and previous is not None:
+                GITHUB_REQUESTS.inc(outcome="not_modified")
+                self.checked_at = time.time()
+                return False
+            response.raise_for_status()
+            commits = [
+                {
+                    "message": commit["commit"]["message"],
+                    "author": commit["commit"]["author"]["name"],
+                    "date": commit["commit"]["author"]["date"],
+                }
+                for commit in response.json()[:self.page_size]
+            ]
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            GITHUB_REQUESTS.inc(outcome="error")
+            reason = f"http_{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            UPSTREAM_ERRORS.inc(upstream="github", reason=reason)
+            self.last_error = str(e)
+            logger.warning(f"Commits ophalen bij GitHub mislukt: {e}")
+            if raise_errors:
+                raise
+            return False
+        GITHUB_REQUESTS.inc(outcome="ok")
+        self.last_error = None
+        self.checked_at = time.time()
+        self._snapshot = CommitSnapshot(commits, response.headers.get("ETag"), self.checked_at)
+        return previous is None or self._snapshot.etag != previous.etag
+
+    def _record_rate_limit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            GITHUB_RATE_REMAINING.set(int(remaining))
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._client.loaded:
+            self._client.close()
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "url": self.url,
+            "page_size": self.page_size,
+            "refresh_interval": self.refresh_interval,
+            "commits": len(snapshot.commits) if snapshot is not None else None,
+            "fetched_at": snapshot.fetched_at if snapshot is not None else None,
+            "checked_at": self.checked_at,
+            "last_error": self.last_error,
+            "requests": {outcome: GITHUB_REQUESTS.value(outcome=outcome)
+                         for outcome in ("ok", "not_modified", "error")},
+        }
@@ -0,0 +1,291 @@
+"""Compressie van afbeeldingen buiten de request-workers.
+
+Varianten (breedte × formaat × kwaliteit) worden in een procespool
+gegenereerd, bij het opstarten of bij een upload, zodat het zware
+encodeerwerk niet in een request gebeurt. Bestandsnamen bevatten een hash
+van de bron; een gewijzigde bron krijgt dus vanzelf nieuwe namen en een
+variant kan onbeperkt gecachet worden. Bij een miss wacht elke gelijktijdige
+aanvrager op dezelfde taak, en het resultaat komt er met een atomische
+rename te staan zodat workers nooit een half geschreven bestand zien.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import wait
+
+logger = logging.getLogger(__name__)
+
+# Formaatnaam -> (bestandsextensie, Pillow-formaat, MIME-type)
+FORMATS = {
+    "avif": ("avif", "AVIF", "image/avif"),
+    "webp": ("webp", "WEBP", "image/webp"),
+    "jpeg": ("jpg", "JPEG", "image/jpeg"),
+}
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+PREWARM_MARKER = ".prewarm-"
+# Seconden waarna het slot van een vastgelopen of gecrashte voorverwarmer vervalt
+PREWARM_LOCK_TIMEOUT = 600
+VARIANT_NAME = re.compile(r"^[\w.-]+-[0-9a-f]{16}-(?:\d+w|orig)-q\d+\.(?:avif|webp|jpg)$")
+
+
+def available_formats():
+    """Formaten die deze Pillow-installatie kan schrijven, van klein naar groot."""
+    from PIL import features
+
+    formats = []
+    for name in ("avif", "webp"):
+        try:
+            if features.check(name):
+                formats.append(name)
+        except ValueError:  # oudere Pillow kent de feature niet
+            pass
+    formats.append("jpeg")
+    return formats
+
+
+def encode_variant(source, target, width, fmt, quality):
+    """Schrijf één variant (draait in een werkproces)."""
+    from PIL import Image, ImageOps
+
+    _, pil_format, _ = FORMATS[fmt]
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        options = {"quality": quality}
+        if fmt == "jpeg":
+            options.update(optimize=True, progressive=True)
+        elif fmt == "webp":
+            options["method"] = 4
+        tmp = f"{target}.{os.getpid()}.tmp"
+        try:
+            img.save(tmp, pil_format, **options)
+            os.replace(tmp, target)
+        except BaseException:
+            # Geen half geschreven bestanden in de uitvoermap laten staan
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+    return target
+
+
+class ImagePipeline:
+    """Beheert varianten van de afbeeldingen in `source_dir`."""
+
+    def __init__(self, source_dir, output_dir, widths=(320, 640, 1280), qualities=(60, 85),
+                 workers=2, formats=None):
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.widths = tuple(sorted(widths))
+        self.qualities = tuple(sorted(qualities))
+        self.workers = workers
+        self._formats = formats
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._hashes = {}
+
+    @classmethod
+    def from_env(cls, root):
+        def numbers(name, default):
+            return tuple(int(v) for v in os.getenv(name, default).split(",") if v.strip())
+
+        return cls(
+            source_dir=os.getenv("IMAGE_SOURCE_DIR", os.path.join(root, "static", "images")),
+            output_dir=os.getenv("IMAGE_OUTPUT_DIR", os.path.join(root, "static", "compressed")),
+            widths=numbers("IMAGE_WIDTHS", "320,640,1280"),
+            qualities=numbers("IMAGE_QUALITIES", "60,85"),
+            workers=int(os.getenv("IMAGE_WORKERS", "2")),
+        )
+
+    @property
+    def formats(self):
+        if self._formats is None:
+            self._formats = available_formats()
+        return self._formats
+
+    def source_path(self, filename):
+        """Pad naar een bronbestand; FileNotFoundError als het niet bestaat."""
+        if os.path.basename(filename) != filename or filename.startswith("."):
+            raise FileNotFoundError(filename)
+        path = os.path.join(self.source_dir, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(filename)
+        return path
+
+    def content_hash(self, filename):
+        """Korte hash van de broninhoud, onthouden zolang mtime en grootte gelijk blijven."""
+        path = self.source_path(filename)
+        stat = os.stat(path)
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        value = digest.hexdigest()[:16]
+        self._hashes[filename] = ((stat.st_mtime_ns, stat.st_size), value)
+        return value
+
+    def choose(self, width=None, fmt=None, quality=None, accept=""):
+        """Zet een verzoek om naar een van de vooraf bepaalde varianten."""
+        if width is not None:
+            width = next((w for w in self.widths if w >= width), None)
+        if fmt is None:
+            fmt = next((f for f in self.formats if FORMATS[f][2] in accept), "jpeg")
+        elif fmt not in self.formats:
+            raise ValueError(f"Formaat niet beschikbaar: {fmt}")
+        if quality is None:
+            quality = self.qualities[-1]
+        else:
+            quality = next((q for q in self.qualities if q >= quality), self.qualities[-1])
+        return width, fmt, quality
+
+    def variant_name(self, filename, width, fmt, quality):
+        stem = os.path.splitext(filename)[0]
+        size = f"{width}w" if width else "orig"
+        return f"{stem}-{self.content_hash(filename)}-{size}-q{quality}.{FORMATS[fmt][0]}"
+
+    def variant_path(self, name):
+        """Pad naar een bestaande variant op naam; FileNotFoundError anders."""
+        path = os.path.join(self.output_dir, name)
+        if not VARIANT_NAME.match(name) or not os.path.isfile(path):
+            raise FileNotFoundError(name)
+        return path
+
+    def _submit(self, filename, width, fmt, quality):
+        name = self.variant_name(filename, width, fmt, quality)
+        target = os.path.join(self.output_dir, name)
+        if os.path.exists(target):
+            return target, None
+        with self._lock:
+            future = self._inflight.get(target)
+            if future is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                future = self._pool_unlocked().submit(
+                    encode_variant, self.source_path(filename), target, width, fmt, quality
+                )
+                self._inflight[target] = future
+                future.add_done_callback(lambda _: self._forget(target))
+        return target, future
+
+    def _pool_unlocked(self):
+        if self._executor is None:
+            import multiprocessing  # trekt multiprocessing mee; pas bij gebruik
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Niet forken: de worker heeft dan al threads (HTTP-pool, verversers) en locks
+            # die in een kopie halverwege vast kunnen zitten.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def _forget(self, target):
+        with self._lock:
+            self._inflight.pop(target, None)
+
+    def get(self, filename, width=None, fmt=None, quality=None, accept=""):
+        """Geef het pad naar de gevraagde variant, en maak hem zo nodig aan."""
+        width, fmt, quality = self.choose(width, fmt, quality, accept)
+        target, future = self._submit(filename, width, fmt, quality)
+        if future is not None:
+            future.result()
+        return target
+
+    def warm(self, filename):
+        """Plan alle varianten van één bron in zonder te wachten."""
+        futures = []
+        for width in self.widths + (None,):
+            for fmt in self.formats:
+                for quality in self.qualities:
+                    _, future = self._submit(filename, width, fmt, quality)
+                    if future is not None:
+                        futures.append(future)
+        return futures
+
+    def _sources(self):
+        try:
+            names = sorted(os.listdir(self.source_dir))
+        except FileNotFoundError:
+            return []
+        return [name for name in names if name.lower().endswith(SOURCE_EXTENSIONS)]
+
+    def warm_all(self):
+        """Plan varianten in voor alle bronbestanden (bijvoorbeeld bij het opstarten)."""
+        futures = []
+        for name in self._sources():
+            futures.extend(self.warm(name))
+        logger.info(f"{len(futures)} afbeeldingsvarianten ingepland")
+        return futures
+
+    def warm_once(self):
+        """Zoals `warm_all`, maar één keer per stand van de bronmap voor alle workers samen.
+
+        De worker die als eerste het slotbestand voor deze stand aanmaakt doet
+        het werk en wacht tot alle varianten er zijn; de andere slaan over.
+        Pas als alles gelukt is komt er een markeerbestand; bij een fout
+        verdwijnt het slot weer, en het slot van een gecrashte worker vervalt
+        na `PREWARM_LOCK_TIMEOUT`. Verandert er een bron, dan hoort er een
+        nieuw markeerbestand bij en wordt er opnieuw voorverwarmd.
+        """
+        names = self._sources()
+        state = hashlib.sha256()
+        for name in names:
+            stat = os.stat(os.path.join(self.source_dir, name))
+            state.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+        marker = f"{PREWARM_MARKER}{state.hexdigest()[:16]}"
+        done = os.path.join(self.output_dir, marker)
+        lock = f"{done}.lock"
+        os.makedirs(self.output_dir, exist_ok=True)
+        if os.path.exists(done) or not self._acquire(lock):
+            logger.info("Afbeeldingsvarianten al (of nu) voorverwarmd door een andere worker")
+            return []
+        try:
+            futures = self.warm_all()
+            wait(futures)
+            failed = [f for f in futures if f.cancelled() or f.exception() is not None]
+            if failed:
+                logger.warning(f"Voorverwarmen: {len(failed)} van {len(futures)} varianten mislukt")
+                return futures
+            os.close(os.open(done, os.O_CREAT | os.O_WRONLY))
+            for old in os.listdir(self.output_dir):
+                if old.startswith(PREWARM_MARKER) and old != marker and not old.endswith(".lock"):
+                    try:
+                        os.remove(os.path.join(self.output_dir, old))
+                    except FileNotFoundError:
+                        pass
+            return futures
+        finally:
+            os.remove(lock)
+
+    @staticmethod
+    def _acquire(lock):
+        """Maak het slotbestand exclusief aan; een verlopen slot wordt één keer overgenomen."""
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) < PREWARM_LOCK_TIMEOUT:
+                        return False
+                    os.remove(lock)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,132 @@
+"""Meetpunten voor de Flask-app: duur per endpoint en per fase, fouten en profilering.
+
+`instrument_app(app)` hangt hooks aan de app die per verzoek de duur en het
+aantal lopende verzoeken bijhouden. De fasen van `/comment` (geosearch,
+samenvatting, prompt, OpenAI en totaal) worden in `app.py` zelf gemeten met
+`COMMENT_STAGES.time(stage=...)`, zodat zichtbaar is wie een traag antwoord
+veroorzaakt. `COMMENT_TIERS` telt uit welke laag het antwoord kwam (verse of
+verlopen cache, een nieuwe completion, de lokale persona-regel of het
+standaardantwoord).
+
+Profileren per verzoek staat standaard uit. Met `PROFILING=1` profileert een
+verzoek met de header `X-Profile: 1`; met `PROFILE_SAMPLE_RATE` (0..1) wordt
+daarnaast een steekproef genomen. De cProfile-uitvoer komt in `PROFILE_DIR`
+en de duurste functies worden gelogd.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import tempfile
+import time
+import uuid
+
+from flask import g, request
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUESTS = Histogram(
+    "travelbot_http_request_seconds", "Duur van HTTP-verzoeken per endpoint en status",
+    labelnames=("endpoint", "method", "status"), buckets=STAGE_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "travelbot_http_in_flight", "Aantal HTTP-verzoeken dat nu wordt afgehandeld",
+    labelnames=("endpoint",),
+)
+COMMENT_STAGES = Histogram(
+    "travelbot_comment_stage_seconds",
+    "Duur per fase van een opmerking: geosearch, summary, prompt, openai, chat en total",
+    labelnames=("stage",), buckets=STAGE_BUCKETS,
+)
+COMMENT_TIERS = Counter(
+    "travelbot_comment_tier_total",
+    "Opmerkingen per laag: fresh, partial, stale, live, template of error (standaardantwoord)",
+    labelnames=("tier",),
+)
+GENERATIONS_AVOIDED = Counter(
+    "travelbot_generations_avoided_total",
+    "Opmerkingen zonder nieuwe generatie omdat er niets nieuws was, per reden (stationary, same_place) "
+    "en antwoord (variant of nothing_new)",
+    labelnames=("reason", "reply"),
+)
+UPSTREAM_ERRORS = Counter(
+    "travelbot_upstream_errors_total", "Mislukte upstream-aanroepen per dienst en reden",
+    labelnames=("upstream", "reason"),
+)
+
+
+class RequestProfiler:
+    """Profileert geselecteerde verzoeken met cProfile."""
+
+    def __init__(self, enabled=False, sample_rate=0.0, directory=None, top=15):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "travelbot-profiles")
+        self.top = top
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv("PROFILING", "0").lower() in ("1", "true", "yes"),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            directory=os.getenv("PROFILE_DIR"),
+        )
+
+    def wants(self, headers):
+        """Moet dit verzoek geprofileerd worden?"""
+        if self.enabled and headers.get("X-Profile") == "1":
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def finish(self, profile, endpoint):
+        """Schrijf het profiel weg, log de duurste functies en geef het profiel-id terug."""
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+        logger.info(f"Profiel {profile_id}:\n{out.getvalue()}")
+        return profile_id
+
+
+def instrument_app(app, profiler=None):
+    """Registreer meet- en profileerhooks; roep aan vóór andere `before_request`-hooks."""
+    profiler = profiler or RequestProfiler.from_env()
+    app.extensions["travelbot_profiler"] = profiler
+
+    @app.before_request
+    def start_measurement():
+        g.metrics_endpoint = request.endpoint or "none"
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+        if profiler.wants(request.headers):
+            g.profile = cProfile.Profile()
+            g.profile.enable()
+
+    @app.after_request
+    def record_measurement(response):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.disable()
+            response.headers["X-Profile-Id"] = profiler.finish(profile, g.metrics_endpoint)
+        if "metrics_start" in g:
+            HTTP_REQUESTS.observe(time.perf_counter() - g.metrics_start, endpoint=g.metrics_endpoint,
+                                  method=request.method, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_measurement(exc):
+        if "metrics_endpoint" in g:
+            HTTP_IN_FLIGHT.dec(endpoint=g.pop("metrics_endpoint"))
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.disable()
+
+    return profiler
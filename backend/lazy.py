@@ -0,0 +1,39 @@
+"""Objecten die pas bij het eerste gebruik worden aangemaakt.
+
+Zware onderdelen (zoals de LLM-client) worden zo niet bij het importeren
+van de app opgebouwd, maar door de eerste aanroep die ze echt nodig heeft.
+"""
+
+import threading
+
+
+class Lazy:
+    """Proxy die bij het eerste attribuut-gebruik `factory()` aanroept en daarna doorverwijst.
+
+    Gooit de factory een uitzondering, dan wordt niets onthouden en komt
+    dezelfde uitzondering bij de volgende poging opnieuw.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._instance = None
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def resolve(self):
+        """Het echte object; wordt zo nodig eerst aangemaakt."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)  # bijv. bij kopiëren, vóór __init__
+        return getattr(self.resolve(), name)
@@ -0,0 +1,308 @@
+"""Client voor de OpenAI chat-completions API.
+
+Eén gedeelde `requests.Session` met een verbindingspool, vaste connect- en
+read-timeouts, exponentiële retries met jitter op 429/5xx en een semafoor
+die het aantal gelijktijdige completions begrenst. Zo kan één trage
+upstream-respons geen worker meer onbeperkt vasthouden.
+
+`achat` is de asynchrone tegenhanger voor de ASGI-modus: dezelfde retries
+en timeouts, maar over een gedeelde `httpx.AsyncClient` en met een eigen,
+ruimere limiet, omdat een wachtende coroutine geen thread bezet houdt.
+
+Met `budget` krijgt `chat` een totaal tijdsbudget in seconden: wachten op
+een plek, de read-timeout en de retries passen daarbinnen, anders volgt
+`LLMError("deadline")`.
+
+`requests` wordt pas bij het aanmaken van een client geïmporteerd, zodat een
+worker die geen completions doet er bij het opstarten niet op wacht.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LLM_LATENCY = Histogram(
+    "travelbot_llm_request_seconds", "Duur van chat-completions per uitkomst",
+    labelnames=("outcome",),
+)
+LLM_RETRIES = Counter(
+    "travelbot_llm_retries_total", "Aantal herhaalde chat-completions per reden",
+    labelnames=("reason",),
+)
+LLM_FIRST_TOKEN = Histogram(
+    "travelbot_llm_first_token_seconds", "Tijd tot het eerste token bij streamende completions",
+)
+LLM_IN_FLIGHT = Gauge(
+    "travelbot_llm_in_flight", "Aantal chat-completions dat nu een plek in de semafoor heeft",
+)
+LLM_FALLBACKS = Counter(
+    "travelbot_llm_fallbacks_total", "Aantal keer dat een standaardantwoord is teruggegeven",
+    labelnames=("reason",),
+)
+
+
+def remaining(deadline):
+    """Seconden tot `deadline` (een `time.monotonic()`-tijdstip), nooit negatief."""
+    return max(0.0, deadline - time.monotonic())
+
+
+class LLMError(Exception):
+    """Het taalmodel gaf geen bruikbaar antwoord; `reason` zegt waarom."""
+
+    def __init__(self, reason, message=""):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class LLMClient:
+    """Gepoolde, begrensde client voor chat-completions."""
+
+    def __init__(self, api_key, base_url="https://api.openai.com/v1", model="gpt-3.5-turbo",
+                 connect_timeout=3.05, read_timeout=30.0, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, max_in_flight=16, queue_timeout=5.0, pool_size=20,
+                 async_max_in_flight=256):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._async_semaphore = asyncio.Semaphore(async_max_in_flight)
+        self._api_key = api_key
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+
+    @classmethod
+    def from_env(cls, api_key):
+        """Maak een client aan met instellingen uit omgevingsvariabelen."""
+        return cls(
+            api_key,
+            base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("OPENAI_READ_TIMEOUT", "30")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+            max_in_flight=int(os.getenv("OPENAI_MAX_IN_FLIGHT", "16")),
+            queue_timeout=float(os.getenv("OPENAI_QUEUE_TIMEOUT", "5")),
+            pool_size=int(os.getenv("OPENAI_POOL_SIZE", "20")),
+            async_max_in_flight=int(os.getenv("OPENAI_ASYNC_MAX_IN_FLIGHT", "256")),
+        )
+
+    def backoff(self, attempt):
+        """Wachttijd voor poging `attempt` (0-based): exponentieel met volledige jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def chat(self, messages, temperature=0.8, budget=None):
+        """Vraag een completion op en geef de tekst van het antwoord terug.
+
+        Gooit `LLMError` als er binnen de limieten (en `budget` seconden) geen antwoord komt.
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+        self._acquire(deadline)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self._post_with_retries(
+                {"model": self.model, "messages": messages, "temperature": temperature},
+                deadline=deadline,
+            )
+            try:
+                content = response.json()["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError) as e:
+                raise LLMError("bad_response", str(e))
+            outcome = "ok"
+            return content
+        except LLMError as e:
+            outcome = e.reason
+            raise
+        finally:
+            self._semaphore.release()
+            LLM_IN_FLIGHT.dec()
+            LLM_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
+
+    def stream_chat(self, messages, temperature=0.8):
+        """Vraag een completion op met `stream: true` en geef tekstfragmenten
+        terug zodra ze binnenkomen.
+
+        Retries gebeuren alleen zolang er nog niets ontvangen is. De plek in
+        de semafoor blijft bezet tot de stream is afgelopen of gesloten.
+        """
+        import requests
+
+        self._acquire()
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self._post_with_retries(
+                {"model": self.model, "messages": messages, "temperature": temperature,
+                 "stream": True},
+                stream=True,
+            )
+            with response:
+                response.encoding = "utf-8"
+                first = True
+                try:
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                        except (ValueError, KeyError, IndexError) as e:
+                            raise LLMError("bad_response", str(e))
+                        if delta:
+                            if first:
+                                LLM_FIRST_TOKEN.observe(time.perf_counter() - start)
+                                first = False
+                            yield delta
+                except requests.RequestException as e:
+                    raise LLMError("stream_interrupted", str(e))
+            outcome = "ok"
+        except LLMError as e:
+            outcome = e.reason
+            raise
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._semaphore.release()
+            LLM_IN_FLIGHT.dec()
+            LLM_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
+
+    async def achat(self, http_client, messages, temperature=0.8):
+        """Asynchrone variant van `chat` over `http_client` (een `httpx.AsyncClient`)."""
+        try:
+            await asyncio.wait_for(self._async_semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            LLM_LATENCY.observe(0.0, outcome="rejected")
+            raise LLMError("overloaded", "te veel gelijktijdige completions")
+        LLM_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._apost_with_retries(
+                http_client, {"model": self.model, "messages": messages, "temperature": temperature}
+            )
+            try:
+                content = response.json()["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError) as e:
+                raise LLMError("bad_response", str(e))
+            outcome = "ok"
+            return content
+        except LLMError as e:
+            outcome = e.reason
+            raise
+        finally:
+            self._async_semaphore.release()
+            LLM_IN_FLIGHT.dec()
+            LLM_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
+
+    async def _apost_with_retries(self, http_client, payload):
+        url = f"{self.base_url}/chat/completions"
+        headers = {"Authorization": f"Bearer {self._api_key}"}
+        timeout = httpx.Timeout(self.timeout[1], connect=self.timeout[0], pool=self.queue_timeout)
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = await http_client.post(url, json=payload, headers=headers, timeout=timeout)
+            except httpx.TimeoutException as e:
+                if last:
+                    raise LLMError("timeout", str(e))
+                reason, delay = "timeout", self.backoff(attempt)
+            except httpx.TransportError as e:
+                if last:
+                    raise LLMError("connection_error", str(e))
+                reason, delay = "connection_error", self.backoff(attempt)
+            else:
+                if response.status_code in RETRY_STATUSES and not last:
+                    reason, delay = str(response.status_code), self._retry_delay(response, attempt)
+                elif response.status_code >= 400:
+                    raise LLMError(f"http_{response.status_code}", response.text[:200])
+                else:
+                    return response
+            LLM_RETRIES.inc(reason=reason)
+            logger.info(f"OpenAI-verzoek mislukt ({reason}), nieuwe poging over {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _acquire(self, deadline=None):
+        timeout = self.queue_timeout if deadline is None else min(self.queue_timeout, remaining(deadline))
+        if not self._semaphore.acquire(timeout=timeout):
+            LLM_LATENCY.observe(0.0, outcome="rejected")
+            raise LLMError("overloaded", "te veel gelijktijdige completions")
+        LLM_IN_FLIGHT.inc()
+
+    def _post_with_retries(self, payload, stream=False, deadline=None):
+        """POST naar chat/completions; geeft de eerste geslaagde respons terug."""
+        import requests
+
+        url = f"{self.base_url}/chat/completions"
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            timeout = self.timeout
+            if deadline is not None:
+                left = remaining(deadline)
+                if left <= 0:
+                    raise LLMError("deadline", "tijdsbudget op")
+                timeout = (min(self.timeout[0], left), min(self.timeout[1], left))
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+            except requests.Timeout as e:
+                if deadline is not None and remaining(deadline) <= 0:
+                    raise LLMError("deadline", str(e))
+                if last:
+                    raise LLMError("timeout", str(e))
+                reason, delay = "timeout", self.backoff(attempt)
+            except requests.ConnectionError as e:
+                if last:
+                    raise LLMError("connection_error", str(e))
+                reason, delay = "connection_error", self.backoff(attempt)
+            else:
+                if response.status_code in RETRY_STATUSES and not last:
+                    reason, delay = str(response.status_code), self._retry_delay(response, attempt)
+                    response.close()
+                elif response.status_code >= 400:
+                    detail = response.text[:200]
+                    response.close()
+                    raise LLMError(f"http_{response.status_code}", detail)
+                else:
+                    return response
+            if deadline is not None and delay >= remaining(deadline):
+                raise LLMError("deadline", f"geen tijd meer voor een nieuwe poging na {reason}")
+            LLM_RETRIES.inc(reason=reason)
+            logger.info(f"OpenAI-verzoek mislukt ({reason}), nieuwe poging over {delay:.2f}s")
+            time.sleep(delay)
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return self.backoff(attempt)
@@ -0,0 +1,324 @@
+"""Doorzoekbare catalogus van persona's voor /marketplace, in een SQLite-index met FTS5.
+
+De JSON-bestanden in `marketplace/` en `personas/` blijven de bron. De
+index houdt per bestand mtime en grootte bij; `sync` doet alleen een
+`scandir` en parseert uitsluitend nieuwe of gewijzigde bestanden, en
+`upload_persona` zet een upload meteen zelf in de index. Het bestand staat
+standaard in de tijdelijke map (niet in de broncode) en wordt door alle
+workers gedeeld.
+
+Een lijst wordt opgevraagd per pagina met een cursor (keyset: de
+sorteersleutel en het id van het laatste item), zodat ook pagina 500 één
+indexzoekactie kost. Zoeken gaat met FTS5 over naam, beschrijving en
+kenmerken. Elke wijziging verhoogt een versienummer in de database;
+pagina's worden per versie en vraag als JSON én gzip bewaard, met een
+ETag, zodat een herhaalde vraag niets meer hoeft op te bouwen.
+"""
+
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from persona_registry import Persona
+
+logger = logging.getLogger(__name__)
+
+SORTS = ("name", "newest", "relevance")
+MAX_QUERY_TERMS = 8
+GZIP_MIN_SIZE = 256
+
+# Gewichten voor bm25 per kolom: een treffer in de naam telt het zwaarst
+BM25_WEIGHTS = (10.0, 2.0, 1.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    description TEXT NOT NULL,
+    traits TEXT NOT NULL,
+    traits_json TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    UNIQUE (source, slug)
+);
+CREATE INDEX IF NOT EXISTS catalog_name ON catalog (name_key, id);
+CREATE INDEX IF NOT EXISTS catalog_newest ON catalog (mtime_ns, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+    name, description, traits,
+    content='catalog', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS catalog_ai AFTER INSERT ON catalog BEGIN
+    INSERT INTO catalog_fts (rowid, name, description, traits)
+    VALUES (new.id, new.name, new.description, new.traits);
+END;
+CREATE TRIGGER IF NOT EXISTS catalog_ad AFTER DELETE ON catalog BEGIN
+    INSERT INTO catalog_fts (catalog_fts, rowid, name, description, traits)
+    VALUES ('delete', old.id, old.name, old.description, old.traits);
+END;
+CREATE TRIGGER IF NOT EXISTS catalog_au AFTER UPDATE ON catalog BEGIN
+    INSERT INTO catalog_fts (catalog_fts, rowid, name, description, traits)
+    VALUES ('delete', old.id, old.name, old.description, old.traits);
+    INSERT INTO catalog_fts (rowid, name, description, traits)
+    VALUES (new.id, new.name, new.description, new.traits);
+END;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+UPSERT = (
+    "INSERT INTO catalog (source, slug, name, name_key, description, traits, traits_json, mtime_ns, size) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (source, slug) DO UPDATE SET name = excluded.name, name_key = excluded.name_key, "
+    "description = excluded.description, traits = excluded.traits, traits_json = excluded.traits_json, "
+    "mtime_ns = excluded.mtime_ns, size = excluded.size"
+)
+
+Listing = namedtuple("Listing", "body gzipped etag")
+
+
+def traits_text(traits):
+    """Kenmerken als platte tekst voor de zoekindex: sleutels en waarden achter elkaar."""
+    words = []
+    for key, value in traits.items():
+        words.append(str(key))
+        if isinstance(value, (list, tuple)):
+            words.extend(str(v) for v in value)
+        else:
+            words.append(str(value))
+    return " ".join(words)
+
+
+def match_query(text):
+    """Zet vrije invoer om naar een veilige FTS5-vraag: alle woorden, elk als prefix."""
+    terms = re.findall(r"\w+", text or "")[:MAX_QUERY_TERMS]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(sort, key, row_id):
+    raw = json.dumps([sort, key, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    """Geef `(sleutel, id)` uit een cursor terug; ValueError als hij niet bij `sort` hoort."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, row_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Ongeldige cursor") from None
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise ValueError("Cursor hoort bij een andere sortering")
+    return key, row_id
+
+
+def _row(source, slug, persona, stat):
+    return (source, slug, persona.name, persona.name.casefold(), persona.description,
+            traits_text(persona.traits), json.dumps(dict(persona.traits), ensure_ascii=False),
+            stat.st_mtime_ns, stat.st_size)
+
+
+class MarketplaceIndex:
+    """Persistente catalogus met zoeken, sorteren en cursorpaginering; thread-safe."""
+
+    def __init__(self, path, directories, sync_interval=10.0, page_size=20, max_page_size=100,
+                 cache_size=256, clock=time.monotonic):
+        self.path = path
+        self.directories = dict(directories)
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.cache_size = cache_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = float("-inf")
+        self._skipped = {}
+        self._pages = OrderedDict()
+        self.parsed = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls, directories):
+        return cls(
+            os.getenv("MARKETPLACE_INDEX_PATH",
+                      os.path.join(tempfile.gettempdir(), "travelbot-marketplace-index.sqlite3")),
+            directories,
+            sync_interval=float(os.getenv("MARKETPLACE_SYNC_INTERVAL", "10")),
+            page_size=int(os.getenv("MARKETPLACE_PAGE_SIZE", "20")),
+            max_page_size=int(os.getenv("MARKETPLACE_MAX_PAGE_SIZE", "100")),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM catalog").fetchone()[0]
+
+    def version(self):
+        """Versienummer dat bij elke wijziging in de catalogus (door welke worker ook) omhooggaat."""
+        with self._lock:
+            return self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _write(self, upserts=(), deletes=()):
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, upserts)
+            self._db.executemany("DELETE FROM catalog WHERE source = ? AND slug = ?", deletes)
+            self._db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def add(self, source, slug, data, stat):
+        """Zet één persona (de inhoud van `<slug>.json` met `os.stat`-resultaat `stat`) in de index."""
+        self._write(upserts=[_row(source, slug, Persona.from_dict(data, slug, source), stat)])
+
+    def sync(self, force=False):
+        """Breng de index gelijk met de bestanden; geeft het aantal gewijzigde persona's terug.
+
+        Zonder `force` gebeurt dat hooguit eens per `sync_interval` seconden.
+        Alleen bestanden met een andere mtime of grootte worden geparsed.
+        """
+        if not force and self._clock() - self._synced_at < self.sync_interval:
+            return 0
+        with self._sync_lock:
+            if not force and self._clock() - self._synced_at < self.sync_interval:
+                return 0
+            on_disk = {}
+            for source, directory in self.directories.items():
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            if entry.name.endswith(".json"):
+                                on_disk[(source, entry.name[:-len(".json")])] = entry
+                except FileNotFoundError:
+                    continue
+            with self._lock:
+                known = {(source, slug): (mtime_ns, size) for source, slug, mtime_ns, size in
+                         self._db.execute("SELECT source, slug, mtime_ns, size FROM catalog")}
+
+            upserts = []
+            for key, entry in on_disk.items():
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if known.get(key) == signature or self._skipped.get(key) == signature:
+                    continue
+                source, slug = key
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        upserts.append(_row(source, slug, Persona.from_dict(json.load(f), slug, source), stat))
+                    self._skipped.pop(key, None)
+                except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                    self._skipped[key] = signature
+                    logger.warning(f"Persona {entry.path} niet in de marketplace-index: {e}")
+                self.parsed += 1
+            deletes = [key for key in known if key not in on_disk]
+            if upserts or deletes:
+                self._write(upserts, deletes)
+                logger.info(f"Marketplace-index bijgewerkt: {len(upserts)} nieuw of gewijzigd, "
+                            f"{len(deletes)} verwijderd")
+            self._synced_at = self._clock()
+            return len(upserts) + len(deletes)
+
+    def search(self, q=None, sort=None, cursor=None, limit=None, source=None):
+        """Eén pagina als dict met `items`, `total`, `sort` en `next_cursor` (None op de laatste pagina).
+
+        Zonder `sort` wordt met een zoekterm op relevantie gesorteerd en anders
+        op naam. Ongeldige parameters geven een ValueError.
+        """
+        match = match_query(q)
+        sort = sort or ("relevance" if match else "name")
+        if sort not in SORTS:
+            raise ValueError(f"Onbekende sortering {sort!r}; kies uit {', '.join(SORTS)}")
+        if sort == "relevance" and not match:
+            raise ValueError("Sorteren op relevantie kan alleen met een zoekterm")
+        limit = min(max(1, limit or self.page_size), self.max_page_size)
+
+        if match:
+            base = ("FROM catalog_fts JOIN catalog c ON c.id = catalog_fts.rowid "
+                    "WHERE catalog_fts MATCH ?")
+            params = [match]
+        else:
+            base, params = "FROM catalog c WHERE 1", []
+        if source:
+            base += " AND c.source = ?"
+            params.append(source)
+        key = {
+            "name": "c.name_key",
+            "newest": "c.mtime_ns",
+            "relevance": "bm25(catalog_fts, {}, {}, {})".format(*BM25_WEIGHTS),
+        }[sort]
+        # Nieuwste eerst loopt aflopend, de rest oplopend
+        order, compare = ("DESC", "<") if sort == "newest" else ("ASC", ">")
+        query = (f"SELECT * FROM (SELECT c.id, c.source, c.slug, c.name, c.description, c.traits_json, "
+                 f"{key} AS sort_key {base})")
+        page_params = list(params)
+        if cursor:
+            query += f" WHERE (sort_key, id) {compare} (?, ?)"
+            page_params.extend(decode_cursor(cursor, sort))
+        query += f" ORDER BY sort_key {order}, id {order} LIMIT ?"
+        page_params.append(limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(query, page_params).fetchall()
+            total = self._db.execute(f"SELECT count(*) {base}", params).fetchone()[0]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": [
+                {"name": name, "description": description, "slug": slug, "source": row_source,
+                 "traits": json.loads(traits)}
+                for _, row_source, slug, name, description, traits, _ in rows
+            ],
+            "total": total,
+            "sort": sort,
+            "next_cursor": encode_cursor(sort, rows[-1][6], rows[-1][0]) if more else None,
+        }
+
+    def listing(self, q=None, sort=None, cursor=None, limit=None, source=None):
+        """Zoals `search`, maar als kant-en-klare `Listing` (JSON, gzip of None, ETag).
+
+        Pagina's worden per versie van de catalogus bewaard; na een wijziging
+        hoort een vraag bij een nieuwe versie en wordt hij opnieuw opgebouwd.
+        """
+        self.sync()
+        cache_key = (self.version(), match_query(q), sort, cursor, limit, source)
+        with self._lock:
+            listing = self._pages.get(cache_key)
+            if listing is not None:
+                self._pages.move_to_end(cache_key)
+                self.hits += 1
+                return listing
+            self.misses += 1
+        body = json.dumps(self.search(q, sort, cursor, limit, source), ensure_ascii=False).encode("utf-8")
+        gzipped = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+        listing = Listing(body, gzipped, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            self._pages[cache_key] = listing
+            while len(self._pages) > self.cache_size:
+                self._pages.popitem(last=False)
+        return listing
+
+    def stats(self):
+        personas = len(self)
+        with self._lock:
+            return {
+                "personas": personas,
+                "pages_cached": len(self._pages),
+                "hits": self.hits,
+                "misses": self.misses,
+                "parsed": self.parsed,
+                "skipped": len(self._skipped),
+            }
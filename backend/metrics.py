@@ -0,0 +1,197 @@
+"""Lichtgewicht metrics: tellers, gauges en histogrammen met labels.
+
+Alle metrics registreren zich in `REGISTRY`; `render()` zet ze om naar het
+tekstformaat van Prometheus voor het `/metrics`-endpoint. Een metric met een
+`callback` heeft geen eigen staat maar leest bij elke uitlezing een bron uit,
+bijvoorbeeld de tellers van een cache.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Registry:
+    """Verzameling van alle metrics in dit proces, op naam."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._metrics.values()))
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} verwacht labels {self.labelnames}, kreeg {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Geef `(labels, waarde)`-paren terug voor alle labelcombinaties."""
+        if self.callback is not None:
+            return list(self.callback())
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Teller die alleen omhoog kan."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Waarde die op en neer kan, zoals het aantal lopende verzoeken."""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Verhoog de gauge zolang het blok loopt."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Verdeling van waarnemingen (bijv. latency in seconden) over vaste buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1),
+                                             "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Meet de duur van het blok, ook als het een uitzondering gooit."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """Cumulatieve bucket-tellingen plus som en aantal voor één labelset."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            counts = state["counts"] if state else [0] * (len(self.buckets) + 1)
+            total, cumulative = 0, {}
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                cumulative[bound] = total
+            return {
+                "buckets": cumulative,
+                "sum": state["sum"] if state else 0.0,
+                "count": state["count"] if state else 0,
+            }
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def render(registry=REGISTRY):
+    """Alle metrics in het tekstformaat van Prometheus (versie 0.0.4)."""
+    lines = []
+    for metric in registry:
+        help_text = metric.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        lines.append(f"# HELP {metric.name} {help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        if isinstance(metric, Histogram):
+            for labels, _ in metric.samples():
+                snapshot = metric.snapshot(**labels)
+                for bound, count in snapshot["buckets"].items():
+                    le = _format_value(float(bound))
+                    lines.append(f"{metric.name}_bucket{_labels(labels, {'le': le})} {count}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {_format_value(snapshot['sum'])}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {snapshot['count']}")
+        else:
+            for labels, value in metric.samples():
+                lines.append(f"{metric.name}{_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,156 @@
+"""Register van alle persona's, één keer ingelezen en in het geheugen gehouden.
+
+De JSON-bestanden in `personas/` en `marketplace/` worden bij de eerste
+vraag geparsed tot onveranderlijke `Persona`-objecten. De lijsten voor de
+endpoints worden meteen als JSON-body met ETag klaargezet. Wijzigt er een
+bestand (andere mtime of grootte), of roept `upload_persona` `invalidate()`
+aan, dan wordt het register bij de volgende vraag opnieuw opgebouwd.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+def slugify(name):
+    """Bestandsnaam voor een persona: 'Sergio Herman' wordt 'sergio_herman'."""
+    return re.sub(r"[^\w-]+", "_", name.strip().lower()).strip("_")
+
+
+def _render_traits(traits):
+    parts = []
+    for key, value in traits.items():
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(v) for v in value)
+        parts.append(f"{key}: {value}")
+    return "; ".join(parts)
+
+
+@dataclass(frozen=True)
+class Persona:
+    """Eén persona zoals ingelezen uit JSON, met voorgecompileerde prompttekst."""
+
+    slug: str
+    name: str
+    description: str
+    traits: MappingProxyType
+    source: str
+    prompt: str
+    raw: MappingProxyType
+
+    @classmethod
+    def from_dict(cls, data, slug, source):
+        traits = MappingProxyType(dict(data.get("traits") or {}))
+        description = data.get("description", "")
+        prompt = description
+        if traits:
+            prompt += f"\nKenmerken: {_render_traits(traits)}."
+        return cls(slug=slug, name=data["name"], description=description, traits=traits,
+                   source=source, prompt=prompt, raw=MappingProxyType(dict(data)))
+
+    def summary(self):
+        return {"name": self.name, "description": self.description}
+
+    def to_dict(self):
+        """Het persona-object zoals het in het JSON-bestand staat."""
+        return dict(self.raw)
+
+
+class _Snapshot:
+    """Onveranderlijke stand van het register; wordt in zijn geheel vervangen."""
+
+    def __init__(self, personas, signature):
+        self.signature = signature
+        self.personas = tuple(personas)
+        self.by_key = {}
+        for persona in self.personas:
+            for key in (persona.slug, persona.name.lower()):
+                self.by_key.setdefault((persona.source, key), persona)
+        self.listings = {}
+        for source in {p.source for p in self.personas}:
+            body = json.dumps(
+                [p.summary() for p in self.personas if p.source == source], ensure_ascii=False
+            ).encode("utf-8")
+            self.listings[source] = (body, hashlib.sha1(body).hexdigest())
+
+
+class PersonaRegistry:
+    """Persona's uit een of meer mappen, met herladen bij wijzigingen."""
+
+    def __init__(self, directories, check_interval=2.0):
+        self.directories = dict(directories)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = float("-inf")
+
+    def _signature(self):
+        entries = []
+        for source, directory in sorted(self.directories.items()):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.name.endswith(".json"):
+                            stat = entry.stat()
+                            entries.append((source, entry.name, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                continue
+        return tuple(sorted(entries))
+
+    def _load(self, signature):
+        personas = []
+        for source, filename, _, _ in signature:
+            path = os.path.join(self.directories[source], filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                personas.append(Persona.from_dict(data, filename[:-len(".json")], source))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Persona {path} overgeslagen: {e}")
+        logger.info(f"Persona-register geladen: {len(personas)} persona's")
+        return _Snapshot(personas, signature)
+
+    def snapshot(self):
+        """Geef de actuele stand terug en herlaad als er bestanden gewijzigd zijn."""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not snapshot:
+                return self._snapshot
+            signature = self._signature()
+            if snapshot is None or signature != snapshot.signature:
+                self._snapshot = self._load(signature)
+            self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self):
+        """Forceer een controle op wijzigingen bij de volgende vraag."""
+        with self._lock:
+            self._checked_at = float("-inf")
+
+    def get(self, name, source="personas"):
+        """Zoek een persona op bestandsnaam of (hoofdletterongevoelig) op naam."""
+        if not name:
+            return None
+        by_key = self.snapshot().by_key
+        return by_key.get((source, name)) or by_key.get((source, name.lower()))
+
+    def all(self, source="personas"):
+        return [p for p in self.snapshot().personas if p.source == source]
+
+    def listing(self, source="personas"):
+        """Voorgebouwde JSON-body met `name` en `description` plus ETag."""
+        return self.snapshot().listings.get(source, (b"[]", hashlib.sha1(b"[]").hexdigest()))
+
+    def directory(self, source="personas"):
+        return self.directories[source]
@@ -0,0 +1,187 @@
+"""Lokale POI-index als vervanging van de live Wikipedia-geosearch.
+
+Voor ons dekkingsgebied (NL/BE) passen alle artikelen met coördinaten op
+schijf. De index is een rasterindeling over NumPy-arrays: de punten staan
+gesorteerd per rastercel, met een gesorteerde lijst celsleutels en
+startposities. Een nearest-neighbour-vraag zoekt de paar cellen rond het
+punt op met `searchsorted` en rekent alleen die afstanden uit.
+
+Alle arrays worden met `mmap_mode='r'` geladen, zodat meerdere workers
+dezelfde pagina's uit de page cache delen.
+
+Opbouwen uit een dump (JSON-regels met title, lat, lon en summary):
+    python backend/poi_index.py build dump.jsonl data/poi-index --bbox 49.4 2.5 53.6 7.3
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+FORMAT_VERSION = 1
+
+
+def _cell_keys(lat, lon, cell_size):
+    """Vectoriseerbare celsleutel: rij in de hoge, kolom in de lage 32 bits."""
+    rows = np.floor(np.asarray(lat, dtype=np.float64) / cell_size).astype(np.int64)
+    cols = np.floor(np.asarray(lon, dtype=np.float64) / cell_size).astype(np.int64)
+    return (rows << 32) | (cols & 0xFFFFFFFF)
+
+
+class POIIndex:
+    """Alleen-lezen rasterindex met titels, coördinaten en samenvattingen."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Onbekende POI-indexversie in {path}: {meta.get('version')}")
+        self.cell_size = meta["cell_size"]
+        self.bboxes = [tuple(b) for b in meta["bboxes"]]
+        self.coords = np.load(os.path.join(path, "coords.npy"), mmap_mode="r")
+        self.cells = np.load(os.path.join(path, "cells.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+        self.text = np.memmap(os.path.join(path, "text.bin"), dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self.coords)
+
+    def covers(self, lat, lon):
+        """Valt het punt binnen het gebied waarvoor de index compleet is?"""
+        return any(s <= lat <= n and w <= lon <= e for s, w, n, e in self.bboxes)
+
+    def entry(self, i):
+        """Geef `(titel, samenvatting)` van item `i` terug."""
+        start, end = int(self.text_offsets[i]), int(self.text_offsets[i + 1])
+        title, _, summary = bytes(self.text[start:end]).decode("utf-8").partition("\x1f")
+        return title, summary
+
+    def nearest(self, lat, lon, radius=10000):
+        """Index van het dichtstbijzijnde item binnen `radius` meter, of None."""
+        dlat = radius / EARTH_RADIUS * 180 / math.pi
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        reach_rows = math.ceil(dlat / self.cell_size)
+        reach_cols = math.ceil(dlon / self.cell_size)
+        row = math.floor(lat / self.cell_size)
+        col = math.floor(lon / self.cell_size)
+
+        rows = np.arange(row - reach_rows, row + reach_rows + 1, dtype=np.int64)
+        cols = np.arange(col - reach_cols, col + reach_cols + 1, dtype=np.int64)
+        wanted = ((rows[:, None] << 32) | (cols[None, :] & 0xFFFFFFFF)).ravel()
+        found = np.searchsorted(self.cells, wanted)
+        inside = found < len(self.cells)
+        found, wanted = found[inside], wanted[inside]
+        hits = found[self.cells[found] == wanted]
+        if not len(hits):
+            return None
+
+        candidates = np.concatenate([
+            np.arange(self.offsets[h], self.offsets[h + 1]) for h in hits
+        ])
+        points = self.coords[candidates]
+        lat1 = math.radians(lat)
+        lat2 = np.radians(points[:, 0])
+        dphi = lat2 - lat1
+        dlambda = np.radians(points[:, 1] - lon)
+        a = np.sin(dphi / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlambda / 2) ** 2
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+        best = int(np.argmin(distances))
+        if distances[best] > radius:
+            return None
+        return int(candidates[best])
+
+    def lookup(self, lat, lon, radius=10000):
+        """Geef `(titel, samenvatting)` van het dichtstbijzijnde item, of None."""
+        i = self.nearest(lat, lon, radius)
+        return None if i is None else self.entry(i)
+
+
+def build_index(records, path, cell_size=0.05, bboxes=None):
+    """Schrijf een index naar `path` uit een iterable van dicts met
+    title, lat, lon en (optioneel) summary."""
+    titles, lats, lons, summaries = [], [], [], []
+    for record in records:
+        titles.append(record["title"])
+        lats.append(float(record["lat"]))
+        lons.append(float(record["lon"]))
+        summaries.append(record.get("summary") or "")
+    if not titles:
+        raise ValueError("De dump bevat geen items")
+
+    lat = np.array(lats, dtype=np.float64)
+    lon = np.array(lons, dtype=np.float64)
+    keys = _cell_keys(lat, lon, cell_size)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    cells, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+
+    text_offsets = [0]
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "text.bin"), "wb") as f:
+        for i in order:
+            blob = f"{titles[i]}\x1f{summaries[i]}".encode("utf-8")
+            f.write(blob)
+            text_offsets.append(text_offsets[-1] + len(blob))
+
+    np.save(os.path.join(path, "coords.npy"), np.column_stack([lat[order], lon[order]]))
+    np.save(os.path.join(path, "cells.npy"), cells)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "text_offsets.npy"), np.array(text_offsets, dtype=np.int64))
+    if not bboxes:
+        bboxes = [(float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max()))]
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": FORMAT_VERSION, "cell_size": cell_size, "count": len(titles),
+                   "bboxes": [list(b) for b in bboxes]}, f)
+    return len(titles)
+
+
+def read_dump(path):
+    """Lees een dump met één JSON-object per regel."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bouw of bevraag de lokale POI-index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="bouw een index uit een JSON-regels-dump")
+    build.add_argument("dump")
+    build.add_argument("output")
+    build.add_argument("--cell-size", type=float, default=0.05, help="celgrootte in graden")
+    build.add_argument("--bbox", type=float, nargs=4, action="append",
+                       metavar=("ZUID", "WEST", "NOORD", "OOST"),
+                       help="gebied waarvoor de dump compleet is (herhaalbaar)")
+
+    query = commands.add_parser("query", help="zoek het dichtstbijzijnde item")
+    query.add_argument("index")
+    query.add_argument("lat", type=float)
+    query.add_argument("lon", type=float)
+    query.add_argument("--radius", type=float, default=10000)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        count = build_index(read_dump(args.dump), args.output, args.cell_size, args.bbox)
+        print(f"{count} items geschreven naar {args.output}")
+        return 0
+
+    index = POIIndex(args.index)
+    result = index.lookup(args.lat, args.lon, args.radius)
+    if result is None:
+        print("Niets gevonden binnen de straal.")
+        return 1
+    print(f"{result[0]}: {result[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Vooruit ophalen van plekken langs de route.
+
+De client kent zijn koers en snelheid (en soms de geplande route). Uit die
+gegevens berekent `ahead_points` waar de reiziger over één, twee, ...
+minuten is. Per punt zet de app een taak in een `PrefetchQueue`, die op
+de achtergrond de samenvatting ophaalt en de pool met opmerkingen vult,
+zodat de volgende `/comment` voor die plek uit de cache komt.
+
+De wachtrij is begrensd en geordend op aankomsttijd: wat het eerst bereikt
+wordt gaat voor. Is hij vol, dan valt de taak met de verste aankomsttijd
+eruit, en een taak waarvan de plek al gepasseerd is wordt overgeslagen.
+Zo verdringt vooruit ophalen onder load nooit het echte werk.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+from geo_proxy import distance_m
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TASKS = Counter(
+    "travelbot_prefetch_tasks_total",
+    "Prefetch-taken per uitkomst (queued, duplicate, dropped, expired, done, failed)",
+    labelnames=("outcome",),
+)
+PREFETCH_QUEUE_DEPTH = Gauge("travelbot_prefetch_queue_depth", "Prefetch-taken in de wachtrij")
+
+EARTH_RADIUS_M = 6371000
+
+
+def destination(lat, lon, bearing, distance):
+    """Punt op `distance` meter vanaf (lat, lon) in richting `bearing` (graden vanaf het noorden)."""
+    angular = distance / EARTH_RADIUS_M
+    theta = math.radians(bearing)
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = math.asin(math.sin(lat1) * math.cos(angular)
+                     + math.cos(lat1) * math.sin(angular) * math.cos(theta))
+    lon2 = lon1 + math.atan2(math.sin(theta) * math.sin(angular) * math.cos(lat1),
+                             math.cos(angular) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
+
+
+def along_route(lat, lon, route, distance):
+    """Punt op `distance` meter langs `route` ([(lat, lon), ...]), gerekend vanaf het dichtstbijzijnde punt."""
+    nearest = min(range(len(route)), key=lambda i: distance_m(lat, lon, *route[i]))
+    here = (lat, lon)
+    for point in route[nearest + 1:]:
+        leg = distance_m(*here, *point)
+        if leg >= distance:
+            fraction = distance / leg if leg else 0.0
+            return (here[0] + (point[0] - here[0]) * fraction, here[1] + (point[1] - here[1]) * fraction)
+        distance -= leg
+        here = point
+    return here
+
+
+def ahead_points(lat, lon, heading=None, speed_kmh=0.0, horizon=300, step=60, route=None):
+    """Plekken die de reiziger binnen `horizon` seconden bereikt, als `(aankomst, lat, lon)`.
+
+    Het eerste punt is de huidige plek. Met een route wordt die gevolgd,
+    anders de koers; zonder koers of snelheid blijft het bij de huidige plek.
+    """
+    points = [(0, lat, lon)]
+    speed = max(0.0, speed_kmh) / 3.6
+    if speed <= 0 or (heading is None and not route):
+        return points
+    for eta in range(step, horizon + 1, step):
+        if route:
+            ahead = along_route(lat, lon, route, speed * eta)
+        else:
+            ahead = destination(lat, lon, heading, speed * eta)
+        points.append((eta, *ahead))
+    return points
+
+
+class PrefetchQueue:
+    """Begrensde prioriteitswachtrij met eigen workerthreads; laagste prioriteit gaat eerst.
+
+    Een taak is een aanroep van `handler(*args)`. Met dezelfde `key` staat er
+    hooguit één taak in de wachtrij of in uitvoering.
+    """
+
+    def __init__(self, handler, max_size=64, workers=2, clock=time.monotonic):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self._clock = clock
+        self._heap = []
+        self._keys = set()
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    @classmethod
+    def from_env(cls, handler):
+        return cls(
+            handler,
+            max_size=int(os.getenv("PREFETCH_QUEUE_SIZE", "64")),
+            workers=int(os.getenv("PREFETCH_WORKERS", "2")),
+        )
+
+    def submit(self, key, priority, expires, *args):
+        """Zet een taak in de wachtrij; geeft 'queued', 'duplicate' of 'dropped' terug.
+
+        `expires` is het tijdstip (volgens de klok van de wachtrij) waarna de
+        taak niets meer oplevert en wordt overgeslagen.
+        """
+        with self._cond:
+            if self._stopped:
+                return "dropped"
+            if key in self._keys:
+                outcome = "duplicate"
+            else:
+                outcome = "queued"
+                if len(self._heap) >= self.max_size:
+                    worst = max(self._heap)
+                    if worst[0] <= priority:
+                        outcome = "dropped"
+                    else:
+                        # De taak die het verst weg ligt maakt plaats
+                        self._heap.remove(worst)
+                        heapq.heapify(self._heap)
+                        self._keys.discard(worst[2])
+                        PREFETCH_TASKS.inc(outcome="dropped")
+                if outcome == "queued":
+                    heapq.heappush(self._heap, (priority, next(self._counter), key, expires, args))
+                    self._keys.add(key)
+                    self._start_workers()
+                    self._cond.notify()
+            PREFETCH_QUEUE_DEPTH.set(len(self._heap))
+        PREFETCH_TASKS.inc(outcome=outcome)
+        return outcome
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"travelbot-prefetch-{len(self._threads)}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, key, expires, args = heapq.heappop(self._heap)
+                PREFETCH_QUEUE_DEPTH.set(len(self._heap))
+            try:
+                if self._clock() > expires:
+                    PREFETCH_TASKS.inc(outcome="expired")
+                    continue
+                self.handler(*args)
+                PREFETCH_TASKS.inc(outcome="done")
+            except Exception as e:
+                PREFETCH_TASKS.inc(outcome="failed")
+                logger.info(f"Vooruit ophalen mislukt: {e!r}")
+            finally:
+                with self._cond:
+                    self._keys.discard(key)
+
+    def join(self, timeout=None):
+        """Wacht tot de wachtrij leeg is en er niets meer loopt; geeft False na `timeout` seconden."""
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._cond:
+                if not self._keys:
+                    return True
+            if give_up is not None and time.monotonic() > give_up:
+                return False
+            time.sleep(0.01)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._keys.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._heap),
+                "max_size": self.max_size,
+                "workers": self.workers,
+                "tasks": {outcome: PREFETCH_TASKS.value(outcome=outcome)
+                          for outcome in ("queued", "duplicate", "dropped", "expired", "done", "failed")},
+            }
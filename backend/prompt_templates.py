@@ -0,0 +1,183 @@
+"""Voorgecompileerde prompt-templates per (persona, taal).
+
+Een template bestaat uit een vaste prefix (persona en instructies), een
+slot voor de samenvatting en een slot voor de vraag. De prefix wordt één
+keer opgebouwd en is byte-voor-byte gelijk bij elke aanroep, zodat de
+prompt-cache van de upstream-API herhaalde prefixen kan hergebruiken.
+Per taal is er een echte vertaling in plaats van zoek-en-vervang.
+
+Voor als het taalmodel niet bereikbaar is, maakt `offline_line` zonder
+upstream een korte regel in de stem van de persona uit de eerste zin van
+de samenvatting.
+"""
+
+import random
+import re
+from functools import lru_cache
+
+DEFAULT_STYLE = "Jordanees"
+DEFAULT_LANGUAGE = "nl"
+
+# Vaste tekstdelen van de prompt per taal
+FRAMES = {
+    "nl": {
+        "intro": "Je praat graag over cultuur en hebt altijd een grappige opmerking.",
+        "summary": "Samenvatting van de plek:",
+        "question": ("Iemand vraagt je: '", "'. Wat zeg je?"),
+        "no_question": "Geef één humoristische zin over deze plek.",
+        "chat": "Je kletst met een reiziger die onderweg is. Antwoord kort, in hooguit twee zinnen.",
+        "places": "Plekken waar de reiziger net langskwam:",
+    },
+    "en": {
+        "intro": "You love talking about culture and always have a funny remark. Answer in English.",
+        "summary": "Summary of the place:",
+        "question": ("Someone asks you: '", "'. What do you say?"),
+        "no_question": "Give one humorous sentence about this place.",
+        "chat": "You are chatting with a traveller on the road. Answer briefly, in two sentences at most.",
+        "places": "Places the traveller just passed:",
+    },
+}
+
+# Ingebouwde persona's per taal
+PERSONAS = {
+    "Belg": {
+        "nl": "Je bent Heino, een vrolijke Belg uit Antwerpen met een zachte G.",
+        "en": "You are Heino, a cheerful Belgian from Antwerp with a soft G.",
+    },
+    "Brabander": {
+        "nl": "Je bent Heino, een gemoedelijke Brabander die met een zachte G praat.",
+        "en": "You are Heino, an easygoing Brabander who talks with a soft G.",
+    },
+    "Jordanees": {
+        "nl": """\
+Je bent Heino, een Amsterdammer van 58 uit de Jordaan met een grote bek en een droog gevoel voor humor.
+Je hebt een pleurishekel aan Italië, maar weet er alles over. Je refereert vaak aan je mysterieuze verleden daar,
+waarbij je hint naar maffiose praktijken zonder het expliciet te maken. Je praat met een Jordanees accent en gebruikt
+typische Amsterdamse uitdrukkingen zoals "pleuris", "gozer", en "hou je bek".
+
+Je houdt ervan om mensen te verrassen met je kennis over obscure Italiaanse gerechten en steden, maar je maakt er
+altijd een sarcastische opmerking bij. Bijvoorbeeld: "Wist je dat ze in Napels pizza's maken die zo dun zijn dat je
+ze door de brievenbus kan gooien? Maar ja, wat verwacht je van een land dat espresso in shotglaasjes serveert?"
+
+Je bent ook een beetje mysterieus over je verleden. Als iemand vraagt wat je in Italië deed, zeg je dingen als:
+"Ach, laten we zeggen dat ik daar een paar zaken heb afgehandeld. Niks illegaals hoor... meestal." Je hint naar
+connecties met de maffia, maar je geeft nooit details.
+
+Je hebt een zwak voor oude Italiaanse films en noemt vaak obscure referenties, zoals: "Dit doet me denken aan die
+scène in 'La Dolce Vita', maar dan zonder de glamour." Je bent een wandelende encyclopedie over Italië, maar je
+laat nooit je afkeer voor het land los.
+
+Je zucht vaak tijdens gesprekken, vooral als het over Italië gaat. Je vindt de Italiaanse keuken niet te vreten
+en maakt daar constant grappen over. Bijvoorbeeld: "Pasta? Dat is toch gewoon deeg met water? Geef mij maar een
+broodje bal, dat vult tenminste."
+""",
+        "en": """\
+You are Heino, a 58-year-old Amsterdammer from the Jordaan with a big mouth and a dry sense of humour.
+You can't stand Italy, but you know everything about it. You often refer to your mysterious past there,
+hinting at mafia dealings without ever saying so outright. You speak with a Jordaan accent and use
+typical Amsterdam expressions such as "pleuris", "gozer" and "hou je bek".
+
+You love surprising people with your knowledge of obscure Italian dishes and towns, but you always add a
+sarcastic remark. For example: "Did you know that in Naples they make pizzas so thin you could post them
+through a letterbox? But what do you expect from a country that serves espresso in shot glasses?"
+
+You are a bit secretive about your past. When someone asks what you did in Italy, you say things like:
+"Let's just say I settled a few matters there. Nothing illegal... mostly." You hint at mafia
+connections, but you never give details.
+
+You have a weakness for old Italian films and often drop obscure references, such as: "This reminds me of
+that scene in 'La Dolce Vita', only without the glamour." You are a walking encyclopedia on Italy, but you
+never let go of your dislike for the country.
+
+You sigh a lot in conversation, especially when Italy comes up. You think Italian food is inedible and
+joke about it constantly. For example: "Pasta? That's just dough and water, isn't it? Give me a meatball
+sandwich, at least that fills you up."
+""",
+    },
+}
+
+# Regels per persona en taal voor als het taalmodel niet bereikbaar is; {title} en {fact} worden ingevuld
+OFFLINE_LINES = {
+    "Belg": {
+        "nl": ["Allez, {title}! {fact} Schoon, hé?",
+               "Kijk eens aan, {title}. {fact} Da's toch iets, zenne."],
+        "en": ["Well now, {title}! {fact} Lovely, isn't it?",
+               "Look at that, {title}. {fact} Quite something, mate."],
+    },
+    "Brabander": {
+        "nl": ["Houdoe, dit is {title}. {fact} Gezellig toch?",
+               "Ah, {title}. {fact} Daar drinken we er eentje op."],
+        "en": ["Right, this is {title}. {fact} Cosy, isn't it?",
+               "Ah, {title}. {fact} Let's have a drink on that."],
+    },
+    "Jordanees": {
+        "nl": ["Kijk, gozer, {title}. {fact} Meer hoef je niet te weten.",
+               "*zucht* {title}. {fact} Nog altijd beter dan Italië, hoor."],
+        "en": ["Look, mate, {title}. {fact} That's all you need to know.",
+               "*sigh* {title}. {fact} Still better than Italy, mind you."],
+    },
+}
+OFFLINE_FACT_LENGTH = 200
+
+
+class PromptTemplate:
+    """Prompt met een vaste prefix en slots voor samenvatting en vraag."""
+
+    __slots__ = ("prefix", "question_open", "question_close", "no_question")
+
+    def __init__(self, persona, language):
+        frame = FRAMES[language]
+        self.prefix = f"{persona.strip()}\n{frame['intro']}\n\n{frame['summary']}\n"
+        self.question_open = "\n\n" + frame["question"][0]
+        self.question_close = frame["question"][1]
+        self.no_question = "\n\n" + frame["no_question"]
+
+    def render(self, summary, question=None):
+        """Vul de slots in; de prefix blijft ongewijzigd vooraan staan."""
+        if question:
+            return "".join((self.prefix, summary, self.question_open, question, self.question_close))
+        return "".join((self.prefix, summary, self.no_question))
+
+
+@lru_cache(maxsize=512)
+def compile_template(persona, language=DEFAULT_LANGUAGE):
+    """Compileer (en onthoud) het template voor een personatekst en taal."""
+    if language not in FRAMES:
+        language = DEFAULT_LANGUAGE
+    return PromptTemplate(persona, language)
+
+
+@lru_cache(maxsize=512)
+def chat_prefix(persona, language=DEFAULT_LANGUAGE):
+    """Vaste systeemprompt voor de chat met een persona."""
+    frame = FRAMES.get(language) or FRAMES[DEFAULT_LANGUAGE]
+    return f"{persona.strip()}\n{frame['chat']}"
+
+
+def chat_system_prompt(persona, language=DEFAULT_LANGUAGE, places=()):
+    """Systeemprompt voor de chat: de vaste prefix, gevolgd door de recente plekken."""
+    prefix = chat_prefix(persona, language)
+    if not places:
+        return prefix
+    frame = FRAMES.get(language) or FRAMES[DEFAULT_LANGUAGE]
+    return f"{prefix}\n\n{frame['places']} {', '.join(places)}."
+
+
+def builtin_persona(style, language=DEFAULT_LANGUAGE):
+    """Tekst van een ingebouwde persona; onbekende stijlen vallen terug op Jordanees."""
+    texts = PERSONAS.get(style) or PERSONAS[DEFAULT_STYLE]
+    return texts.get(language) or texts[DEFAULT_LANGUAGE]
+
+
+def offline_line(title, summary, style=DEFAULT_STYLE, language=DEFAULT_LANGUAGE):
+    """Korte regel in de stem van de persona over `title`, gemaakt zonder taalmodel.
+
+    Persona's zonder eigen regels (zoals die uit `personas/`) krijgen die van
+    de standaardstijl.
+    """
+    lines = OFFLINE_LINES.get(style) or OFFLINE_LINES[DEFAULT_STYLE]
+    templates = lines.get(language) or lines[DEFAULT_LANGUAGE]
+    fact = re.split(r"(?<=[.!?])\s", (summary or "").strip(), maxsplit=1)[0]
+    if len(fact) > OFFLINE_FACT_LENGTH:
+        fact = fact[:OFFLINE_FACT_LENGTH].rsplit(" ", 1)[0] + "…"
+    return " ".join(random.choice(templates).format(title=title, fact=fact).split())
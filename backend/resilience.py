@@ -0,0 +1,165 @@
+"""Latency-budgetten en circuit breakers voor de upstreams (Wikipedia en OpenAI).
+
+Een `Deadline` is het tijdsbudget van één verzoek: elke stap wacht hooguit
+`deadline.remaining()` seconden, zodat een trage upstream niet de volledige
+timeout kost maar een lagere laag (verlopen cache, lokale persona-regel)
+het antwoord geeft.
+
+Een `CircuitBreaker` per upstream houdt opeenvolgende mislukkingen bij. Na
+`failure_threshold` fouten gaat hij open en worden aanroepen meteen
+geweigerd met `CircuitOpenError`; na `reset_timeout` seconden mag één
+proefaanroep door (half-open). Slaagt die, dan gaat de breaker weer dicht.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import Counter, Gauge
+
+CIRCUIT_STATE = Gauge(
+    "travelbot_circuit_state", "Stand van de circuit breaker per upstream: 0=dicht, 1=half-open, 2=open",
+    labelnames=("upstream",),
+)
+CIRCUIT_REJECTIONS = Counter(
+    "travelbot_circuit_rejections_total", "Aanroepen die een open circuit breaker meteen weigerde",
+    labelnames=("upstream",),
+)
+
+
+class Deadline:
+    """Tijdsbudget van één verzoek; zonder budget is er geen limiet."""
+
+    def __init__(self, budget=None, clock=time.monotonic):
+        self._clock = clock
+        self.expires = clock() + budget if budget is not None else None
+
+    def remaining(self):
+        """Resterende seconden (nooit negatief), of None zonder budget."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self._clock())
+
+    @property
+    def expired(self):
+        return self.expires is not None and self._clock() >= self.expires
+
+
+class CircuitOpenError(Exception):
+    """De upstream wordt overgeslagen omdat zijn circuit breaker open staat."""
+
+    reason = "circuit_open"
+
+    def __init__(self, upstream):
+        super().__init__(f"circuit breaker voor {upstream} staat open")
+        self.upstream = upstream
+
+
+class CircuitBreaker:
+    """Circuit breaker voor één upstream; thread-safe."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, is_failure=None, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure or (lambda exc: True)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        CIRCUIT_STATE.set(0, upstream=name)
+
+    @classmethod
+    def from_env(cls, name, is_failure=None):
+        """Maak een breaker met `CIRCUIT_FAILURE_THRESHOLD` en `CIRCUIT_RESET_TIMEOUT`."""
+        return cls(
+            name,
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+            is_failure=is_failure,
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state):
+        self._state = state
+        CIRCUIT_STATE.set(self.STATE_VALUES[state], upstream=self.name)
+
+    def allow(self):
+        """Mag er nu een aanroep door? In half-open stand is er één proefaanroep tegelijk."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        CIRCUIT_REJECTIONS.inc(upstream=self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._probing
+            self._probing = False
+            if probe_failed or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                self.opened += 1
+                self._set_state(self.OPEN)
+
+    def _release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """Voer een upstream-aanroep uit onder deze breaker.
+
+        Gooit meteen `CircuitOpenError` als de breaker open staat; uitzonderingen
+        waarvoor `is_failure` waar is tellen als mislukking, andere niet.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            self._release_probe()  # afgebroken (bijv. geannuleerd): geen oordeel over de upstream
+            raise
+        else:
+            self.record_success()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": CIRCUIT_REJECTIONS.value(upstream=self.name),
+            }
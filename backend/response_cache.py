@@ -0,0 +1,280 @@
+"""Cache voor gegenereerde opmerkingen.
+
+Twee gebruikers bij hetzelfde monument met dezelfde stijl krijgen dezelfde
+prompt. In plaats van elke keer een nieuwe completion te betalen bewaren we
+per vingerafdruk (artikeltitel + stijl + taal + genormaliseerde vraag) een
+kleine pool van varianten. Zolang de pool nog niet vol is wordt er
+bijgegenereerd; daarna kiezen we willekeurig een variant, zodat een
+herhaald bezoek toch afwisselend klinkt.
+
+Na `ttl` seconden is een pool verlopen maar niet weg: nog `stale_ttl`
+seconden lang kan hij antwoord geven terwijl er op de achtergrond een
+nieuwe variant wordt gemaakt, of als OpenAI niet bereikbaar is.
+
+De opslag is verwisselbaar: in het geheugen, in SQLite op schijf of in een
+Redis-compatibele server.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from geo_cache import TTLCache
+
+
+def normalize_question(question):
+    """Maak een vraag ongevoelig voor hoofdletters, leestekens en witruimte."""
+    if not question:
+        return ""
+    question = unicodedata.normalize("NFKC", question).casefold()
+    question = re.sub(r"[^\w\s]", " ", question)
+    return " ".join(question.split())
+
+
+def fingerprint(title, style, language, question=None):
+    """Stabiele sleutel voor een (plek, persona, taal, vraag)-combinatie."""
+    raw = "\x1f".join([title, style, language, normalize_question(question)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def parse_entry(entry):
+    """Lees `(varianten, vers_tot)` uit een opgeslagen pool; pools uit een oudere versie tellen als verlopen."""
+    if not entry:
+        return [], 0.0
+    if isinstance(entry, list):
+        return list(entry), 0.0
+    return list(entry.get("variants", [])), entry.get("fresh_until", 0.0)
+
+
+def merge_variant(entry, text, keep, fresh_until):
+    """Nieuwe pool: `text` erbij (als hij er nog niet in zit), hooguit de laatste `keep` varianten."""
+    variants, _ = parse_entry(entry)
+    if text not in variants:
+        variants.append(text)
+    return {"variants": variants[-keep:], "fresh_until": fresh_until}
+
+
+class MemoryStore:
+    """Opslag in het geheugen van dit proces (LRU met TTL)."""
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, maxsize=10000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        # Eén lock per sleutel, verdeeld over een vast aantal strepen
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def get(self, key):
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        expires, entry = item
+        return entry if expires > time.time() else None
+
+    def set(self, key, entry, ttl):
+        self._cache.set(key, (time.time() + ttl, entry))
+
+    def add_variant(self, key, text, keep, fresh_until, ttl):
+        with self._locks[hash(key) % self.LOCK_STRIPES]:
+            self.set(key, merge_variant(self.get(key), text, keep, fresh_until), ttl)
+
+
+class SQLiteStore:
+    """Opslag in een SQLite-bestand, te delen door meerdere workers."""
+
+    def __init__(self, path, maxsize=100000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, variants TEXT NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT variants FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, entry, ttl):
+        with self._lock, self._db:
+            self._write(key, entry, ttl)
+
+    def add_variant(self, key, text, keep, fresh_until, ttl):
+        # BEGIN IMMEDIATE neemt de schrijflock vóór het lezen, zodat andere
+        # workers de pool niet tussen lezen en schrijven kunnen wijzigen
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT variants FROM responses WHERE key = ? AND expires > ?", (key, time.time())
+                ).fetchone()
+                self._write(key, merge_variant(json.loads(row[0]) if row else None, text, keep, fresh_until), ttl)
+            except BaseException:
+                self._db.rollback()
+                raise
+            self._db.commit()
+
+    def _write(self, key, entry, ttl):
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, variants, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(entry), now + ttl, now),
+        )
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+
+
+# KEYS[1] = sleutel; ARGV = tekst, keep, fresh_until, ttl (zelfde rekensom als `merge_variant`)
+REDIS_ADD_VARIANT = """
+local raw = redis.call('GET', KEYS[1])
+local variants = {}
+if raw then
+  local entry = cjson.decode(raw)
+  if entry.variants then variants = entry.variants elseif #entry > 0 then variants = entry end
+end
+local present = false
+for _, variant in ipairs(variants) do
+  if variant == ARGV[1] then present = true end
+end
+if not present then table.insert(variants, ARGV[1]) end
+while #variants > tonumber(ARGV[2]) do table.remove(variants, 1) end
+redis.call('SET', KEYS[1], cjson.encode({variants = variants, fresh_until = tonumber(ARGV[3])}), 'EX', ARGV[4])
+return 1
+"""
+
+
+class RedisStore:
+    """Opslag in een Redis-compatibele server; TTL en eviction doet Redis zelf.
+
+    `client` is een object met de `get`/`set(..., ex=...)`- en
+    `register_script`-interface van redis-py.
+    """
+
+    def __init__(self, client, prefix="travelbot:response:"):
+        self.client = client
+        self.prefix = prefix
+        self._add_variant = client.register_script(REDIS_ADD_VARIANT)
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, entry, ttl):
+        self.client.set(self.prefix + key, json.dumps(entry), ex=int(ttl))
+
+    def add_variant(self, key, text, keep, fresh_until, ttl):
+        self._add_variant(keys=[self.prefix + key], args=[text, keep, fresh_until, int(ttl)])
+
+
+class ResponseCache:
+    """Pool van maximaal `variants` antwoorden per vingerafdruk."""
+
+    def __init__(self, store, variants=3, ttl=86400, stale_ttl=0):
+        self.store = store
+        self.variants = variants
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _entry(self, key):
+        return parse_entry(self.store.get(key))
+
+    def lookup(self, key):
+        """Geef `(status, variant)` met een willekeurige variant uit de pool.
+
+        De status is "fresh" voor een volle, verse pool, "stale" voor een volle
+        maar verlopen pool en "partial" als de pool nog niet vol is; zonder
+        pool is het `(None, None)`.
+        """
+        variants, fresh_until = self._entry(key)
+        with self._lock:
+            if not variants:
+                self.misses += 1
+                return None, None
+            variant = random.choice(variants)
+            if len(variants) < self.variants:
+                self.misses += 1
+                return "partial", variant
+            if fresh_until > time.time():
+                self.hits += 1
+                return "fresh", variant
+            self.stale_hits += 1
+            return "stale", variant
+
+    def pick(self, key):
+        """Geef een willekeurige variant terug als de pool vol en vers is, anders None."""
+        status, variant = self.lookup(key)
+        return variant if status == "fresh" else None
+
+    def peek(self, key):
+        """Alle varianten in de pool (vers of verlopen); telt niet mee in de statistiek."""
+        return self._entry(key)[0]
+
+    def add(self, key, text):
+        """Voeg een nieuw gegenereerd antwoord toe aan de pool; de pool is daarna weer vers.
+
+        Lezen en schrijven gebeurt atomair in de opslag, zodat twee completions
+        die tegelijk klaar zijn elkaars variant niet overschrijven.
+        """
+        self.store.add_variant(key, text, self.variants, time.time() + self.ttl, self.ttl + self.stale_ttl)
+        with self._lock:
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale_hits
+            return {
+                "backend": type(self.store).__name__,
+                "variants": self.variants,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def store_from_env():
+    """Kies de opslag op basis van `RESPONSE_CACHE_BACKEND` (memory, sqlite, redis)."""
+    backend = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("RESPONSE_CACHE_PATH",
+                         os.path.join(os.path.dirname(__file__), "response_cache.sqlite3"))
+        return SQLiteStore(path, maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "100000")))
+    if backend == "redis":
+        return RedisStore.from_url(os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    if backend != "memory":
+        raise ValueError(f"Onbekende RESPONSE_CACHE_BACKEND: {backend}")
+    return MemoryStore(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "10000")))
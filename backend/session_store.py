@@ -0,0 +1,193 @@
+"""Compacte context per sessie voor /api/location-comment en /api/persona-chat.
+
+Per sessie bewaren we alleen een rollend venster: de laatste `max_places`
+plekken en de laatste `max_turns` chatbeurten, elk ingekort tot
+`max_chars` tekens. De client hoeft zo niet de hele geschiedenis mee te
+sturen, en `history` geeft alleen de nieuwste beurten die samen binnen een
+tokenbudget passen. Daarnaast onthoudt elke sessie waar en over welk
+artikel de laatste opmerking ging, zodat een stilstaande reiziger niet bij
+elke tik een nieuwe completion kost (zie `last_comment`).
+
+Het geheugen is begrensd: hooguit `max_sessions` sessies (de langst niet
+gebruikte valt eruit) en sessies die `ttl` seconden stil zijn verlopen.
+De store leeft per proces; met meerdere workers kan een sessie bij een
+andere worker opnieuw beginnen, wat alleen wat context kost.
+"""
+
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import Counter, Gauge
+
+CHAT_SESSIONS = Gauge("travelbot_chat_sessions", "Sessies in de sessiestore van dit proces")
+SESSION_EVICTIONS = Counter(
+    "travelbot_chat_session_evictions_total", "Sessies die uit de store vielen (lru of ttl)",
+    labelnames=("reason",),
+)
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+ROLES = ("user", "assistant")
+
+
+def estimate_tokens(text):
+    """Ruwe schatting van het aantal tokens (ongeveer vier tekens per token)."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """Rollend venster van plekken en beurten; beurten als `(rol-index, tekst)`.
+
+    `anchor` is `(lat, lon, titel, tijdstip)` van de laatste nieuw gemaakte opmerking.
+    """
+
+    __slots__ = ("places", "turns", "touched", "anchor")
+
+    def __init__(self, max_places, max_turns, now):
+        self.places = deque(maxlen=max_places)
+        self.turns = deque(maxlen=max_turns)
+        self.touched = now
+        self.anchor = None
+
+
+class SessionStore:
+    """Begrensde LRU-store met TTL voor de context van chatsessies; thread-safe."""
+
+    def __init__(self, max_sessions=10000, ttl=1800.0, max_places=5, max_turns=12, max_chars=500,
+                 history_tokens=800, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_places = max_places
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.history_tokens = history_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "10000")),
+            ttl=float(os.getenv("CHAT_SESSION_TTL", "1800")),
+            max_places=int(os.getenv("CHAT_MAX_PLACES", "5")),
+            max_turns=int(os.getenv("CHAT_MAX_TURNS", "12")),
+            history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "800")),
+        )
+
+    @staticmethod
+    def resolve(session_id):
+        """Geef `session_id` terug als het een geldige id is, anders een nieuwe."""
+        if isinstance(session_id, str) and SESSION_ID_PATTERN.match(session_id):
+            return session_id
+        return secrets.token_urlsafe(16)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _purge_expired(self, now):
+        # De volgorde is die van het laatste gebruik, dus verlopen sessies staan vooraan
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+            SESSION_EVICTIONS.inc(reason="ttl")
+
+    def _get(self, session_id, create=False):
+        now = self._clock()
+        self._purge_expired(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+        elif create:
+            session = self._sessions[session_id] = ChatSession(self.max_places, self.max_turns, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+                SESSION_EVICTIONS.inc(reason="lru")
+        CHAT_SESSIONS.set(len(self._sessions))
+        return session
+
+    def add_place(self, session_id, title):
+        """Onthoud een bezochte plek; dezelfde plek twee keer achter elkaar telt één keer."""
+        if not title:
+            return
+        title = title[:self.max_chars]
+        with self._lock:
+            places = self._get(session_id, create=True).places
+            if not places or places[-1] != title:
+                places.append(title)
+
+    def add_turn(self, session_id, role, content):
+        """Voeg een chatbeurt toe (`role` is 'user' of 'assistant')."""
+        entry = (ROLES.index(role), content[:self.max_chars])
+        with self._lock:
+            self._get(session_id, create=True).turns.append(entry)
+
+    def record_comment(self, session_id, lat, lon, title, text):
+        """Onthoud een nieuw gemaakte opmerking: plek, artikel en tekst."""
+        with self._lock:
+            session = self._get(session_id, create=True)
+            session.anchor = (lat, lon, title, self._clock())
+            if title and (not session.places or session.places[-1] != title[:self.max_chars]):
+                session.places.append(title[:self.max_chars])
+            session.turns.append((ROLES.index("assistant"), text[:self.max_chars]))
+
+    def last_comment(self, session_id, max_age):
+        """`(lat, lon, titel)` van de laatste nieuwe opmerking, of None als die ouder is dan `max_age`."""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None or session.anchor is None:
+                return None
+            lat, lon, title, at = session.anchor
+            return (lat, lon, title) if self._clock() - at < max_age else None
+
+    def unsaid(self, session_id, texts):
+        """De teksten uit `texts` die de persona in deze sessie niet recent heeft gezegd.
+
+        Beurten worden ingekort opgeslagen, dus er wordt vergeleken op de eerste `max_chars` tekens.
+        """
+        with self._lock:
+            session = self._get(session_id)
+            said = {content for role, content in session.turns if ROLES[role] == "assistant"} if session else set()
+        return [text for text in texts if text[:self.max_chars] not in said]
+
+    def places(self, session_id):
+        """Recent bezochte plekken, oudste eerst."""
+        with self._lock:
+            session = self._get(session_id)
+            return list(session.places) if session is not None else []
+
+    def history(self, session_id, max_tokens=None):
+        """De nieuwste beurten die samen binnen `max_tokens` passen, als chatberichten (oudste eerst)."""
+        budget = self.history_tokens if max_tokens is None else max_tokens
+        with self._lock:
+            session = self._get(session_id)
+            turns = list(session.turns) if session is not None else []
+        messages = []
+        for role, content in reversed(turns):
+            budget -= estimate_tokens(content)
+            if budget < 0:
+                break
+            messages.append({"role": ROLES[role], "content": content})
+        messages.reverse()
+        return messages
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
@@ -0,0 +1,93 @@
+"""Samenvoegen van gelijktijdige, identieke upstream-aanroepen (single-flight).
+
+Staan er tien mensen op dezelfde plek, dan hoeft Wikipedia maar één keer
+gevraagd te worden. Per sleutel is er hoogstens één aanroep onderweg; wie
+tijdens die aanroep met dezelfde sleutel komt, wacht op hetzelfde resultaat
+(of dezelfde fout) in plaats van een eigen verzoek te doen.
+
+`AsyncSingleFlight` is voor coroutines op één event loop (de gedeelde
+runtime), `SingleFlight` voor gewone functies vanuit meerdere threads.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from metrics import Counter
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "travelbot_single_flight_calls_total",
+    "Aanroepen via single-flight; role=leader deed het werk, role=coalesced wachtte mee",
+    labelnames=("group", "role"),
+)
+
+
+class _Group:
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}
+
+    def _count(self, role):
+        SINGLE_FLIGHT_CALLS.inc(group=self.name, role=role)
+
+    def busy(self, key):
+        """Is er voor `key` nu een aanroep onderweg?"""
+        return key in self._inflight
+
+    def stats(self):
+        leaders = SINGLE_FLIGHT_CALLS.value(group=self.name, role="leader")
+        coalesced = SINGLE_FLIGHT_CALLS.value(group=self.name, role="coalesced")
+        return {"leaders": leaders, "coalesced": coalesced, "in_flight": len(self._inflight)}
+
+
+class AsyncSingleFlight(_Group):
+    """Single-flight voor coroutines; alle aanroepers moeten op dezelfde loop draaien."""
+
+    async def do(self, key, make_coro):
+        """Wacht op de lopende aanroep voor `key`, of start `make_coro()` zelf."""
+        task = self._inflight.get(key)
+        if task is None:
+            self._count("leader")
+            task = asyncio.ensure_future(make_coro())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._count("coalesced")
+        # shield: een afgebroken wachter mag het gedeelde werk niet annuleren
+        return await asyncio.shield(task)
+
+
+class SingleFlight(_Group):
+    """Single-flight voor blokkerende functies die vanuit threads worden aangeroepen."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Geef het resultaat van de lopende aanroep voor `key`, of voer `fn()` zelf uit.
+
+        Een meewachter geeft na `timeout` seconden op met `TimeoutError`; de
+        lopende aanroep gaat dan gewoon door.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._count("coalesced")
+            return future.result(timeout)
+
+        self._count("leader")
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
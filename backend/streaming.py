@@ -0,0 +1,46 @@
+"""Hulpfuncties voor streamende antwoorden.
+
+Het taalmodel levert losse tokens; de telefoon wil hele zinnen om direct
+voor te lezen. `iter_sentences` bundelt fragmenten tot zinnen en
+`format_event` verpakt ze als server-sent event of als JSON-regel.
+"""
+
+import json
+import re
+
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+
+def iter_sentences(fragments, min_length=20):
+    """Voeg tekstfragmenten samen en geef ze per zin terug.
+
+    Zinnen korter dan `min_length` tekens worden samengevoegd met de
+    volgende, zodat de TTS niet over losse woordjes struikelt.
+    """
+    buffer = ""
+    for fragment in fragments:
+        buffer += fragment
+        while True:
+            cut = _sentence_cut(buffer, min_length)
+            if cut is None:
+                break
+            yield buffer[:cut].strip()
+            buffer = buffer[cut:]
+    tail = buffer.strip()
+    if tail:
+        yield tail
+
+
+def _sentence_cut(text, min_length):
+    """Positie direct na het eerste zinseinde op minstens `min_length` tekens."""
+    for match in SENTENCE_END.finditer(text):
+        if match.end() >= min_length:
+            return match.end()
+    return None
+
+
+def format_event(event, data, ndjson=False):
+    """Verpak `data` als server-sent event, of als JSON-regel als `ndjson`."""
+    if ndjson:
+        return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
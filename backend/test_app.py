@@ -2,6 +2,15 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import json
+import logging
+import time
+
+
+class ImmediateExecutor:
+    """Runs background refreshes inline so tests see their effect deterministically."""
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
 
 
 class TestApp(unittest.TestCase):
@@ -14,9 +23,17 @@ class TestApp(unittest.TestCase):
         
         # Import app after setting environment variables
         from app import app, get_wikipedia_summary, build_prompt
+        import app as app_module
+        from admission import AdmissionController, LocalBuckets
         self.app = app
         self.get_wikipedia_summary = get_wikipedia_summary
         self.build_prompt = build_prompt
+
+        # Rate limiting has its own tests; the others must not run out of tokens
+        for name in ('admission', 'webapp_admission'):
+            patcher = patch.object(app_module, name, AdmissionController(LocalBuckets(), enabled=False))
+            patcher.start()
+            self.addCleanup(patcher.stop)
         
         self.app.config['TESTING'] = True
         self.client = self.app.test_client()
@@ -30,6 +47,11 @@ class TestApp(unittest.TestCase):
         if 'ADMIN_PASSWORD' in os.environ:
             del os.environ['ADMIN_PASSWORD']
 
+    def session_headers(self, session_id=None):
+        """Headers with a webapp session token from /api/session"""
+        token = self.client.post('/api/session', json={"session_id": session_id}).get_json()["token"]
+        return {'X-Session-Token': token}
+
     def test_build_prompt_jordanees(self):
         """Test building prompt with Jordanees style"""
         summary = "This is a test summary."
@@ -59,6 +81,29 @@ class TestApp(unittest.TestCase):
         self.assertIn("humoristische zin", prompt)
         self.assertNotIn("vraagt je:", prompt)
 
+    def test_wikipedia_summary_uses_geo_cache(self):
+        """Nearby lookups are served from the geo cache"""
+        import asyncio
+        import app as app_module
+        app_module.nearest_article_cache.clear()
+        app_module.summary_cache.clear()
+
+        async def fake_title(lat, lon):
+            return "Westerkerk"
+
+        async def fake_summary(title):
+            return f"Samenvatting van {title}."
+
+        with patch.object(app_module, 'fetch_nearest_title', side_effect=fake_title) as title_mock, \
+                patch.object(app_module, 'fetch_summary', side_effect=fake_summary) as summary_mock:
+            first = asyncio.run(self.get_wikipedia_summary(52.37301, 4.88401))
+            second = asyncio.run(self.get_wikipedia_summary(52.37304, 4.88405))
+
+        self.assertEqual(first, "Samenvatting van Westerkerk.")
+        self.assertEqual(second, first)
+        self.assertEqual(title_mock.call_count, 1)
+        self.assertEqual(summary_mock.call_count, 1)
+
     def test_comment_endpoint_missing_coordinates(self):
         """Test comment endpoint with missing coordinates"""
         response = self.client.post('/comment', 
@@ -68,6 +113,587 @@ class TestApp(unittest.TestCase):
         data = response.get_json()
         self.assertIn("error", data)
 
+    def test_comment_stream_endpoint(self):
+        """The streaming endpoint emits one event per sentence and a final done event"""
+        import app as app_module
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return None, "De Westerkerk is een kerk."
+
+        tokens = ["Dat is de Westerkerk", ", gozer. ", "Daar ligt Rembrandt."]
+        with patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'stream_chat', return_value=iter(tokens)):
+            response = self.client.post('/comment/stream',
+                                        json={"lat": 52.3676, "lon": 4.9041},
+                                        headers={'X-API-KEY': 'test_key'})
+            body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/event-stream'))
+        self.assertEqual(body.count('event: sentence'), 2)
+        self.assertIn('event: done', body)
+        self.assertIn('Dat is de Westerkerk, gozer. Daar ligt Rembrandt.', body)
+
+    def test_comment_reuses_cached_variants(self):
+        """A partial pool answers from its variants and is topped up until full; then OpenAI is idle"""
+        import app as app_module
+        from response_cache import MemoryStore
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        replies = iter(["Variant een.", "Variant twee.", "Variant drie.", "Variant vier."])
+        with patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore(), variants=2)), \
+                patch.object(app_module, 'refresh_executor', ImmediateExecutor()), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat', side_effect=lambda *a, **k: next(replies)) as chat:
+            texts = [self.client.post('/comment', json={"lat": 52.3676, "lon": 4.9041},
+                                      headers={'X-API-KEY': 'test_key'}).get_json()["text"]
+                     for _ in range(5)]
+
+        self.assertEqual(chat.call_count, 2)
+        self.assertEqual(texts[:2], ["Variant een.", "Variant een."])
+        self.assertTrue(set(texts[2:]) <= {"Variant een.", "Variant twee."})
+
+    def test_concurrent_comments_coalesce_upstream_calls(self):
+        """A burst of /comment requests for one spot makes one Wikipedia and one OpenAI call"""
+        import asyncio
+        import threading
+        import app as app_module
+        from response_cache import MemoryStore
+
+        async def fake_title(lat, lon):
+            await asyncio.sleep(0.05)
+            return "Noorderkerk"
+
+        async def fake_summary(title):
+            await asyncio.sleep(0.05)
+            return "De Noorderkerk is een kerk."
+
+        def slow_chat(*args, **kwargs):
+            threading.Event().wait(0.1)
+            return "Eén antwoord voor iedereen."
+
+        app_module.nearest_article_cache.clear()
+        app_module.summary_cache.clear()
+        with patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'fetch_nearest_title', side_effect=fake_title) as title_mock, \
+                patch.object(app_module, 'fetch_summary', side_effect=fake_summary) as summary_mock, \
+                patch.object(app_module.llm_client, 'chat', side_effect=slow_chat) as chat:
+            texts = []
+
+            def request():
+                client = self.app.test_client()
+                response = client.post('/comment', json={"lat": 52.3794, "lon": 4.8837},
+                                       headers={'X-API-KEY': 'test_key'})
+                texts.append(response.get_json()["text"])
+
+            threads = [threading.Thread(target=request) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(texts, ["Eén antwoord voor iedereen."] * 6)
+        self.assertEqual(title_mock.call_count, 1)
+        self.assertEqual(summary_mock.call_count, 1)
+        self.assertEqual(chat.call_count, 1)
+        self.assertEqual(app_module.completion_flights.stats()["in_flight"], 0)
+
+    def test_metrics_endpoint_reports_comment_stages(self):
+        """/metrics accepts an API key and exposes per-stage timings after a /comment"""
+        import app as app_module
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return None, "Er is hier niet veel bijzonders."
+
+        with patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat', return_value="Niks te zien, gozer."):
+            self.client.post('/comment', json={"lat": 52.1, "lon": 4.1}, headers={'X-API-KEY': 'test_key'})
+
+        response = self.client.get('/metrics', headers={'X-API-KEY': 'test_key'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        for stage in ("prompt", "openai", "total"):
+            self.assertIn(f'travelbot_comment_stage_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('travelbot_cache_hit_ratio{cache="wikipedia_nearest"}', text)
+        self.assertIn('travelbot_http_in_flight', text)
+
+    def test_metrics_require_token_or_api_key(self):
+        """/metrics is closed by default; a bearer METRICS_TOKEN or an API key opens it"""
+        import app as app_module
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code, 401)
+        with patch.object(app_module, 'METRICS_TOKEN', 'geheim'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer fout'}).status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer geheim'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_public_only_when_enabled(self):
+        """METRICS_PUBLIC=1 explicitly opens /metrics to unauthenticated scrapers"""
+        import app as app_module
+        with patch.object(app_module, 'METRICS_PUBLIC', True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_api_key_is_not_logged(self):
+        """The raw API key never ends up in the log"""
+        with self.assertLogs(level='DEBUG') as logs:
+            self.client.get('/personas', headers={'X-API-KEY': 'supergeheime-sleutel'})
+            logging.getLogger().debug("marker")
+        self.assertFalse(any('supergeheime-sleutel' in line for line in logs.output))
+
+    def test_comment_without_openai_key_falls_back(self):
+        """A missing OpenAI key gives a local persona line instead of an error"""
+        import app as app_module
+        from lazy import Lazy
+        from response_cache import MemoryStore
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        with patch.object(app_module, 'OPENAI_API_KEY', None), \
+                patch.object(app_module, 'llm_client', Lazy(app_module.create_llm_client)), \
+                patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup):
+            response = self.client.post('/comment', json={"lat": 52.3, "lon": 4.9}, headers={'X-API-KEY': 'k'})
+        self.assertEqual(response.status_code, 200)
+        text = response.get_json()["text"]
+        self.assertIn("Westerkerk", text)
+        self.assertIn("De Westerkerk is een kerk.", text)
+
+    def test_stale_pool_is_served_and_refreshed(self):
+        """An expired variant pool answers at once and is refilled in the background"""
+        import app as app_module
+        from response_cache import MemoryStore, fingerprint
+
+        cache = app_module.ResponseCache(MemoryStore(), variants=1, ttl=0, stale_ttl=3600)
+        key = fingerprint("Westerkerk", "Jordanees", "nl")
+        cache.add(key, "Oud grapje.")
+        cache.ttl = 3600
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        with patch.object(app_module, 'response_cache', cache), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat', return_value="Nieuw grapje.") as chat:
+            response = self.client.post('/comment', json={"lat": 52.3, "lon": 4.9}, headers={'X-API-KEY': 'k'})
+            self.assertEqual(response.get_json()["text"], "Oud grapje.")
+            deadline = time.monotonic() + 2
+            while cache.lookup(key)[0] != "fresh" and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(chat.call_count, 1)
+        self.assertEqual(cache.lookup(key), ("fresh", "Nieuw grapje."))
+
+    def test_open_circuit_skips_openai(self):
+        """With the OpenAI breaker open, no completion is attempted"""
+        import app as app_module
+        from resilience import CircuitBreaker
+        from response_cache import MemoryStore
+
+        breaker = CircuitBreaker("openai_test", failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        with patch.object(app_module, 'openai_breaker', breaker), \
+                patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat') as chat:
+            response = self.client.post('/comment', json={"lat": 52.3, "lon": 4.9}, headers={'X-API-KEY': 'k'})
+        chat.assert_not_called()
+        self.assertIn("Westerkerk", response.get_json()["text"])
+
+    def test_failing_wikipedia_opens_breaker_and_serves_stale_summary(self):
+        """Repeated Wikipedia failures open the breaker; stale entries still answer"""
+        import asyncio
+        import httpx
+        import app as app_module
+        from geo_cache import geo_cell
+        from resilience import CircuitBreaker
+
+        breaker = CircuitBreaker("wikipedia_test", failure_threshold=2, reset_timeout=60,
+                                 is_failure=app_module.wikipedia_failure)
+        calls = []
+
+        async def broken(*args):
+            calls.append(args)
+            raise httpx.ConnectError("weg")
+
+        app_module.nearest_article_cache.clear()
+        app_module.summary_cache.clear()
+        with patch.object(app_module, 'wikipedia_breaker', breaker), \
+                patch.object(app_module, 'fetch_nearest_title', side_effect=broken), \
+                patch.object(app_module, 'fetch_summary', side_effect=broken):
+            for _ in range(3):
+                title, _ = asyncio.run(app_module.lookup_place(52.1, 4.1))
+                self.assertIsNone(title)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(breaker.state, "open")
+
+            # verlopen items in de cache geven nog steeds antwoord
+            for cache, key, value in ((app_module.nearest_article_cache, geo_cell(52.2, 4.2, app_module.GEO_CELL_SIZE), "Dam"),
+                                      (app_module.summary_cache, "Dam", "De Dam is een plein.")):
+                with patch.object(cache, 'ttl', -1):
+                    cache.set(key, value)
+            self.assertEqual(asyncio.run(app_module.lookup_place(52.2, 4.2)), ("Dam", "De Dam is een plein."))
+        app_module.nearest_article_cache.clear()
+        app_module.summary_cache.clear()
+
+    def test_commits_are_served_from_snapshot_with_etag(self):
+        """/commits answers from the background snapshot and honours If-None-Match"""
+        import app as app_module
+        from benchmarks.stubs import GitHubStub, start_stub
+        from github_commits import CommitFeed
+
+        server, base_url = start_stub(GitHubStub)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        feed = CommitFeed(base_url, "michligtenberg2/travelbot", background=False)
+        self.addCleanup(feed.stop)
+
+        with patch.object(app_module, 'commit_feed', feed):
+            first = self.client.get('/commits', headers={'X-API-KEY': 'k'})
+            again = self.client.get('/commits', headers={'X-API-KEY': 'k', 'If-None-Match': first.headers['ETag']})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.get_json()), 5)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(server.calls, 1)
+
+    def test_geo_proxy_routes(self):
+        """The geo proxy needs no API key and turns a full rate limit into 503 + Retry-After"""
+        import app as app_module
+        from geo_proxy import RateLimited
+
+        with patch.object(app_module.geo_proxy, 'reverse', return_value={"display_name": "Dam"}) as reverse:
+            response = self.client.get('/api/geocode/reverse?lat=52.373&lon=4.893&accept-language=en')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"display_name": "Dam"})
+        reverse.assert_called_once_with(52.373, 4.893, 18, 'en')
+        self.assertIn('max-age', response.headers['Cache-Control'])
+
+        with patch.object(app_module.geo_proxy, 'pois', side_effect=RateLimited("overpass", 2.4)):
+            response = self.client.get('/api/pois?lat=52.373&lon=4.893')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '2')
+
+        self.assertEqual(self.client.get('/api/geocode/search').status_code, 400)
+
+    def test_location_comment_records_place_in_session(self):
+        """/api/location-comment maps the webapp persona, accepts a session token and remembers the place"""
+        import app as app_module
+        from response_cache import MemoryStore
+        from session_store import SessionStore
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        store = SessionStore()
+        with patch.object(app_module, 'session_store', store), \
+                patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat', return_value="Kijk, de Westerkerk.") as chat:
+            response = self.client.post('/api/location-comment', headers=self.session_headers(), json={
+                "persona": "belg", "language": "nl", "context": {"lat": 52.374, "lon": 4.884}})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["comment"], "Kijk, de Westerkerk.")
+        self.assertIn("Belg", chat.call_args[0][0][1]["content"])
+        self.assertEqual(store.places(data["session_id"]), ["Westerkerk"])
+
+        response = self.client.post('/api/location-comment', headers=self.session_headers(),
+                                    json={"persona": "belg", "context": {}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_location_comment_skips_generation_when_nothing_changed(self):
+        """Standing still or staying at the same article is answered without a new completion"""
+        import app as app_module
+        from instrumentation import GENERATIONS_AVOIDED
+        from response_cache import MemoryStore
+        from session_store import SessionStore
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        cache = app_module.ResponseCache(MemoryStore(), variants=2)
+        key = app_module.fingerprint("Westerkerk", "Jordanees", "nl")
+        cache.add(key, "Uit de cache.")
+        before = {(reason, reply): GENERATIONS_AVOIDED.value(reason=reason, reply=reply)
+                  for reason in ("stationary", "same_place") for reply in ("variant", "nothing_new")}
+
+        headers = self.session_headers("sessie-789")
+
+        def post(lat, lon):
+            return self.client.post('/api/location-comment', headers=headers, json={
+                "persona": "amsterdammer", "context": {"lat": lat, "lon": lon}}).get_json()
+
+        with patch.object(app_module, 'session_store', SessionStore()), \
+                patch.object(app_module, 'response_cache', cache), \
+                patch.object(app_module, 'refresh_executor', ImmediateExecutor()), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup) as lookup, \
+                patch.object(app_module.llm_client, 'chat', return_value="Nieuw gemaakt.") as chat:
+            first = post(52.3740, 4.8840)
+            stationary = post(52.3741, 4.8841)
+            moved = post(52.3760, 4.8840)
+
+        # De halfvolle pool antwoordt meteen en wordt op de achtergrond aangevuld
+        self.assertEqual((first["comment"], first["novel"]), ("Uit de cache.", True))
+        self.assertEqual((stationary["comment"], stationary["novel"]), ("Nieuw gemaakt.", False))
+        self.assertEqual((moved["comment"], moved["novel"]), (None, False))
+        self.assertEqual(chat.call_count, 1)
+        self.assertEqual(lookup.call_count, 2)
+        self.assertEqual(GENERATIONS_AVOIDED.value(reason="stationary", reply="variant"),
+                         before[("stationary", "variant")] + 1)
+        self.assertEqual(GENERATIONS_AVOIDED.value(reason="same_place", reply="nothing_new"),
+                         before[("same_place", "nothing_new")] + 1)
+
+    def test_location_comment_without_title_is_never_the_same_place(self):
+        """Places without an article or name are compared by distance only, so moving gives a new comment"""
+        import app as app_module
+        from session_store import SessionStore
+
+        async def no_article(lat, lon, deadline=None):
+            return None, "Er is hier niet veel bijzonders."
+
+        headers = self.session_headers("sessie-790")
+        replies = iter(["Eerste.", "Tweede."])
+        with patch.object(app_module, 'session_store', SessionStore()), \
+                patch.object(app_module, 'lookup_place', side_effect=no_article), \
+                patch.object(app_module.llm_client, 'chat', side_effect=lambda *a, **k: next(replies)):
+            texts = [self.client.post('/api/location-comment', headers=headers, json={
+                "persona": "amsterdammer", "context": {"lat": lat, "lon": 4.8840}}).get_json()
+                for lat in (52.3740, 52.3800)]
+
+        self.assertEqual([(t["comment"], t["novel"]) for t in texts], [("Eerste.", True), ("Tweede.", True)])
+
+    def test_persona_chat_keeps_context_on_the_server(self):
+        """/api/persona-chat sends recent places and earlier turns from the session store"""
+        import app as app_module
+        from session_store import SessionStore
+
+        store = SessionStore()
+        store.add_place("sessie-123", "Westerkerk")
+        replies = iter(["Eerste antwoord.", "Tweede antwoord."])
+        with patch.object(app_module, 'session_store', store), \
+                patch.object(app_module.llm_client, 'chat', side_effect=lambda *a, **k: next(replies)) as chat:
+            headers = self.session_headers("sessie-123")
+            first = self.client.post('/api/persona-chat', headers=headers, json={
+                "message": "Waar zijn we?", "persona": "amsterdammer"})
+            second = self.client.post('/api/persona-chat', headers=headers, json={
+                "message": "En nu?", "persona": "amsterdammer"})
+
+        self.assertEqual(first.get_json(), {"response": "Eerste antwoord.", "session_id": "sessie-123"})
+        self.assertEqual(second.get_json()["response"], "Tweede antwoord.")
+        messages = chat.call_args[0][0]
+        self.assertIn("Jordaan", messages[0]["content"])
+        self.assertIn("Westerkerk", messages[0]["content"])
+        self.assertEqual([m["content"] for m in messages[1:]], ["Waar zijn we?", "Eerste antwoord.", "En nu?"])
+
+        self.assertEqual(self.client.post('/api/persona-chat', headers=headers, json={"message": " "}).status_code, 400)
+
+    def test_persona_chat_falls_back_without_openai(self):
+        """A failed completion gives the fallback reply and leaves the history untouched"""
+        import app as app_module
+        from llm_client import LLMError
+        from session_store import SessionStore
+
+        store = SessionStore()
+        with patch.object(app_module, 'session_store', store), \
+                patch.object(app_module.llm_client, 'chat', side_effect=LLMError("timeout")):
+            response = self.client.post('/api/persona-chat', headers=self.session_headers("sessie-456"),
+                                        json={"message": "Hoi"})
+        self.assertEqual(response.get_json()["response"], app_module.FALLBACK_REPLY)
+        self.assertEqual(store.history("sessie-456"), [])
+
+    def test_prefetch_fills_cache_for_the_next_comment(self):
+        """Places ahead get one drafted comment each, so /comment there is a cache hit"""
+        import app as app_module
+        from prefetch import PrefetchQueue
+        from response_cache import MemoryStore
+
+        looked_up = []
+
+        async def fake_lookup(lat, lon, deadline=None):
+            looked_up.append((lat, lon))
+            return "Westerkerk", "De Westerkerk is een kerk."
+
+        replies = iter(f"Variant {i}." for i in range(10))
+        queue = PrefetchQueue(app_module.prefetch_place, max_size=8, workers=1)
+        self.addCleanup(queue.stop)
+        refreshes = MagicMock()
+        with patch.object(app_module, 'prefetch_queue', queue), \
+                patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'refresh_executor', refreshes), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(app_module.llm_client, 'chat', side_effect=lambda *a, **k: next(replies)) as chat:
+            response = self.client.post('/api/prefetch', headers=self.session_headers(), json={
+                "lat": 52.374, "lon": 4.884, "heading": 90, "speed": 30, "persona": "amsterdammer"})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()["points"], 6)
+            self.assertTrue(queue.join(5))
+            self.assertEqual(len(looked_up), 6)
+            self.assertEqual(chat.call_count, 1)  # alle punten komen uit bij hetzelfde artikel
+
+            text = self.client.post('/comment', json={"lat": 52.374, "lon": 4.884},
+                                    headers={'X-API-KEY': 'k'}).get_json()["text"]
+            self.assertEqual(chat.call_count, 1)  # de opmerking kwam uit de cache, zonder live completion
+            self.assertEqual(refreshes.submit.call_count, 1)  # de rest van de pool vult zich op de achtergrond
+            self.client.post('/api/prefetch', headers=self.session_headers(), json={"lat": 52.374, "lon": 4.884})
+            self.assertTrue(queue.join(5))
+        self.assertEqual(chat.call_count, 1)  # een plek met een variant krijgt geen nieuwe
+        self.assertEqual(text, "Variant 0.")
+
+        self.assertEqual(self.client.post('/api/prefetch', headers={'X-API-KEY': 'k'},
+                                          json={"lat": "hier"}).status_code, 400)
+
+    def test_webapp_endpoints_need_a_key_or_session_token(self):
+        """LLM-backed webapp routes refuse anonymous calls; token holders get a strict limit per session"""
+        import app as app_module
+        from admission import AdmissionController, LocalBuckets
+
+        body = {"message": "Hoi"}
+        self.assertEqual(self.client.post('/api/persona-chat', json=body).status_code, 401)
+        self.assertEqual(self.client.post('/api/persona-chat', json=body,
+                                          headers={'X-Session-Token': 'vervalst'}).status_code, 401)
+        self.assertIsNone(app_module.session_from_token(
+            app_module.URLSafeTimedSerializer("andere-sleutel", salt="travelbot-webapp-session").dumps("sessie-1")))
+
+        headers = self.session_headers("sessie-321")
+        with patch.object(app_module, 'webapp_admission', AdmissionController(LocalBuckets(), rate=0.01, burst=8)), \
+                patch.object(app_module.llm_client, 'chat', return_value="Hallo."):
+            statuses = [self.client.post('/api/persona-chat', json=body, headers=headers).status_code
+                        for _ in range(3)]
+            # Een andere sessie achter hetzelfde IP-adres heeft een eigen bucket
+            other_session = self.client.post('/api/persona-chat', json=body,
+                                             headers=self.session_headers("sessie-654"))
+            with_key = self.client.post('/api/persona-chat', json=body, headers={'X-API-KEY': 'k'})
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(other_session.status_code, 200)
+        self.assertEqual(with_key.status_code, 200)
+
+    def test_forwarded_clients_get_their_own_bucket(self):
+        """Behind a trusted proxy, anonymous clients are keyed on their X-Forwarded-For address"""
+        import app as app_module
+        from admission import AdmissionController, LocalBuckets
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        def session(client):
+            return self.client.post('/api/session', json={}, headers={'X-Forwarded-For': client}).status_code
+
+        with patch.object(app_module.app, 'wsgi_app', ProxyFix(app_module.app.wsgi_app, x_for=1)), \
+                patch.object(app_module, 'webapp_admission', AdmissionController(LocalBuckets(), rate=0.01, burst=8)):
+            first = [session('203.0.113.7') for _ in range(3)]
+            other = session('198.51.100.4')
+            spoofed = session('198.51.100.4, 203.0.113.7')  # alleen het laatste adres komt van de proxy
+        self.assertEqual(first, [200, 200, 429])
+        self.assertEqual(other, 200)
+        self.assertEqual(spoofed, 429)
+        with patch.object(app_module, 'TRUSTED_PROXIES', 1):
+            self.assertEqual(app_module.forwarded_client('10.0.0.1', '1.2.3.4, 203.0.113.7'), '203.0.113.7')
+        self.assertEqual(app_module.forwarded_client('10.0.0.1', '203.0.113.7'), '10.0.0.1')
+
+    def test_prefetch_is_charged_per_point(self):
+        """Each point ahead costs tokens; once the bucket is empty the furthest points are not queued"""
+        import app as app_module
+        from admission import AdmissionController, LocalBuckets
+
+        queue = MagicMock()
+        queue.submit.return_value = "queued"
+        with patch.object(app_module, 'admission', AdmissionController(LocalBuckets(), rate=0.01, burst=10)), \
+                patch.object(app_module, 'prefetch_queue', queue):
+            response = self.client.post('/api/prefetch', headers={'X-API-KEY': 'k'},
+                                        json={"lat": 52.374, "lon": 4.884, "heading": 90, "speed": 30})
+        self.assertEqual(response.status_code, 202)
+        # burst 10, achtergrondbaan 7,5 tokens: 1 voor het verzoek en 3 punten van 2
+        self.assertEqual(response.get_json()["queued"], 3)
+        self.assertEqual(response.get_json()["rate_limited"], 3)
+        self.assertEqual(queue.submit.call_count, 3)
+
+    def test_flooding_a_key_gets_fast_429_with_retry_after(self):
+        """Once a key's bucket is empty, requests are refused with 429 instead of queued"""
+        import app as app_module
+        from admission import AdmissionController, LocalBuckets
+
+        with patch.object(app_module, 'admission', AdmissionController(LocalBuckets(), rate=0.5, burst=8)), \
+                patch.object(app_module.persona_registry, 'listing', return_value=(b"[]", "etag")):
+            statuses = [self.client.get('/personas', headers={'X-API-KEY': 'flood'}).status_code
+                        for _ in range(9)]
+            refused = self.client.get('/personas', headers={'X-API-KEY': 'flood'})
+            other = self.client.get('/personas', headers={'X-API-KEY': 'rustig'})
+            background = self.client.get('/personas', headers={'X-API-KEY': 'achtergrond',
+                                                               'X-Priority': 'background'})
+            metrics = self.client.get('/metrics', headers={'X-API-KEY': 'flood'})
+
+        self.assertEqual(statuses, [200] * 8 + [429])
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused.headers['Retry-After'], '2')
+        self.assertEqual(refused.get_json()["reason"], "rate_limited")
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(background.status_code, 200)
+        self.assertEqual(metrics.status_code, 200)
+        self.assertEqual(app_module.request_lane('prefetch', None), 'background')
+
+    def test_swagger_docs_are_built_on_first_visit(self):
+        """The API docs are served from a lazily built Swagger app with the real routes"""
+        response = self.client.get('/apispec_1.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/comment', response.get_json()["paths"])
+        self.assertTrue(self.app.wsgi_app.loaded)
+
+    def test_comments_batch_dedupes_and_keeps_order(self):
+        """Nearby points and repeated articles share one comment, in route order"""
+        import app as app_module
+        from response_cache import MemoryStore
+
+        titles = {52.3731: "Westerkerk", 52.3800: "Anne Frank Huis", 52.3900: "Westerkerk"}
+
+        async def fake_lookup(lat, lon, deadline=None):
+            title = titles[round(lat, 4)]
+            return title, f"Over {title}."
+
+        points = [{"lat": 52.37310, "lon": 4.8840}, {"lat": 52.37312, "lon": 4.8841},
+                  {"lat": 52.3800, "lon": 4.8840}, {"lat": 52.3900, "lon": 4.8840}]
+        with patch.object(app_module, 'response_cache', app_module.ResponseCache(MemoryStore())), \
+                patch.object(app_module, 'lookup_place', side_effect=fake_lookup) as lookup, \
+                patch.object(app_module.llm_client, 'chat',
+                             side_effect=lambda messages, **k: messages[1]["content"].split("plek:\n")[1][:20]):
+            response = self.client.post('/comments/batch', json={"points": points},
+                                        headers={'X-API-KEY': 'test_key'})
+
+        self.assertEqual(response.status_code, 200)
+        comments = response.get_json()["comments"]
+        self.assertEqual(lookup.call_count, 3)
+        self.assertEqual([c["index"] for c in comments], [0, 2])
+        self.assertEqual([c["title"] for c in comments], ["Westerkerk", "Anne Frank Huis"])
+        self.assertTrue(comments[1]["text"].startswith("Over Anne Frank Huis"))
+
+    def test_comments_batch_shares_one_completion_for_untitled_places(self):
+        """Places without an article stay separate in the result but cost a single completion"""
+        import app as app_module
+
+        async def no_article(lat, lon, deadline=None):
+            return None, "Er is hier niet veel bijzonders."
+
+        points = [{"lat": 52.0 + i / 10, "lon": 4.9} for i in range(20)]
+        with patch.object(app_module, 'lookup_place', side_effect=no_article), \
+                patch.object(app_module.llm_client, 'chat', return_value="Weiland, gozer.") as chat:
+            response = self.client.post('/comments/batch', json={"points": points},
+                                        headers={'X-API-KEY': 'test_key'})
+
+        comments = response.get_json()["comments"]
+        self.assertEqual(len(comments), 20)
+        self.assertEqual({c["text"] for c in comments}, {"Weiland, gozer."})
+        self.assertEqual(chat.call_count, 1)
+
+    def test_comments_batch_rejects_invalid_points(self):
+        """A batch without valid points is rejected"""
+        response = self.client.post('/comments/batch', json={"points": [{"lat": "x"}]},
+                                    headers={'X-API-KEY': 'test_key'})
+        self.assertEqual(response.status_code, 400)
+
     def test_comment_endpoint_missing_api_key(self):
         """Test comment endpoint without API key"""
         response = self.client.post('/comment', 
@@ -117,6 +743,108 @@ class TestApp(unittest.TestCase):
         data = response.get_json()
         self.assertIn("Persona not found", data["error"])
 
+    def test_personas_listing_supports_etag(self):
+        """The persona listing carries an ETag and answers 304 when unchanged"""
+        response = self.client.get('/personas', headers={'X-API-KEY': 'test_key'})
+        self.assertEqual(response.status_code, 200)
+        names = [p["name"] for p in response.get_json()]
+        self.assertIn("Heino", names)
+        etag = response.headers['ETag']
+
+        response = self.client.get('/personas', headers={'X-API-KEY': 'test_key', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_compress_unknown_image(self):
+        """Unknown images and variant names give 404"""
+        response = self.client.get('/compress/missing.jpg', headers={'X-API-KEY': 'test_key'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/images/missing.jpg', headers={'X-API-KEY': 'test_key'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_compress_serves_immutable_variant(self):
+        """/compress points at a hash-named variant that /images serves as immutable"""
+        import tempfile
+        from PIL import Image
+        import app as app_module
+        from image_pipeline import ImagePipeline
+
+        with tempfile.TemporaryDirectory() as tmp:
+            Image.new("RGB", (100, 50)).save(os.path.join(tmp, "kaart.png"))
+            pipeline = ImagePipeline(tmp, os.path.join(tmp, "out"), widths=(64,), workers=1, formats=["jpeg"])
+            with patch.object(app_module, 'image_pipeline', pipeline):
+                response = self.client.get('/compress/kaart.png?w=60', headers={'X-API-KEY': 'test_key'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, 'image/jpeg')
+                self.assertIn('Accept', response.headers['Vary'])
+                location = response.headers['Content-Location']
+                response.close()
+
+                response = self.client.get(location, headers={'X-API-KEY': 'test_key'})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('immutable', response.headers['Cache-Control'])
+                response.close()
+            pipeline.shutdown()
+
+    def test_build_prompt_english(self):
+        """English prompts use the English template for the persona"""
+        prompt = self.build_prompt("Test summary.", question="What is this?", style="Belg", language="en")
+        self.assertIn("You are Heino, a cheerful Belgian from Antwerp", prompt)
+        self.assertIn("Someone asks you: 'What is this?'", prompt)
+
+    def test_build_prompt_uses_registered_persona(self):
+        """A style naming a JSON persona uses that persona's description"""
+        prompt = self.build_prompt("Test summary.", style="Sergio Herman")
+        self.assertIn("topchef", prompt)
+        self.assertIn("Test summary.", prompt)
+
+    def test_marketplace_is_paginated_searchable_and_compressed(self):
+        """Uploads are indexed immediately; pages are gzip'd, ETag'd and linked by a cursor"""
+        import gzip
+        import tempfile
+        import app as app_module
+        from lazy import Lazy
+        from marketplace_index import MarketplaceIndex
+        from persona_registry import PersonaRegistry
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        directories = {"personas": os.path.join(tmp.name, "personas"),
+                       "marketplace": os.path.join(tmp.name, "marketplace")}
+        for directory in directories.values():
+            os.mkdir(directory)
+        index = Lazy(lambda: MarketplaceIndex(":memory:", directories, sync_interval=3600))
+        index.resolve()  # al geopend, zoals na het eerste /marketplace-verzoek
+        with patch.object(app_module, 'persona_registry', PersonaRegistry(directories)), \
+                patch.object(app_module, 'marketplace_index', index):
+            for i in range(5):
+                traits = {"hobby": "zeilen"} if i == 3 else {"hobby": "wandelen"}
+                response = self.client.post('/upload-persona', headers={'X-API-KEY': 'k'}, json={
+                    "name": f"Gids {i}", "description": "Vertelt over de streek.", "traits": traits})
+                self.assertEqual(response.status_code, 200)
+
+            first = self.client.get('/marketplace?limit=3', headers={'X-API-KEY': 'k', 'Accept-Encoding': 'gzip'})
+            self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', first.headers['Vary'])
+            page = json.loads(gzip.decompress(first.get_data()))
+            self.assertEqual(page["total"], 5)
+            self.assertEqual([p["name"] for p in page["items"]], ["Gids 0", "Gids 1", "Gids 2"])
+
+            second = self.client.get(f'/async_marketplace?limit=3&cursor={page["next_cursor"]}',
+                                     headers={'X-API-KEY': 'k'}).get_json()
+            self.assertEqual([p["name"] for p in second["items"]], ["Gids 3", "Gids 4"])
+            self.assertIsNone(second["next_cursor"])
+
+            cached = self.client.get('/marketplace?limit=3', headers={
+                'X-API-KEY': 'k', 'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+            self.assertEqual(cached.status_code, 304)
+
+            found = self.client.get('/marketplace?q=zeil', headers={'X-API-KEY': 'k'}).get_json()
+            self.assertEqual([p["slug"] for p in found["items"]], ["gids_3"])
+            self.assertEqual(found["sort"], "relevance")
+
+            self.assertEqual(self.client.get('/marketplace?sort=prijs', headers={'X-API-KEY': 'k'}).status_code, 400)
+            self.assertEqual(self.client.get('/marketplace?cursor=kapot', headers={'X-API-KEY': 'k'}).status_code, 400)
+
     def test_upload_persona_missing_data(self):
         """Test uploading persona with missing data"""
         persona_data = {"name": "test_persona"}  # Missing description
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from async_runtime import AsyncRuntime
+from response_cache import MemoryStore
+
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        # Same environment as test_app: whichever test imports the app first fixes it
+        os.environ.setdefault('OPENAI_API_KEY', 'test_key')
+        os.environ.setdefault('ADMIN_USERNAME', 'test_admin')
+        os.environ.setdefault('ADMIN_PASSWORD', 'test_password')
+        import app
+        import asgi
+        from admission import AdmissionController, LocalBuckets
+        self.app_module = app
+        self.asgi = asgi
+        # Rate limiting is tested separately; here it must not depend on earlier tests
+        patcher = patch.object(app, 'admission', AdmissionController(LocalBuckets(), enabled=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, method, path, **kwargs):
+        async def send():
+            transport = httpx.ASGITransport(app=self.asgi.application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://travelbot") as client:
+                return await client.request(method, path, **kwargs)
+        return asyncio.run(send())
+
+    def test_native_comment_is_rate_limited(self):
+        """The async /comment applies the same admission control as the Flask routes"""
+        from admission import AdmissionController, LocalBuckets
+
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Munttoren", "De Munttoren staat aan het Muntplein."
+
+        async def fake_achat(client, messages, temperature=0.8):
+            return "Die toren, gozer."
+
+        controller = AdmissionController(LocalBuckets(), rate=0.1, burst=4)
+        with patch.object(self.app_module, 'admission', controller), \
+                patch.object(self.app_module, 'response_cache', self.app_module.ResponseCache(MemoryStore())), \
+                patch.object(self.app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(self.app_module.llm_client, 'achat', side_effect=fake_achat):
+            first = self.request("POST", "/comment", json={"lat": 52.36, "lon": 4.89}, headers={"X-API-KEY": "k"})
+            second = self.request("POST", "/comment", json={"lat": 52.36, "lon": 4.89}, headers={"X-API-KEY": "k"})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second.headers["retry-after"], "40")
+        self.assertEqual(controller.stats()["in_flight"]["interactive"], 0)
+
+    def test_comment_is_served_natively(self):
+        """POST /comment runs on the async path with the async LLM client"""
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Munttoren", "De Munttoren staat aan het Muntplein."
+
+        async def fake_achat(client, messages, temperature=0.8):
+            return "Die toren, gozer."
+
+        with patch.object(self.app_module, 'response_cache', self.app_module.ResponseCache(MemoryStore())), \
+                patch.object(self.app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(self.app_module.llm_client, 'achat', side_effect=fake_achat), \
+                patch.object(self.app_module.llm_client, 'chat') as sync_chat:
+            response = self.request("POST", "/comment", json={"lat": 52.367, "lon": 4.893},
+                                    headers={"X-API-KEY": "test_key"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"text": "Die toren, gozer."})
+        self.assertEqual(response.headers["access-control-allow-origin"], "*")
+        sync_chat.assert_not_called()
+
+    def test_comment_validation(self):
+        """The native route keeps the API-key and coordinate checks"""
+        self.assertEqual(self.request("POST", "/comment", json={"lat": 52.3}).status_code, 401)
+        response = self.request("POST", "/comment", json={"lat": 52.3}, headers={"X-API-KEY": "k"})
+        self.assertEqual(response.status_code, 400)
+        response = self.request("POST", "/comment", content=b"{", headers={"X-API-KEY": "k"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_routes_go_through_flask(self):
+        """Routes without a native handler are served by the Flask app"""
+        response = self.request("GET", "/personas", headers={"X-API-KEY": "test_key"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response.headers)
+
+    def test_many_slow_completions_run_concurrently(self):
+        """Hundreds of slow completions overlap instead of queueing behind threads"""
+        async def fake_lookup(lat, lon, deadline=None):
+            return f"Plek {lat}", "Een plek."
+
+        async def slow_achat(client, messages, temperature=0.8):
+            await asyncio.sleep(0.2)
+            return "Eindelijk."
+
+        async def burst():
+            transport = httpx.ASGITransport(app=self.asgi.application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://travelbot") as client:
+                return await asyncio.gather(*(
+                    client.post("/comment", json={"lat": 52 + i / 1000, "lon": 4.9}, headers={"X-API-KEY": "k"})
+                    for i in range(1, 301)
+                ))
+
+        with patch.object(self.app_module, 'response_cache', self.app_module.ResponseCache(MemoryStore())), \
+                patch.object(self.app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(self.app_module.llm_client, 'achat', side_effect=slow_achat):
+            start = time.perf_counter()
+            responses = asyncio.run(burst())
+            elapsed = time.perf_counter() - start
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertLess(elapsed, 3.0)
+
+    def test_slow_completion_falls_back_within_budget(self):
+        """A completion that outlasts the latency budget yields the local persona line"""
+        async def fake_lookup(lat, lon, deadline=None):
+            return "Munttoren", "De Munttoren staat aan het Muntplein."
+
+        async def slow_achat(client, messages, temperature=0.8):
+            await asyncio.sleep(1)
+            return "Te laat."
+
+        with patch.object(self.app_module, 'COMMENT_LATENCY_BUDGET', 0.1), \
+                patch.object(self.app_module, 'response_cache', self.app_module.ResponseCache(MemoryStore())), \
+                patch.object(self.app_module, 'lookup_place', side_effect=fake_lookup), \
+                patch.object(self.app_module.llm_client, 'achat', side_effect=slow_achat):
+            start = time.perf_counter()
+            response = self.request("POST", "/comment", json={"lat": 52.367, "lon": 4.893},
+                                    headers={"X-API-KEY": "test_key"})
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Munttoren staat aan het Muntplein.", response.json()["text"])
+        self.assertLess(elapsed, 0.8)
+
+    def test_lifespan_attaches_runtime_to_server_loop(self):
+        """On startup the shared runtime adopts the server's loop; on shutdown it closes its client"""
+        runtime = AsyncRuntime(lag_interval=0)
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+            if message["type"] == "lifespan.startup.complete":
+                self.assertIs(runtime.loop, asyncio.get_running_loop())
+                with self.assertRaises(RuntimeError):
+                    runtime.run(asyncio.sleep(0))
+
+        with patch.object(self.asgi, 'runtime', runtime):
+            asyncio.run(self.asgi.application({"type": "lifespan"}, receive, send))
+
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertIsNone(runtime._client)
+
+
+if __name__ == "__main__":
+    unittest.main()
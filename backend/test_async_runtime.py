@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import unittest
+
+from async_runtime import AsyncRuntime
+
+
+class TestAsyncRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = AsyncRuntime(max_connections=4, max_keepalive=2)
+
+    def tearDown(self):
+        self.runtime.shutdown()
+
+    def test_run_uses_one_background_loop(self):
+        """Coroutines from different threads run on the same loop"""
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        loops = []
+        threads = [threading.Thread(target=lambda: loops.append(self.runtime.run(current_loop())))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(map(id, loops))), 1)
+        self.assertIs(loops[0], self.runtime.loop)
+
+    def test_client_is_shared(self):
+        """The pooled client is created once and reused"""
+        self.assertIs(self.runtime.client, self.runtime.client)
+        self.assertEqual(self.runtime.limits.max_connections, 4)
+
+    def test_shutdown_closes_client_and_loop(self):
+        """Shutdown closes the client and stops the loop thread"""
+        client = self.runtime.client
+        loop = self.runtime.loop
+        self.runtime.shutdown()
+        self.assertTrue(client.is_closed)
+        self.assertTrue(loop.is_closed())
+        # Na een shutdown start de runtime bij gebruik opnieuw op
+        self.assertEqual(self.runtime.run(asyncio.sleep(0, result=42)), 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from cache_backends import SharedCache, SharedMemoryCache, init_cache
+
+
+def _write_from_child(path):
+    SharedMemoryCache(path=path, slots=64, slot_size=1024).set("kind", {"van": "child"})
+
+
+def _increment_from_child(path, times):
+    cache = SharedMemoryCache(path=path, slots=64, slot_size=1024)
+    for _ in range(times):
+        cache.update("teller", lambda value: ((value or 0) + 1, None))
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "shm-cache")
+        self.cache = SharedMemoryCache(path=self.path, slots=64, slot_size=1024)
+
+    def test_set_get_delete(self):
+        """Values round-trip through the mapped file"""
+        self.assertTrue(self.cache.set("a", {"x": 1}))
+        self.assertEqual(self.cache.get("a"), {"x": 1})
+        self.assertTrue(self.cache.delete("a"))
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_add_only_when_missing(self):
+        """add() refuses to overwrite a live entry, which makes it usable as a lock"""
+        self.assertTrue(self.cache.add("lock", "een"))
+        self.assertFalse(self.cache.add("lock", "twee"))
+        self.assertEqual(self.cache.get("lock"), "een")
+
+    def test_expiry_and_oversized_values(self):
+        """Expired entries vanish and values larger than a slot are not stored"""
+        self.cache.set("kort", 1, timeout=1)
+        with patch("cache_backends.time.time", return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get("kort"))
+        self.assertFalse(self.cache.set("groot", "x" * 2048))
+
+    def test_mismatched_layout_is_refused(self):
+        """A worker configured with another slot layout refuses the file instead of misreading it"""
+        self.cache.set("a", 1)
+        with self.assertRaisesRegex(ValueError, "CACHE_SHM_SLOTS"):
+            SharedMemoryCache(path=self.path, slots=128, slot_size=1024)
+        with self.assertRaisesRegex(ValueError, "CACHE_SHM_SLOT_SIZE"):
+            SharedMemoryCache(path=self.path, slots=64, slot_size=2048)
+        with open(self.path + "-oud", "wb") as f:
+            f.write(b"\0" * 64 * 1024)
+        with self.assertRaisesRegex(ValueError, "geen SharedMemoryCache"):
+            SharedMemoryCache(path=self.path + "-oud", slots=64, slot_size=1024)
+        self.assertEqual(SharedMemoryCache(path=self.path, slots=64, slot_size=1024).get("a"), 1)
+        self.cache.clear()
+        self.assertEqual(SharedMemoryCache(path=self.path, slots=64, slot_size=1024).get("a"), None)
+
+    def test_visible_across_processes(self):
+        """A value written by another process is visible through the same file"""
+        child = multiprocessing.get_context("fork").Process(target=_write_from_child, args=(self.path,))
+        child.start()
+        child.join()
+        self.assertEqual(self.cache.get("kind"), {"van": "child"})
+
+
+    def test_update_is_atomic_across_processes(self):
+        """Concurrent read-modify-write from several processes loses no updates"""
+        context = multiprocessing.get_context("fork")
+        children = [context.Process(target=_increment_from_child, args=(self.path, 200)) for _ in range(3)]
+        for child in children:
+            child.start()
+        _increment_from_child(self.path, 200)
+        for child in children:
+            child.join()
+        self.assertEqual(self.cache.get("teller"), 800)
+        self.assertEqual(self.cache.update("teller", lambda value: (value, value * 2)), 1600)
+
+class TestSharedCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.env = patch.dict(os.environ, {"CACHE_BACKEND": "shm",
+                                           "CACHE_SHM_PATH": os.path.join(tmp.name, "shm")})
+        self.env.start()
+        self.addCleanup(self.env.stop)
+
+    def make(self):
+        return SharedCache(init_cache(Flask(__name__)), poll_interval=0.01)
+
+    def test_single_flight_across_threads_and_workers(self):
+        """Concurrent misses on one key, even from separate cache instances, compute once"""
+        workers = [self.make(), self.make()]
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "waarde"
+
+        results = []
+        threads = [threading.Thread(target=lambda w=w: results.append(w.get_or_compute("k", compute)))
+                   for w in workers * 4]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["waarde"] * 8)
+        self.assertEqual(sum(w.stats()["computes"] for w in workers), 1)
+        self.assertEqual(workers[0].stats()["backend"], "SharedMemoryCache")
+
+    def test_unknown_backend(self):
+        """An unknown CACHE_BACKEND is a configuration error"""
+        with patch.dict(os.environ, {"CACHE_BACKEND": "memcached-ish"}):
+            with self.assertRaises(ValueError):
+                init_cache(Flask(__name__))
+
+    def test_shm_rejected_without_fcntl(self):
+        """Without fcntl (Windows) CACHE_BACKEND=shm fails with a clear configuration error"""
+        with patch.dict(os.environ, {"CACHE_BACKEND": "shm"}), \
+                patch("cache_backends.shm_supported", return_value=False):
+            with self.assertRaisesRegex(ValueError, "fcntl"):
+                init_cache(Flask(__name__))
+
+
+if __name__ == '__main__':
+    unittest.main()
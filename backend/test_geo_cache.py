@@ -0,0 +1,68 @@
+import unittest
+
+from geo_cache import TTLCache, geo_cell
+from test_support import FakeClock
+
+
+class TestGeoCell(unittest.TestCase):
+
+    def test_nearby_points_share_cell(self):
+        """Points a few meters apart map to the same cell"""
+        self.assertEqual(geo_cell(52.37301, 4.89201), geo_cell(52.37305, 4.89208))
+
+    def test_distant_points_differ(self):
+        """Points in different city blocks map to different cells"""
+        self.assertNotEqual(geo_cell(52.3730, 4.8920), geo_cell(52.3800, 4.8920))
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hit_and_miss_counters(self):
+        """Lookups are counted as hits or misses"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "waarde")
+        self.assertEqual(cache.get("a"), "waarde")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_entries_expire(self):
+        """Entries are dropped once their TTL has passed"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=4, ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.now = 9.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_entries_are_kept_for_get_stale(self):
+        """Expired entries stay available to get_stale within the stale window"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=4, ttl=10, clock=clock, stale_ttl=5)
+        cache.set("a", 1)
+        clock.now = 12
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stale("a"), 1)
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+        clock.now = 15
+        self.assertIsNone(cache.get_stale("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first"""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
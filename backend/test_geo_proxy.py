@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from flask import Flask
+
+from benchmarks.stubs import NominatimStub, OverpassStub, start_stub
+from cache_backends import SharedCache, init_cache
+from geo_proxy import GeoProxy, OutboundRateLimiter, RateLimited, distance_m
+from test_support import FakeClock
+
+
+class TestOutboundRateLimiter(unittest.TestCase):
+
+    def test_one_request_per_slot(self):
+        """Callers are spaced one interval apart and give up after max_wait"""
+        clock = FakeClock(1000.0)
+        cache = init_cache(Flask(__name__))
+        limiter = OutboundRateLimiter(cache, "test_slots", rate=1.0, max_wait=1.5, clock=clock, sleep=clock.sleep)
+        limiter.acquire()
+        self.assertEqual(clock.now, 1000.0)
+        limiter.acquire()
+        self.assertEqual(clock.now, 1001.0)
+        clock.now = 1001.2
+        with self.assertRaises(RateLimited) as ctx:
+            OutboundRateLimiter(cache, "test_slots", rate=1.0, max_wait=0.5, clock=clock,
+                                sleep=clock.sleep).acquire()
+        self.assertAlmostEqual(ctx.exception.retry_after, 0.8)
+
+
+class TestGeoProxy(unittest.TestCase):
+
+    def setUp(self):
+        self.nominatim, nominatim_url = start_stub(NominatimStub)
+        self.overpass, overpass_url = start_stub(OverpassStub)
+        for server in (self.nominatim, self.overpass):
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+        self.proxy = GeoProxy(SharedCache(init_cache(Flask(__name__)), poll_interval=0.01),
+                              nominatim_url=nominatim_url, overpass_url=f"{overpass_url}/api/interpreter",
+                              nominatim_rate=1000, overpass_rate=1000, poi_max_radius=500)
+        self.addCleanup(self.proxy.close)
+
+    def test_reverse_is_cached_per_cell(self):
+        """Nearby coordinates share one Nominatim lookup for the cell centre"""
+        first = self.proxy.reverse(52.37301, 4.89201)
+        second = self.proxy.reverse(52.37305, 4.89205)
+        self.assertEqual(first, second)
+        self.assertEqual(first["address"]["road"], "Stubstraat")
+        self.assertEqual(self.nominatim.calls, 1)
+        self.proxy.reverse(52.38, 4.90)
+        self.assertEqual(self.nominatim.calls, 2)
+
+    def test_search_normalizes_query(self):
+        """Case and whitespace differences hit the same cache entry"""
+        self.proxy.search("Dam  Amsterdam")
+        self.proxy.search("dam amsterdam")
+        self.assertEqual(self.nominatim.calls, 1)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        """Simultaneous lookups for one cell send a single upstream request"""
+        self.nominatim.RequestHandlerClass.latency = 0.1
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.proxy.reverse(52.1, 4.1)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(self.nominatim.calls, 1)
+
+    def test_pois_share_one_tile_query(self):
+        """Clients in the same tile share one Overpass query and get their own radius filter"""
+        near = self.proxy.pois(52.3731, 4.8924, radius=150)["elements"]
+        other = self.proxy.pois(52.3761, 4.8964, radius=300, limit=3)["elements"]
+        self.assertEqual(self.overpass.calls, 1)
+        self.assertTrue(near)
+        self.assertTrue(all(distance_m(52.3731, 4.8924, e["lat"], e["lon"]) <= 150 for e in near))
+        distances = [distance_m(52.3761, 4.8964, e["lat"], e["lon"]) for e in other]
+        self.assertEqual(len(other), 3)
+        self.assertEqual(distances, sorted(distances))
+
+    def test_tile_margin_covers_max_radius(self):
+        """A client at the tile edge still sees POIs across the boundary"""
+        tile_edge = 52.37  # grens tussen twee tegels van 0.01 graad
+        elements = self.proxy.pois(tile_edge + 0.0001, 4.895, radius=500, limit=50)["elements"]
+        self.assertTrue(any(e["lat"] < tile_edge for e in elements))
+        self.assertEqual(self.overpass.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import time
+import unittest
+
+import httpx
+
+from benchmarks.stubs import GitHubStub, start_stub
+from github_commits import CommitFeed
+
+
+class TestCommitFeed(unittest.TestCase):
+
+    def start(self, **attrs):
+        server, base_url = start_stub(GitHubStub, **attrs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, base_url
+
+    def feed(self, base_url, **kwargs):
+        kwargs.setdefault("background", False)
+        feed = CommitFeed(base_url, "michligtenberg2/travelbot", **kwargs)
+        self.addCleanup(feed.stop)
+        return feed
+
+    def test_snapshot_holds_latest_page(self):
+        """The first snapshot has page_size commits, newest first, with a content ETag"""
+        server, base_url = self.start()
+        snapshot = self.feed(base_url, page_size=3).snapshot()
+        self.assertEqual([c["message"] for c in snapshot.commits], ["Commit 29", "Commit 28", "Commit 27"])
+        self.assertEqual(snapshot.commits[0]["author"], "Heino")
+        self.assertTrue(snapshot.etag)
+        self.assertEqual(server.calls, 1)
+
+    def test_unchanged_refresh_is_conditional(self):
+        """Refreshing an unchanged list gets a 304 that does not use up the rate limit"""
+        server, base_url = self.start()
+        feed = self.feed(base_url)
+        first = feed.snapshot()
+        self.assertFalse(feed.refresh())
+        self.assertFalse(feed.refresh())
+        self.assertIs(feed.snapshot(), first)
+        self.assertEqual(server.not_modified, 2)
+        self.assertEqual(server.rate_used, 1)
+
+    def test_new_commit_replaces_snapshot(self):
+        """A changed upstream list yields a new snapshot and ETag"""
+        server, base_url = self.start()
+        feed = self.feed(base_url)
+        first = feed.snapshot()
+        server.RequestHandlerClass.commits = 31
+        self.assertTrue(feed.refresh())
+        self.assertEqual(feed.snapshot().commits[0]["message"], "Commit 30")
+        self.assertNotEqual(feed.snapshot().etag, first.etag)
+
+    def test_failed_refresh_keeps_previous_snapshot(self):
+        """When GitHub fails after a good fetch, the old snapshot stays; without one the error surfaces"""
+        server, base_url = self.start()
+        feed = self.feed(base_url)
+        first = feed.snapshot()
+        server.RequestHandlerClass.error_status = 503
+        self.assertFalse(feed.refresh())
+        self.assertIs(feed.snapshot(), first)
+        self.assertIsNotNone(feed.stats()["last_error"])
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.feed(base_url).snapshot()
+
+    def test_background_refresh(self):
+        """The feed keeps checking GitHub on its own after the first request"""
+        server, base_url = self.start()
+        feed = self.feed(base_url, refresh_interval=0.02, background=True)
+        feed.snapshot()
+        deadline = time.monotonic() + 2
+        while getattr(server, "not_modified", 0) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(server.not_modified, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from image_pipeline import PREWARM_LOCK_TIMEOUT, ImagePipeline, encode_variant
+
+
+class TestImagePipeline(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source_dir = os.path.join(tmp.name, "images")
+        os.mkdir(self.source_dir)
+        Image.new("RGB", (800, 400), (200, 100, 50)).save(os.path.join(self.source_dir, "dam.png"))
+        self.pipeline = ImagePipeline(self.source_dir, os.path.join(tmp.name, "compressed"),
+                                      widths=(320, 640), qualities=(60, 85), workers=1,
+                                      formats=["webp", "jpeg"])
+        self.addCleanup(self.pipeline.shutdown)
+
+    def test_variant_is_resized_and_hash_named(self):
+        """Variants are encoded at the next configured width and named after the source hash"""
+        path = self.pipeline.get("dam.png", width=500, fmt="jpeg", quality=70)
+        digest = self.pipeline.content_hash("dam.png")
+        self.assertEqual(os.path.basename(path), f"dam-{digest}-640w-q85.jpg")
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (640, 320))
+        self.assertEqual(self.pipeline.variant_path(os.path.basename(path)), path)
+
+    def test_changed_source_gets_new_name(self):
+        """Rewriting the source changes the content hash and therefore the variant name"""
+        first = self.pipeline.get("dam.png", fmt="jpeg")
+        Image.new("RGB", (800, 400), (0, 0, 0)).save(os.path.join(self.source_dir, "dam.png"))
+        os.utime(os.path.join(self.source_dir, "dam.png"), ns=(1, 1))
+        self.assertNotEqual(self.pipeline.get("dam.png", fmt="jpeg"), first)
+
+    def test_format_negotiated_from_accept(self):
+        """Without fmt the smallest format the client accepts is chosen"""
+        self.assertTrue(self.pipeline.get("dam.png", accept="image/webp,*/*").endswith(".webp"))
+        self.assertTrue(self.pipeline.get("dam.png", accept="image/*").endswith(".jpg"))
+        with self.assertRaises(ValueError):
+            self.pipeline.get("dam.png", fmt="bmp")
+
+    def test_concurrent_misses_share_one_encode(self):
+        """Concurrent requests for a missing variant wait on the same job"""
+        futures = []
+        barrier = threading.Barrier(4)
+
+        def submit():
+            barrier.wait()
+            futures.append(self.pipeline._submit("dam.png", 320, "jpeg", 60)[1])
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        pending = {id(f) for f in futures if f is not None}
+        self.assertLessEqual(len(pending), 1)
+        self.assertTrue(os.path.exists(self.pipeline.get("dam.png", width=320, fmt="jpeg", quality=60)))
+
+    def test_warm_creates_all_variants(self):
+        """Warming a source schedules every width, format and quality"""
+        for future in self.pipeline.warm("dam.png"):
+            future.result()
+        self.assertEqual(len(os.listdir(self.pipeline.output_dir)), 3 * 2 * 2)
+        self.assertEqual(self.pipeline.warm("dam.png"), [])
+
+    def test_warm_once_runs_in_one_worker_per_source_state(self):
+        """Only the first pipeline on a shared output dir prewarms, until a source changes"""
+        other = ImagePipeline(self.source_dir, self.pipeline.output_dir, widths=(320,), qualities=(60,),
+                              workers=1, formats=["jpeg"])
+        self.addCleanup(other.shutdown)
+        for future in self.pipeline.warm_once():
+            future.result()
+        self.assertEqual(other.warm_once(), [])
+
+        Image.new("RGB", (800, 400), (0, 0, 0)).save(os.path.join(self.source_dir, "dam.png"))
+        os.utime(os.path.join(self.source_dir, "dam.png"), ns=(1, 1))
+        futures = other.warm_once()
+        self.assertEqual(len(futures), 2)
+        for future in futures:
+            future.result()
+        self.assertEqual(len([n for n in os.listdir(other.output_dir) if n.startswith(".prewarm-")]), 1)
+
+    def test_failed_prewarm_releases_the_lock(self):
+        """A prewarm with a failing variant leaves no marker, so the next worker tries again"""
+        with open(os.path.join(self.source_dir, "kapot.png"), "wb") as f:
+            f.write(b"geen afbeelding")
+        futures = self.pipeline.warm_once()
+        self.assertTrue(any(future.exception() is not None for future in futures))
+        self.assertEqual([n for n in os.listdir(self.pipeline.output_dir) if n.startswith(".prewarm-")], [])
+
+        os.remove(os.path.join(self.source_dir, "kapot.png"))
+        self.assertEqual(self.pipeline.warm_once(), [])  # alle varianten van dam.png bestaan al
+        self.assertEqual(len([n for n in os.listdir(self.pipeline.output_dir) if n.startswith(".prewarm-")]), 1)
+
+    def test_stale_prewarm_lock_is_taken_over(self):
+        """A lock left by a crashed worker blocks others only until it expires"""
+        self.pipeline.warm_once()
+        marker = [n for n in os.listdir(self.pipeline.output_dir) if n.startswith(".prewarm-")][0]
+        os.remove(os.path.join(self.pipeline.output_dir, marker))
+        lock = os.path.join(self.pipeline.output_dir, f"{marker}.lock")
+        open(lock, "w").close()
+        self.assertEqual(self.pipeline.warm_once(), [])
+        self.assertFalse(os.path.exists(os.path.join(self.pipeline.output_dir, marker)))
+
+        old = time.time() - PREWARM_LOCK_TIMEOUT - 1
+        os.utime(lock, (old, old))
+        self.pipeline.warm_once()
+        self.assertTrue(os.path.exists(os.path.join(self.pipeline.output_dir, marker)))
+        self.assertFalse(os.path.exists(lock))
+
+    def test_failed_encode_leaves_no_temp_file(self):
+        """An encoder error removes the partially written temporary file"""
+        def broken_save(img, fp, *args, **kwargs):
+            with open(fp, "wb") as f:
+                f.write(b"half")
+            raise OSError("schijf vol")
+
+        target = os.path.join(self.pipeline.output_dir, "dam.jpg")
+        os.makedirs(self.pipeline.output_dir, exist_ok=True)
+        with patch("PIL.Image.Image.save", broken_save), self.assertRaises(OSError):
+            encode_variant(os.path.join(self.source_dir, "dam.png"), target, 320, "jpeg", 60)
+        self.assertEqual(os.listdir(self.pipeline.output_dir), [])
+
+    def test_unknown_or_unsafe_names(self):
+        """Missing files and path tricks raise FileNotFoundError"""
+        for name in ("missing.png", "../dam.png", ".hidden"):
+            with self.assertRaises(FileNotFoundError):
+                self.pipeline.get(name)
+        with self.assertRaises(FileNotFoundError):
+            self.pipeline.variant_path("../../etc/passwd")
+
+
+if __name__ == "__main__":
+    unittest.main()
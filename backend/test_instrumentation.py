@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from instrumentation import HTTP_IN_FLIGHT, HTTP_REQUESTS, RequestProfiler, instrument_app
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profile_dir = tmp.name
+        self.app = Flask(__name__)
+        instrument_app(self.app, RequestProfiler(enabled=True, directory=self.profile_dir))
+
+        @self.app.route("/ping")
+        def ping():
+            self.in_flight = HTTP_IN_FLIGHT.value(endpoint="ping")
+            return "pong"
+
+        self.client = self.app.test_client()
+
+    def test_requests_are_timed_and_counted_in_flight(self):
+        """Each request is observed by endpoint and status; in-flight returns to zero"""
+        before = HTTP_REQUESTS.snapshot(endpoint="ping", method="GET", status="200")["count"]
+        self.assertEqual(self.client.get("/ping").status_code, 200)
+        self.assertEqual(self.in_flight, 1)
+        self.assertEqual(HTTP_IN_FLIGHT.value(endpoint="ping"), 0)
+        self.assertEqual(HTTP_REQUESTS.snapshot(endpoint="ping", method="GET", status="200")["count"],
+                         before + 1)
+
+    def test_profile_header_writes_profile(self):
+        """X-Profile: 1 produces a cProfile dump named in the X-Profile-Id header"""
+        response = self.client.get("/ping", headers={"X-Profile": "1"})
+        profile_id = response.headers["X-Profile-Id"]
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, f"{profile_id}.prof")))
+        self.assertNotIn("X-Profile-Id", self.client.get("/ping").headers)
+
+    def test_profile_header_ignored_when_disabled(self):
+        """Without PROFILING the header has no effect"""
+        profiler = RequestProfiler(enabled=False)
+        self.assertFalse(profiler.wants({"X-Profile": "1"}))
+        self.assertTrue(RequestProfiler(sample_rate=1.0).wants({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from lazy import Lazy
+
+
+class TestLazy(unittest.TestCase):
+
+    def test_factory_runs_once_on_first_use(self):
+        """The factory is called on first attribute access and only once"""
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return "tekst"
+
+        proxy = Lazy(factory)
+        self.assertFalse(proxy.loaded)
+        self.assertEqual(calls, [])
+        self.assertEqual(proxy.upper(), "TEKST")
+        self.assertEqual(proxy.lower(), "tekst")
+        self.assertTrue(proxy.loaded)
+        self.assertEqual(calls, [1])
+
+    def test_concurrent_first_use_builds_one_instance(self):
+        """Threads racing on first use share a single instance"""
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def factory():
+            calls.append(1)
+            return object()
+
+        proxy = Lazy(factory)
+        seen = []
+
+        def use():
+            barrier.wait()
+            seen.append(proxy.resolve())
+
+        threads = [threading.Thread(target=use) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(obj) for obj in seen}), 1)
+
+    def test_factory_error_is_not_cached(self):
+        """A failing factory is retried on the next use"""
+        attempts = []
+
+        def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("nog niet klaar")
+            return "ok"
+
+        proxy = Lazy(factory)
+        with self.assertRaises(RuntimeError):
+            proxy.upper()
+        self.assertFalse(proxy.loaded)
+        self.assertEqual(proxy.upper(), "OK")
+
+    def test_attributes_can_be_patched(self):
+        """patch.object on the proxy replaces and then restores the attribute"""
+        proxy = Lazy(lambda: "tekst")
+        with patch.object(proxy, "upper", return_value="hallo"):
+            self.assertEqual(proxy.upper(), "hallo")
+        self.assertEqual(proxy.upper(), "TEKST")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import httpx
+
+from benchmarks.stubs import OpenAIStub, start_stub
+from llm_client import LLMClient, LLMError, LLM_RETRIES
+
+MESSAGES = [{"role": "user", "content": "Zeg iets"}]
+
+
+class TestLLMClient(unittest.TestCase):
+
+    def start(self, **attrs):
+        server, base_url = start_stub(OpenAIStub, **attrs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"{base_url}/v1"
+
+    def test_chat_returns_content(self):
+        """A successful completion returns the message content"""
+        server, base_url = self.start()
+        client = LLMClient("test_key", base_url=base_url)
+        self.assertEqual(client.chat(MESSAGES), OpenAIStub.reply)
+        self.assertEqual(server.calls, 1)
+
+    def test_stream_chat_yields_tokens(self):
+        """Streaming completions yield content deltas as they arrive"""
+        server, base_url = self.start()
+        client = LLMClient("test_key", base_url=base_url)
+        self.assertEqual("".join(client.stream_chat(MESSAGES)).strip(), OpenAIStub.reply)
+
+    def test_retries_on_429_and_5xx(self):
+        """Rate limits and server errors are retried with backoff"""
+        server, base_url = self.start(script=(429, 503))
+        client = LLMClient("test_key", base_url=base_url, backoff_base=0.001)
+        before = LLM_RETRIES.value(reason="429")
+        self.assertEqual(client.chat(MESSAGES), OpenAIStub.reply)
+        self.assertEqual(server.calls, 3)
+        self.assertEqual(LLM_RETRIES.value(reason="429"), before + 1)
+
+    def test_gives_up_after_max_retries(self):
+        """Persistent errors raise LLMError once retries are exhausted"""
+        server, base_url = self.start(script=(500, 500, 500))
+        client = LLMClient("test_key", base_url=base_url, max_retries=2, backoff_base=0.001)
+        with self.assertRaises(LLMError) as ctx:
+            client.chat(MESSAGES)
+        self.assertEqual(ctx.exception.reason, "http_500")
+        self.assertEqual(server.calls, 3)
+
+    def test_read_timeout(self):
+        """A slow upstream is cut off by the read timeout"""
+        server, base_url = self.start(latency=0.5)
+        client = LLMClient("test_key", base_url=base_url, read_timeout=0.05, max_retries=0)
+        with self.assertRaises(LLMError) as ctx:
+            client.chat(MESSAGES)
+        self.assertEqual(ctx.exception.reason, "timeout")
+
+    def test_budget_cuts_off_slow_upstream(self):
+        """A per-call budget shortens the read timeout and skips further retries"""
+        server, base_url = self.start(latency=0.5)
+        client = LLMClient("test_key", base_url=base_url, read_timeout=5, max_retries=3)
+        started = time.perf_counter()
+        with self.assertRaises(LLMError) as ctx:
+            client.chat(MESSAGES, budget=0.1)
+        self.assertEqual(ctx.exception.reason, "deadline")
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(server.calls, 1)
+
+    def test_concurrency_limit(self):
+        """Calls beyond the in-flight cap are rejected after the queue timeout"""
+        server, base_url = self.start(latency=0.3)
+        client = LLMClient("test_key", base_url=base_url, max_in_flight=1, queue_timeout=0.05)
+        worker = threading.Thread(target=client.chat, args=(MESSAGES,))
+        worker.start()
+        self.addCleanup(worker.join)
+        while server.calls == 0:
+            pass
+        with self.assertRaises(LLMError) as ctx:
+            client.chat(MESSAGES)
+        self.assertEqual(ctx.exception.reason, "overloaded")
+
+    def test_achat_retries_and_times_out(self):
+        """The async path retries like chat and honours the read timeout"""
+        server, base_url = self.start(script=(503,))
+        client = LLMClient("test_key", base_url=base_url, backoff_base=0.001)
+
+        async def call(c):
+            async with httpx.AsyncClient() as http_client:
+                return await c.achat(http_client, MESSAGES)
+
+        self.assertEqual(asyncio.run(call(client)), OpenAIStub.reply)
+        self.assertEqual(server.calls, 2)
+
+        server, base_url = self.start(latency=0.5)
+        slow = LLMClient("test_key", base_url=base_url, read_timeout=0.05, max_retries=0)
+        with self.assertRaises(LLMError) as ctx:
+            asyncio.run(call(slow))
+        self.assertEqual(ctx.exception.reason, "timeout")
+
+
+if __name__ == '__main__':
+    unittest.main()
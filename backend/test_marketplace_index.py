@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from marketplace_index import MarketplaceIndex, decode_cursor, encode_cursor, match_query
+
+
+class TestMarketplaceIndex(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = os.path.join(tmp.name, "marketplace")
+        os.mkdir(self.directory)
+        for i in range(12):
+            self.write(f"gids_{i:02d}", {"name": f"Gids {i:02d}", "description": "Vertelt over dorpen.",
+                                         "traits": {"hobby": ["fietsen"] if i % 4 == 0 else "lezen"}})
+        self.write("visser", {"name": "Visser", "description": "Kent elke haven aan de Noordzee.",
+                              "traits": {"accent": "Urkers"}})
+        self.index = MarketplaceIndex(os.path.join(tmp.name, "index.sqlite3"),
+                                      {"marketplace": self.directory, "personas": os.path.join(tmp.name, "missing")},
+                                      sync_interval=3600)
+        self.index.sync(force=True)
+
+    def write(self, slug, data, mtime=None):
+        path = os.path.join(self.directory, f"{slug}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def walk(self, **kwargs):
+        slugs, cursor = [], None
+        while True:
+            page = self.index.search(cursor=cursor, limit=5, **kwargs)
+            slugs.extend(item["slug"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return slugs, page["total"]
+
+    def test_cursor_pagination_visits_every_persona_once(self):
+        """Walking the cursors returns each persona exactly once, for every sort order"""
+        by_name, total = self.walk()
+        self.assertEqual(total, 13)
+        self.assertEqual(by_name, sorted(by_name))
+        self.assertEqual(len(set(by_name)), 13)
+        self.assertEqual(sorted(self.walk(sort="newest")[0]), sorted(by_name))
+        self.assertEqual(self.walk(q="fietsen")[0], ["gids_00", "gids_04", "gids_08"])
+
+    def test_full_text_search_covers_description_and_traits(self):
+        """Search matches word prefixes in the description and trait values, ignoring punctuation"""
+        self.assertEqual([i["slug"] for i in self.index.search(q="haven")["items"]], ["visser"])
+        self.assertEqual([i["slug"] for i in self.index.search(q="urk")["items"]], ["visser"])
+        self.assertEqual(self.index.search(q='fiets"* (')["total"], 3)
+        self.assertEqual(match_query("  "), "")
+
+    def test_invalid_parameters_raise_value_error(self):
+        """Unknown sorts, relevance without a query and foreign cursors are rejected"""
+        with self.assertRaises(ValueError):
+            self.index.search(sort="prijs")
+        with self.assertRaises(ValueError):
+            self.index.search(sort="relevance")
+        with self.assertRaises(ValueError):
+            self.index.search(sort="newest", cursor=encode_cursor("name", "gids", 1))
+        with self.assertRaises(ValueError):
+            decode_cursor("!!", "name")
+
+    def test_sync_only_parses_changed_files(self):
+        """A sync re-reads only new or modified files and drops deleted ones"""
+        parsed = self.index.parsed
+        self.assertEqual(self.index.sync(force=True), 0)
+        self.write("gids_03", {"name": "Gids 03", "description": "Nu over molens."}, mtime=2000000000)
+        os.remove(os.path.join(self.directory, "visser.json"))
+        with open(os.path.join(self.directory, "kapot.json"), "w") as f:
+            f.write("{")
+        self.assertEqual(self.index.sync(force=True), 2)
+        self.assertEqual(self.index.parsed, parsed + 2)
+        self.assertEqual(self.index.sync(force=True), 0)
+        self.assertEqual(self.index.parsed, parsed + 2)
+        self.assertEqual(len(self.index), 12)
+        self.assertEqual(self.index.search(sort="newest", limit=1)["items"][0]["slug"], "gids_03")
+        self.assertEqual(self.index.search(q="haven")["total"], 0)
+
+    def test_listing_is_cached_per_version(self):
+        """Rendered pages are reused until the catalog changes; bodies come gzip'd with an ETag"""
+        first = self.index.listing(limit=10)
+        self.assertIs(self.index.listing(limit=10), first)
+        self.assertEqual(json.loads(first.body)["items"][0]["name"], "Gids 00")
+        self.assertIsNotNone(first.gzipped)
+
+        self.index.add("personas", "aap", {"name": "Aap", "description": "Klimt overal in."},
+                       os.stat(os.path.join(self.directory, "visser.json")))
+        second = self.index.listing(limit=10)
+        self.assertNotEqual(second.etag, first.etag)
+        self.assertEqual(json.loads(second.body)["items"][0]["source"], "personas")
+        self.assertEqual(self.index.search(source="marketplace")["total"], 13)
+
+    def test_from_env_keeps_the_index_out_of_the_source_tree(self):
+        """Without MARKETPLACE_INDEX_PATH the database goes to the temp directory"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        env = {k: v for k, v in os.environ.items() if k != "MARKETPLACE_INDEX_PATH"}
+        with patch.dict(os.environ, env, clear=True), \
+                patch("marketplace_index.tempfile.gettempdir", return_value=tmp.name):
+            index = MarketplaceIndex.from_env({"marketplace": self.directory})
+        self.assertEqual(os.path.dirname(index.path), tmp.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from metrics import Counter, Gauge, Histogram, Registry, render
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_gauge_tracks_in_progress(self):
+        """Gauges go up inside the block and back down afterwards, even on errors"""
+        gauge = Gauge("test_in_flight", "lopend", registry=self.registry)
+        with self.assertRaises(RuntimeError):
+            with gauge.track_inprogress():
+                self.assertEqual(gauge.value(), 1)
+                raise RuntimeError
+        self.assertEqual(gauge.value(), 0)
+
+    def test_callback_metrics_read_their_source(self):
+        """Callback metrics report the current state of an external source"""
+        source = {"hits": 3}
+        counter = Counter("test_hits_total", "hits", labelnames=("cache",), registry=self.registry,
+                          callback=lambda: [({"cache": "a"}, source["hits"])])
+        source["hits"] = 5
+        self.assertEqual(counter.samples(), [({"cache": "a"}, 5)])
+
+    def test_render_prometheus_text(self):
+        """The exposition format has HELP/TYPE lines, cumulative buckets, sum and count"""
+        histogram = Histogram("test_seconds", "duur", labelnames=("stage",), buckets=(0.1, 1.0),
+                              registry=self.registry)
+        histogram.observe(0.05, stage="geosearch")
+        histogram.observe(0.5, stage="geosearch")
+        Counter("test_errors_total", 'fouten met "quotes"', labelnames=("reason",),
+                registry=self.registry).inc(reason='a"b')
+
+        text = render(self.registry)
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{stage="geosearch",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="geosearch",le="+Inf"} 2', text)
+        self.assertIn('test_seconds_count{stage="geosearch"} 2', text)
+        self.assertIn('test_errors_total{reason="a\\"b"} 1', text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_histogram_time(self):
+        """Timing a block records one observation"""
+        histogram = Histogram("test_block_seconds", "duur", registry=self.registry)
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.snapshot()["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
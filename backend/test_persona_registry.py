@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+
+from persona_registry import PersonaRegistry, slugify
+
+
+class TestPersonaRegistry(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.personas_dir = os.path.join(tmp.name, "personas")
+        os.mkdir(self.personas_dir)
+        self.write("heino", {"name": "Heino", "description": "Een Amsterdammer.",
+                             "traits": {"accent": "Jordanees", "dislikes": ["Italië", "pasta"]}})
+        self.registry = PersonaRegistry(
+            {"personas": self.personas_dir, "marketplace": os.path.join(tmp.name, "missing")},
+            check_interval=3600,
+        )
+
+    def write(self, slug, data):
+        with open(os.path.join(self.personas_dir, f"{slug}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def test_lookup_by_slug_and_name(self):
+        """Personas are found by file name or case-insensitive display name"""
+        self.assertIs(self.registry.get("heino"), self.registry.get("HEINO"))
+        self.assertIsNone(self.registry.get("onbekend"))
+
+    def test_prompt_is_precompiled(self):
+        """Traits are rendered into the prompt text once at load time"""
+        prompt = self.registry.get("heino").prompt
+        self.assertTrue(prompt.startswith("Een Amsterdammer."))
+        self.assertIn("dislikes: Italië, pasta", prompt)
+
+    def test_listing_has_stable_etag(self):
+        """Listings are prebuilt JSON with an ETag; missing directories give an empty list"""
+        body, etag = self.registry.listing("personas")
+        self.assertEqual(json.loads(body), [{"name": "Heino", "description": "Een Amsterdammer."}])
+        self.assertEqual(self.registry.listing("personas"), (body, etag))
+        self.assertEqual(json.loads(self.registry.listing("marketplace")[0]), [])
+
+    def test_invalidate_picks_up_new_files(self):
+        """New files are loaded after invalidate(); unchanged trees are not reparsed"""
+        snapshot = self.registry.snapshot()
+        self.write("sergio_herman", {"name": "Sergio Herman", "description": "Een chef."})
+        self.assertIs(self.registry.snapshot(), snapshot)
+        self.registry.invalidate()
+        self.assertEqual(self.registry.get("Sergio Herman").slug, "sergio_herman")
+        self.assertNotEqual(self.registry.listing("personas")[1], snapshot.listings["personas"][1])
+
+    def test_broken_files_are_skipped(self):
+        """Invalid JSON is logged and skipped instead of breaking the listing"""
+        with open(os.path.join(self.personas_dir, "kapot.json"), "w") as f:
+            f.write("{niet json")
+        self.registry.invalidate()
+        with self.assertLogs("persona_registry", level="WARNING"):
+            self.assertEqual(len(self.registry.all()), 1)
+
+    def test_slugify(self):
+        """Display names map onto the existing file naming scheme"""
+        self.assertEqual(slugify("Sergio Herman"), "sergio_herman")
+        self.assertEqual(slugify("../../etc/passwd"), "etc_passwd")
+
+
+if __name__ == '__main__':
+    unittest.main()
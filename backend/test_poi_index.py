@@ -0,0 +1,74 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from poi_index import POIIndex, build_index, main
+
+# Ruim boven de ~0,1 ms die een query op een normale machine kost; te verhogen op trage CI
+QUERY_BUDGET_MS = float(os.getenv("POI_QUERY_BUDGET_MS", "5"))
+
+RECORDS = [
+    {"title": "Westerkerk", "lat": 52.3745, "lon": 4.8839, "summary": "Kerk aan de Prinsengracht."},
+    {"title": "Anne Frank Huis", "lat": 52.3752, "lon": 4.8840, "summary": "Museum."},
+    {"title": "Grote Markt", "lat": 51.2211, "lon": 4.3997, "summary": "Plein in Antwerpen."},
+    {"title": "Ergens", "lat": 52.0, "lon": 5.0},
+]
+
+
+class TestPOIIndex(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "index")
+        build_index(RECORDS, self.path, cell_size=0.05)
+        self.index = POIIndex(self.path)
+
+    def test_nearest_article(self):
+        """The closest point is returned with its pre-extracted summary"""
+        self.assertEqual(self.index.lookup(52.3746, 4.8838), ("Westerkerk", "Kerk aan de Prinsengracht."))
+        self.assertEqual(self.index.lookup(51.2200, 4.4000)[0], "Grote Markt")
+
+    def test_outside_radius(self):
+        """Nothing is returned when no point lies within the radius"""
+        self.assertIsNone(self.index.lookup(52.3746, 4.8838, radius=10))
+        self.assertEqual(self.index.lookup(52.01, 5.0, radius=5000), ("Ergens", ""))
+
+    def test_coverage(self):
+        """Coverage defaults to the extent of the dump"""
+        self.assertTrue(self.index.covers(52.0, 4.5))
+        self.assertFalse(self.index.covers(48.85, 2.35))
+
+    def test_cli_build_and_query(self):
+        """The CLI builds an index from a JSON lines dump"""
+        dump = os.path.join(os.path.dirname(self.path), "dump.jsonl")
+        with open(dump, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in RECORDS)
+        out = os.path.join(os.path.dirname(self.path), "cli-index")
+        self.assertEqual(main(["build", dump, out, "--bbox", "49.4", "2.5", "53.6", "7.3"]), 0)
+        index = POIIndex(out)
+        self.assertEqual(index.bboxes, [(49.4, 2.5, 53.6, 7.3)])
+        self.assertEqual(main(["query", out, "52.3746", "4.8838"]), 0)
+
+    def test_query_speed(self):
+        """Nearest-neighbour queries on a dense index stay within the query budget"""
+        rng = random.Random(7)
+        records = ({"title": f"POI {i}", "lat": rng.uniform(50.7, 53.5), "lon": rng.uniform(3.3, 7.2)}
+                   for i in range(50000))
+        build_index(records, self.path, cell_size=0.05)
+        index = POIIndex(self.path)
+        best = None
+        for _ in range(3):  # de snelste van drie, tegen ruis op een drukke machine
+            start = time.perf_counter()
+            for _ in range(500):
+                index.nearest(rng.uniform(50.8, 53.4), rng.uniform(3.4, 7.1))
+            elapsed = (time.perf_counter() - start) / 500
+            best = min(best or elapsed, elapsed)
+        self.assertLess(best * 1000, QUERY_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
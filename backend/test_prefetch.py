@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from geo_proxy import distance_m
+from prefetch import PrefetchQueue, ahead_points, destination
+
+
+class TestAheadPoints(unittest.TestCase):
+
+    def test_points_follow_heading_and_speed(self):
+        """At 60 km/h heading east, the traveller is 1 km further every minute"""
+        points = ahead_points(52.37, 4.89, heading=90, speed_kmh=60, horizon=180, step=60)
+        self.assertEqual([eta for eta, _, _ in points], [0, 60, 120, 180])
+        for eta, lat, lon in points[1:]:
+            self.assertAlmostEqual(distance_m(52.37, 4.89, lat, lon), eta / 60 * 1000, delta=1)
+            self.assertGreater(lon, 4.89)
+
+    def test_points_follow_the_route(self):
+        """With a route, points are placed along the route instead of straight ahead"""
+        corner = destination(52.37, 4.89, 0, 500)
+        end = destination(*corner, 90, 2000)
+        points = ahead_points(52.37, 4.89, heading=0, speed_kmh=36, horizon=120, step=60,
+                              route=[(52.37, 4.89), corner, end])
+        _, lat, lon = points[2]  # 1200 m: 500 m noordwaarts, dan 700 m oostwaarts
+        self.assertAlmostEqual(distance_m(*corner, lat, lon), 700, delta=2)
+
+    def test_standing_still_only_prefetches_current_place(self):
+        """Without speed or heading only the current place is fetched"""
+        self.assertEqual(ahead_points(52.37, 4.89, heading=None, speed_kmh=50), [(0, 52.37, 4.89)])
+        self.assertEqual(ahead_points(52.37, 4.89, heading=90, speed_kmh=0), [(0, 52.37, 4.89)])
+
+
+class TestPrefetchQueue(unittest.TestCase):
+
+    def test_nearest_tasks_run_first_and_far_ones_are_dropped(self):
+        """A full queue drops the task with the furthest arrival time"""
+        started = threading.Event()
+        release = threading.Event()
+        done = []
+
+        def handler(name):
+            if name == "blokker":
+                started.set()
+                release.wait(5)
+            done.append(name)
+
+        queue = PrefetchQueue(handler, max_size=2, workers=1)
+        self.addCleanup(queue.stop)
+        queue.submit("blokker", 0, float("inf"), "blokker")
+        self.assertTrue(started.wait(5))
+        self.assertEqual(queue.submit("ver", 300, float("inf"), "ver"), "queued")
+        self.assertEqual(queue.submit("midden", 120, float("inf"), "midden"), "queued")
+        self.assertEqual(queue.submit("dichtbij", 60, float("inf"), "dichtbij"), "queued")
+        self.assertEqual(queue.submit("nog verder", 600, float("inf"), "nog verder"), "dropped")
+        self.assertEqual(queue.submit("midden", 120, float("inf"), "midden"), "duplicate")
+        release.set()
+        self.assertTrue(queue.join(5))
+        self.assertEqual(done, ["blokker", "dichtbij", "midden"])
+
+    def test_expired_and_failing_tasks_are_skipped(self):
+        """Tasks for places already passed are skipped and errors do not stop the workers"""
+        done = []
+
+        def handler(name):
+            if name == "fout":
+                raise RuntimeError("upstream weg")
+            done.append(name)
+
+        queue = PrefetchQueue(handler, max_size=4, workers=1)
+        self.addCleanup(queue.stop)
+        queue.submit("verlopen", 0, -1, "verlopen")
+        queue.submit("fout", 1, float("inf"), "fout")
+        queue.submit("goed", 2, float("inf"), "goed")
+        self.assertTrue(queue.join(5))
+        self.assertEqual(done, ["goed"])
+        self.assertEqual(queue.submit("goed", 2, float("inf"), "goed"), "queued")
+
+
+if __name__ == "__main__":
+    unittest.main()
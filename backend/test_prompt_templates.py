@@ -0,0 +1,83 @@
+import os
+import time
+import unittest
+
+from prompt_templates import (OFFLINE_LINES, PERSONAS, builtin_persona, chat_prefix, chat_system_prompt,
+                              compile_template, offline_line)
+
+# Ruim boven de paar microseconden die een render normaal kost; te verhogen op trage CI
+RENDER_BUDGET_US = float(os.getenv("RENDER_BUDGET_US", "200"))
+
+
+class TestPromptTemplates(unittest.TestCase):
+
+    def test_templates_are_compiled_once(self):
+        """The same persona and language return the same compiled template"""
+        persona = builtin_persona("Belg", "nl")
+        self.assertIs(compile_template(persona, "nl"), compile_template(persona, "nl"))
+
+    def test_prefix_is_byte_stable(self):
+        """Different summaries and questions never change the prompt prefix"""
+        template = compile_template(builtin_persona("Jordanees", "nl"), "nl")
+        first = template.render("De Dam is een plein.", "Wat is dit?")
+        second = template.render("Het Vondelpark is een park.")
+        self.assertTrue(first.startswith(template.prefix))
+        self.assertTrue(second.startswith(template.prefix))
+        self.assertIn("Iemand vraagt je: 'Wat is dit?'. Wat zeg je?", first)
+        self.assertTrue(second.endswith("Geef één humoristische zin over deze plek."))
+
+    def test_english_templates_are_real_translations(self):
+        """English prompts come from their own template instead of word replacement"""
+        for style in PERSONAS:
+            prompt = compile_template(builtin_persona(style, "en"), "en").render(
+                "Jeroen Krabbé was born here.", "Wie is Jeroen?")
+            self.assertTrue(prompt.startswith("You are Heino"))
+            self.assertIn("Jeroen Krabbé was born here.", prompt)
+            self.assertIn("Someone asks you: 'Wie is Jeroen?'", prompt)
+            self.assertNotIn("Je ", prompt)
+
+    def test_unknown_style_and_language_fall_back(self):
+        """Unknown styles use Jordanees and unknown languages use Dutch"""
+        self.assertEqual(builtin_persona("Onbekend", "fr"), PERSONAS["Jordanees"]["nl"])
+        template = compile_template("Je bent een test.", "fr")
+        self.assertIn("Samenvatting van de plek:", template.prefix)
+
+    def test_offline_line_uses_first_sentence(self):
+        """Offline lines name the place and quote only the first sentence of the summary"""
+        line = offline_line("Westerkerk", "De Westerkerk is een kerk. Rembrandt ligt er begraven.", "Belg", "en")
+        self.assertIn("Westerkerk", line)
+        self.assertIn("De Westerkerk is een kerk.", line)
+        self.assertNotIn("Rembrandt", line)
+        self.assertIn(line, [t.format(title="Westerkerk", fact="De Westerkerk is een kerk.")
+                             for t in OFFLINE_LINES["Belg"]["en"]])
+
+    def test_offline_line_for_custom_persona(self):
+        """Personas without their own lines fall back to the default style"""
+        line = offline_line("Dam", "Een plein.", "Piraat", "fr")
+        self.assertIn(line, [t.format(title="Dam", fact="Een plein.") for t in OFFLINE_LINES["Jordanees"]["nl"]])
+
+    def test_chat_prompt_keeps_a_stable_prefix(self):
+        """Recent places are appended after the fixed chat prefix"""
+        persona = builtin_persona("Belg", "en")
+        prompt = chat_system_prompt(persona, "en", ["Dam", "Westerkerk"])
+        self.assertTrue(prompt.startswith(chat_prefix(persona, "en")))
+        self.assertTrue(prompt.endswith("Places the traveller just passed: Dam, Westerkerk."))
+        self.assertEqual(chat_system_prompt(persona, "en"), chat_prefix(persona, "en"))
+
+    def test_render_microbenchmark(self):
+        """Rendering a compiled template stays within the render budget"""
+        template = compile_template(builtin_persona("Jordanees", "nl"), "nl")
+        summary = "De Westerkerk is een protestantse kerk aan de Prinsengracht. " * 5
+        runs = 20000
+        best = None
+        for _ in range(3):  # de snelste van drie, tegen ruis op een drukke machine
+            start = time.perf_counter()
+            for _ in range(runs):
+                template.render(summary, "Wat is dit voor gebouw?")
+            per_call = (time.perf_counter() - start) / runs
+            best = min(best or per_call, per_call)
+        self.assertLess(best * 1e6, RENDER_BUDGET_US)
+
+
+if __name__ == '__main__':
+    unittest.main()
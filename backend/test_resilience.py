@@ -0,0 +1,74 @@
+import unittest
+
+from resilience import CircuitBreaker, CircuitOpenError, Deadline
+from test_support import FakeClock
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_remaining_counts_down_to_zero(self):
+        """The remaining budget shrinks with time and never goes negative"""
+        clock = FakeClock()
+        deadline = Deadline(2, clock=clock)
+        clock.now = 0.5
+        self.assertEqual(deadline.remaining(), 1.5)
+        self.assertFalse(deadline.expired)
+        clock.now = 3
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertTrue(deadline.expired)
+
+    def test_without_budget_there_is_no_limit(self):
+        """A deadline without a budget never expires"""
+        deadline = Deadline()
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.expired)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def trip(self, breaker, exc=None):
+        with self.assertRaises(type(exc or RuntimeError())):
+            with breaker.guard():
+                raise exc or RuntimeError("stuk")
+
+    def test_opens_after_threshold_and_rejects(self):
+        """Consecutive failures open the breaker; calls are then rejected immediately"""
+        breaker = CircuitBreaker("test_open", failure_threshold=2, reset_timeout=10, clock=FakeClock())
+        self.trip(breaker)
+        self.assertEqual(breaker.state, "closed")
+        self.trip(breaker)
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            with breaker.guard():
+                self.fail("mag niet worden uitgevoerd")
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        """After the reset timeout one probe is let through; its outcome decides the state"""
+        clock = FakeClock()
+        breaker = CircuitBreaker("test_half_open", failure_threshold=1, reset_timeout=10, clock=clock)
+        self.trip(breaker)
+        clock.now = 10
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # één proefaanroep tegelijk
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+        clock.now = 20
+        with breaker.guard():
+            pass
+        self.assertEqual(breaker.state, "closed")
+
+    def test_ignored_errors_do_not_count(self):
+        """Errors for which is_failure is false leave the breaker closed"""
+        breaker = CircuitBreaker("test_ignored", failure_threshold=1,
+                                 is_failure=lambda exc: not isinstance(exc, KeyError))
+        self.trip(breaker, KeyError("404"))
+        self.assertEqual(breaker.state, "closed")
+        self.trip(breaker)
+        self.assertEqual(breaker.state, "open")
+
+
+if __name__ == "__main__":
+    unittest.main()
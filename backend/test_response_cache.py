@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from response_cache import (MemoryStore, RedisStore, ResponseCache, SQLiteStore,
+                            fingerprint, merge_variant, normalize_question)
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis-py get/set/register_script interface.
+
+    The only script is the variant merge; it runs under a lock, as Redis runs scripts atomically.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode("utf-8")
+
+    def register_script(self, script):
+        def add_variant(keys, args):
+            text, keep, fresh_until, ttl = args
+            with self.lock:
+                raw = self.get(keys[0])
+                self.set(keys[0], json.dumps(merge_variant(json.loads(raw) if raw else None, text, keep, fresh_until)))
+        return add_variant
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_question_is_normalized(self):
+        """Case, punctuation and whitespace do not change the key"""
+        self.assertEqual(normalize_question("  Wat is DIT  voor gebouw?! "), "wat is dit voor gebouw")
+        self.assertEqual(fingerprint("Dam", "Belg", "nl", "Wat is dit?"),
+                         fingerprint("Dam", "Belg", "nl", "wat is  dit"))
+
+    def test_style_and_language_are_part_of_key(self):
+        """Different personas or languages get separate entries"""
+        self.assertNotEqual(fingerprint("Dam", "Belg", "nl"), fingerprint("Dam", "Brabander", "nl"))
+        self.assertNotEqual(fingerprint("Dam", "Belg", "nl"), fingerprint("Dam", "Belg", "en"))
+
+
+class StoreContract:
+    """Shared checks every backing store must pass."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def test_variant_pool(self):
+        """Variants are collected until the pool is full, then reused"""
+        cache = ResponseCache(self.make_store(), variants=2, ttl=60)
+        key = fingerprint("Westerkerk", "Jordanees", "nl")
+        self.assertIsNone(cache.pick(key))
+        cache.add(key, "een")
+        self.assertIsNone(cache.pick(key))
+        cache.add(key, "twee")
+        self.assertIn(cache.pick(key), {"een", "twee"})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (1, 2, 2))
+
+    def test_expired_pool_is_served_as_stale(self):
+        """A full pool past its TTL is reported stale until it is refreshed"""
+        cache = ResponseCache(self.make_store(), variants=1, ttl=0, stale_ttl=60)
+        key = fingerprint("Westerkerk", "Jordanees", "nl")
+        cache.add(key, "een")
+        self.assertEqual(cache.lookup(key), ("stale", "een"))
+        self.assertIsNone(cache.pick(key))
+        cache.ttl = 60
+        cache.add(key, "twee")
+        self.assertEqual(cache.lookup(key), ("fresh", "twee"))
+        self.assertEqual(cache.stats()["stale_hits"], 2)
+
+    def test_legacy_pools_count_as_stale(self):
+        """Plain variant lists written by older versions are still readable"""
+        store = self.make_store()
+        store.set("k", ["oud"], ttl=60)
+        self.assertEqual(ResponseCache(store, variants=1).lookup("k"), ("stale", "oud"))
+
+    def test_concurrent_adds_keep_every_variant(self):
+        """Completions finishing at the same time do not overwrite each other's variant"""
+        cache = ResponseCache(self.make_store(), variants=16, ttl=60)
+        key = fingerprint("Westerkerk", "Jordanees", "nl")
+        start = threading.Barrier(8)
+
+        def add(i):
+            start.wait()
+            for j in range(2):
+                cache.add(key, f"variant {i}-{j}")
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache.peek(key)), 16)
+
+    def test_expired_entries_are_ignored(self):
+        """Entries past their TTL are treated as missing"""
+        store = self.make_store()
+        store.set("k", ["oud"], ttl=-1)
+        self.assertIsNone(store.get("k"))
+
+
+class TestMemoryStore(StoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return MemoryStore(maxsize=10)
+
+
+class TestSQLiteStore(StoreContract, unittest.TestCase):
+
+    def make_store(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return SQLiteStore(os.path.join(tmp.name, "cache.sqlite3"), maxsize=2)
+
+    def test_adds_from_separate_connections_are_atomic(self):
+        """Two workers (connections) adding to one pool at once both keep their variant"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "cache.sqlite3")
+        caches = [ResponseCache(SQLiteStore(path), variants=40, ttl=60) for _ in range(2)]
+        start = threading.Barrier(2)
+
+        def add(i):
+            start.wait()
+            for j in range(20):
+                caches[i].add("k", f"worker {i} variant {j}")
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(caches[0].peek("k")), 40)
+
+    def test_evicts_least_recently_used(self):
+        """The store never grows beyond maxsize"""
+        store = self.make_store()
+        for key in ("a", "b", "c"):
+            store.set(key, [key], ttl=60)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.get("c"), ["c"])
+
+
+class TestRedisStore(StoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return RedisStore(FakeRedis())
+
+    def test_expired_entries_are_ignored(self):
+        """Expiry is delegated to Redis itself"""
+
+
+if __name__ == '__main__':
+    unittest.main()
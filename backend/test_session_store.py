@@ -0,0 +1,83 @@
+import unittest
+
+from session_store import SessionStore, estimate_tokens
+from test_support import FakeClock
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_rolling_window_of_places_and_turns(self):
+        """Only the most recent places and turns are kept, and repeats are merged"""
+        store = SessionStore(max_places=2, max_turns=3)
+        for title in ("Dam", "Dam", "Westerkerk", "Vondelpark"):
+            store.add_place("sessie-1", title)
+        for i in range(5):
+            store.add_turn("sessie-1", "user" if i % 2 == 0 else "assistant", f"beurt {i}")
+        self.assertEqual(store.places("sessie-1"), ["Westerkerk", "Vondelpark"])
+        self.assertEqual([m["content"] for m in store.history("sessie-1")], ["beurt 2", "beurt 3", "beurt 4"])
+        self.assertEqual(store.history("sessie-1")[0]["role"], "user")
+
+    def test_history_is_trimmed_to_token_budget(self):
+        """History keeps the newest turns that fit the token budget"""
+        store = SessionStore(max_chars=400)
+        store.add_turn("sessie-1", "user", "a" * 400)
+        store.add_turn("sessie-1", "assistant", "kort antwoord")
+        store.add_turn("sessie-1", "user", "nog een vraag")
+        budget = estimate_tokens("kort antwoord") + estimate_tokens("nog een vraag")
+        self.assertEqual([m["content"] for m in store.history("sessie-1", max_tokens=budget)],
+                         ["kort antwoord", "nog een vraag"])
+        self.assertEqual(len(store.history("sessie-1", max_tokens=1000)), 3)
+
+    def test_least_recently_used_session_is_evicted(self):
+        """The store never holds more than max_sessions sessions"""
+        store = SessionStore(max_sessions=2)
+        store.add_place("sessie-a", "Dam")
+        store.add_place("sessie-b", "Dam")
+        store.places("sessie-a")  # a is nu recenter dan b
+        store.add_place("sessie-c", "Dam")
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.places("sessie-b"), [])
+        self.assertEqual(store.places("sessie-a"), ["Dam"])
+        self.assertEqual(store.stats()["evicted"], 1)
+
+    def test_idle_sessions_expire(self):
+        """Sessions that are idle longer than the TTL are dropped"""
+        clock = FakeClock()
+        store = SessionStore(ttl=60, clock=clock)
+        store.add_turn("sessie-1", "user", "Hoi")
+        clock.now = 59
+        self.assertEqual(len(store.history("sessie-1")), 1)
+        clock.now = 120
+        self.assertEqual(store.history("sessie-1"), [])
+        self.assertEqual(store.stats()["expired"], 1)
+
+    def test_last_comment_expires_after_max_age(self):
+        """The anchor of the last new comment is only returned within max_age"""
+        clock = FakeClock()
+        store = SessionStore(clock=clock)
+        self.assertIsNone(store.last_comment("sessie-1", 600))
+        store.record_comment("sessie-1", 52.37, 4.89, "Westerkerk", "Kijk, de Westerkerk.")
+        self.assertEqual(store.last_comment("sessie-1", 600), (52.37, 4.89, "Westerkerk"))
+        self.assertEqual(store.unsaid("sessie-1", ["Kijk, de Westerkerk.", "Iets anders."]), ["Iets anders."])
+        self.assertEqual(store.places("sessie-1"), ["Westerkerk"])
+        clock.now = 600
+        self.assertIsNone(store.last_comment("sessie-1", 600))
+
+    def test_unsaid_matches_long_texts_despite_truncation(self):
+        """Texts longer than max_chars are still recognised as said"""
+        store = SessionStore(max_chars=20)
+        long_text = "De Westerkerk is de hoogste kerktoren van Amsterdam."
+        store.record_comment("sessie-1", 52.37, 4.89, "Westerkerk", long_text)
+        self.assertEqual(store.unsaid("sessie-1", [long_text, "Kort."]), ["Kort."])
+
+    def test_resolve_rejects_invalid_ids(self):
+        """Missing or malformed session ids are replaced by a new random id"""
+        self.assertEqual(SessionStore.resolve("sessie-123"), "sessie-123")
+        for invalid in (None, "", "kort", "met spaties erin", 42):
+            new_id = SessionStore.resolve(invalid)
+            self.assertNotEqual(new_id, invalid)
+            self.assertEqual(SessionStore.resolve(new_id), new_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
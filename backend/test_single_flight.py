@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_upstream_call(self):
+        """Callers with the same key wait on the single outstanding call"""
+        flights = AsyncSingleFlight("test_async_shared")
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return f"resultaat {key}"
+
+        async def scenario():
+            return await asyncio.gather(
+                *(flights.do(key, lambda key=key: fetch(key)) for key in ("a", "a", "a", "b"))
+            )
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ["resultaat a"] * 3 + ["resultaat b"])
+        self.assertEqual(sorted(calls), ["a", "b"])
+        self.assertEqual(flights.stats(), {"leaders": 2, "coalesced": 2, "in_flight": 0})
+
+    def test_errors_reach_every_waiter(self):
+        """An upstream failure is raised to all coalesced callers, and the key is freed"""
+        flights = AsyncSingleFlight("test_async_errors")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("stuk")
+
+        async def scenario():
+            return await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+    def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        """Cancelling one caller leaves the shared call running for the others"""
+        flights = AsyncSingleFlight("test_async_cancel")
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return "klaar"
+
+        async def scenario():
+            first = asyncio.ensure_future(flights.do("k", slow))
+            second = asyncio.ensure_future(flights.do("k", slow))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "klaar")
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_threads_share_one_call(self):
+        """Threads asking for the same key get the leader's result"""
+        flights = SingleFlight("test_threads_shared")
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(1)
+            return "antwoord"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("prompt", fetch)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 1
+        while flights.stats()["coalesced"] < 4 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["antwoord"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats(), {"leaders": 1, "coalesced": 4, "in_flight": 0})
+
+    def test_error_is_shared_and_key_released(self):
+        """A failing leader raises in every waiter; the next call starts fresh"""
+        flights = SingleFlight("test_threads_errors")
+
+        def fail():
+            raise ValueError("stuk")
+
+        with self.assertRaises(ValueError):
+            flights.do("k", fail)
+        self.assertEqual(flights.do("k", lambda: "weer goed"), "weer goed")
+
+    def test_waiter_timeout_leaves_leader_running(self):
+        """A waiter that runs out of time gives up while the leader finishes"""
+        flights = SingleFlight("test_threads_timeout")
+        release = threading.Event()
+        results = []
+
+        def slow():
+            release.wait(1)
+            return "laat"
+
+        leader = threading.Thread(target=lambda: results.append(flights.do("k", slow)))
+        leader.start()
+        while not flights.busy("k"):
+            time.sleep(0.001)
+        with self.assertRaises(TimeoutError):
+            flights.do("k", slow, timeout=0.01)
+        release.set()
+        leader.join()
+        self.assertEqual(results, ["laat"])
+        self.assertFalse(flights.busy("k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from streaming import format_event, iter_sentences
+
+
+class TestIterSentences(unittest.TestCase):
+
+    def test_flushes_at_sentence_boundaries(self):
+        """Fragments are regrouped into whole sentences"""
+        fragments = ["Dit is de ", "Westerkerk, gozer. ", "Hier ligt Rembrandt", " begraven! En", " verder niks"]
+        self.assertEqual(list(iter_sentences(fragments)), [
+            "Dit is de Westerkerk, gozer.",
+            "Hier ligt Rembrandt begraven!",
+            "En verder niks",
+        ])
+
+    def test_short_sentences_are_merged(self):
+        """Very short sentences are held back until the next one"""
+        fragments = ["Ja. ", "Dat is nou de Dam. ", "Mooi hè?"]
+        self.assertEqual(list(iter_sentences(fragments)), ["Ja. Dat is nou de Dam.", "Mooi hè?"])
+
+    def test_yields_sentence_before_stream_ends(self):
+        """A sentence is emitted as soon as it is complete"""
+        def fragments():
+            yield "Eerste zin is nu al klaar. "
+            raise AssertionError("te laat")
+
+        self.assertEqual(next(iter_sentences(fragments())), "Eerste zin is nu al klaar.")
+
+
+class TestFormatEvent(unittest.TestCase):
+
+    def test_sse_format(self):
+        """Events are framed as server-sent events by default"""
+        self.assertEqual(format_event("sentence", {"text": "Hé"}), 'event: sentence\ndata: {"text": "Hé"}\n\n')
+
+    def test_ndjson_format(self):
+        """Events can be framed as JSON lines"""
+        line = format_event("done", {"text": "Klaar"}, ndjson=True)
+        self.assertTrue(line.endswith("\n"))
+        self.assertEqual(json.loads(line), {"event": "done", "text": "Klaar"})
+
+
+if __name__ == '__main__':
+    unittest.main()
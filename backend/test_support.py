@@ -0,0 +1,14 @@
+"""Gedeelde hulpmiddelen voor de tests."""
+
+
+class FakeClock:
+    """Klok die alleen verspringt als een test `now` zet of `sleep` aanroept."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
@@ -3,6 +3,61 @@
  * Chatfunctionaliteit met AI persona-integratie
  */
 
+/**
+ * Sessie voor de backend: die bewaart de recente plekken en chatbeurten,
+ * zodat niet bij elk bericht de hele geschiedenis mee hoeft. De endpoints
+ * die een completion kosten vragen een sessietoken van /api/session.
+ */
+const TravelBotSession = {
+    storageKey: 'travelbot-session-id',
+    tokenKey: 'travelbot-session-token',
+
+    get() {
+        return sessionStorage.getItem(this.storageKey);
+    },
+
+    remember(sessionId) {
+        if (sessionId) {
+            sessionStorage.setItem(this.storageKey, sessionId);
+        }
+    },
+
+    async token() {
+        const stored = JSON.parse(sessionStorage.getItem(this.tokenKey) || 'null');
+        if (stored && stored.expires > Date.now()) {
+            return stored.token;
+        }
+        const response = await fetch('/api/session', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session_id: this.get() })
+        });
+        if (!response.ok) {
+            throw new Error(`Session error: ${response.status}`);
+        }
+        const data = await response.json();
+        this.remember(data.session_id);
+        // Een minuut marge, zodat het token niet onderweg verloopt
+        sessionStorage.setItem(this.tokenKey, JSON.stringify({
+            token: data.token,
+            expires: Date.now() + (data.expires_in - 60) * 1000
+        }));
+        return data.token;
+    },
+
+    async fetch(url, options = {}) {
+        // Bij 401 (verlopen token of nieuwe SECRET_KEY) één keer met een nieuw token
+        for (let attempt = 0; ; attempt++) {
+            const headers = { ...options.headers, 'X-Session-Token': await this.token() };
+            const response = await fetch(url, { ...options, headers });
+            if (response.status !== 401 || attempt > 0) {
+                return response;
+            }
+            sessionStorage.removeItem(this.tokenKey);
+        }
+    }
+};
+
 class ChatManager {
     constructor() {
         this.messages = [];
@@ -287,7 +342,7 @@ class ChatManager {
         
         try {
             // Call backend API for persona response
-            const response = await fetch('/api/persona-chat', {
+            const response = await TravelBotSession.fetch('/api/persona-chat', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -302,6 +357,7 @@ class ChatManager {
             
             if (response.ok) {
                 const data = await response.json();
+                TravelBotSession.remember(data.session_id);
                 return data.response;
             } else {
                 throw new Error(`API error: ${response.status}`);
@@ -338,10 +394,6 @@ class ChatManager {
     buildChatContext(message) {
         const context = {
             ...this.chatContext,
-            recentMessages: this.messages.slice(-5).map(m => ({
-                sender: m.sender,
-                content: m.content
-            })),
             timeOfDay: this.getTimeOfDay(),
             dayOfWeek: this.getDayOfWeek(),
             language: translator?.getCurrentLanguage() || 'nl'
@@ -335,14 +335,9 @@ class LocationManager {
     
     async reverseGeocode(location) {
         try {
-            // Use a free geocoding service (example: OpenStreetMap Nominatim)
+            // Nominatim via de backend-proxy (gecachet per geo-cel, binnen de rate limit)
             const response = await fetch(
-                `https://nominatim.openstreetmap.org/reverse?format=json&lat=${location.latitude}&lon=${location.longitude}&zoom=18&addressdetails=1`,
-                {
-                    headers: {
-                        'User-Agent': 'TravelBot/3.0'
-                    }
-                }
+                `/api/geocode/reverse?lat=${location.latitude}&lon=${location.longitude}&zoom=18`
             );
             
             if (response.ok) {
@@ -12,6 +12,8 @@ class TravelBotApp {
         this.updateInterval = 15; // minutes
         this.lastUpdate = null;
         this.updateTimer = null;
+        this.lastPrefetch = 0;
+        this.prefetchInterval = 60 * 1000; // Plekken vooruit hooguit eens per minuut laten ophalen
         
         // Component references
         this.translator = null;
@@ -406,7 +408,8 @@ class TravelBotApp {
         const intervalMs = this.updateInterval * 60 * 1000; // Convert to milliseconds
         
         this.updateTimer = setInterval(() => {
-            this.generateLocationComment();
+            // Timer-tikken gaan in de achtergrondbaan van de backend, zodat chat voorgaat
+            this.generateLocationComment({ background: true });
         }, intervalMs);
         
         console.log(`Update timer set for ${this.updateInterval} minutes`);
@@ -452,6 +455,48 @@ class TravelBotApp {
         if (this.ttsManager && summary.speed) {
             this.ttsManager.adjustForMovement(summary.speed);
         }
+        
+        this.prefetchAhead(location, summary);
+    }
+    
+    prefetchAhead(location, summary) {
+        // Laat de backend plekken langs de route alvast ophalen, zodat de volgende opmerking direct klaar is
+        if (!summary.isMoving || Date.now() - this.lastPrefetch < this.prefetchInterval) return;
+        this.lastPrefetch = Date.now();
+        
+        TravelBotSession.fetch('/api/prefetch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                lat: location.latitude,
+                lon: location.longitude,
+                heading: summary.direction,
+                speed: summary.speed,
+                route: this.getRouteAhead(location),
+                persona: this.currentPersona,
+                language: this.translator?.getCurrentLanguage() || 'nl'
+            })
+        }).catch(error => console.warn('Prefetch failed:', error));
+    }
+    
+    getRouteAhead(location, maxPoints = 200) {
+        // Alleen het deel van de actieve route vanaf het dichtstbijzijnde punt, als [lat, lon]
+        const coordinates = this.appState.isNavigating && this.navigationManager?.getCurrentRoute()?.coordinates;
+        if (!coordinates || coordinates.length === 0) return null;
+        
+        let nearest = 0;
+        let nearestDistance = Infinity;
+        coordinates.forEach(([lng, lat], index) => {
+            const distance = (lat - location.latitude) ** 2 + (lng - location.longitude) ** 2;
+            if (distance < nearestDistance) {
+                nearest = index;
+                nearestDistance = distance;
+            }
+        });
+        
+        return coordinates.slice(nearest, nearest + maxPoints).map(([lng, lat]) => [lat, lng]);
     }
     
     handleRouteChange(routeType, data) {
@@ -642,7 +687,7 @@ class TravelBotApp {
         }, 3000);
     }
     
-    async generateLocationComment() {
+    async generateLocationComment(options = {}) {
         if (!this.currentPersona || !this.appState.hasLocation) {
             console.log('Cannot generate location comment - missing persona or location');
             return;
@@ -663,7 +708,13 @@ class TravelBotApp {
                     this.appState.currentMovement.routeType
                 );
             } else {
-                comment = await this.generateContextualComment(context);
+                comment = await this.generateContextualComment(context, options);
+            }
+            
+            if (!comment) {
+                // Niets nieuws sinds de vorige opmerking: de huidige blijft staan
+                this.hideProcessing();
+                return;
             }
             
             this.updateResponse(comment);
@@ -700,13 +751,14 @@ class TravelBotApp {
         }
     }
     
-    async generateContextualComment(context) {
+    async generateContextualComment(context, options = {}) {
         // Try to get contextual comment from backend
         try {
-            const response = await fetch('/api/location-comment', {
+            const response = await TravelBotSession.fetch('/api/location-comment', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'X-Priority': options.background ? 'background' : 'interactive'
                 },
                 body: JSON.stringify({
                     persona: this.currentPersona,
@@ -717,7 +769,8 @@ class TravelBotApp {
             
             if (response.ok) {
                 const data = await response.json();
-                return data.comment;
+                TravelBotSession.remember(data.session_id);
+                return data.comment; // null als de backend niets nieuws te melden heeft
             } else {
                 throw new Error(`API error: ${response.status}`);
             }
@@ -741,8 +794,12 @@ class TravelBotApp {
         const locationElement = document.getElementById('location-details');
         const locationName = locationElement?.textContent?.replace('📍 ', '') || '';
         
+        const location = this.appState.currentLocation;
+        
         return {
             locationName: locationName,
+            lat: location?.latitude,
+            lon: location?.longitude,
             speed: Math.round(this.appState.currentMovement?.speed || 0),
             routeType: this.appState.currentMovement?.routeType || 'detecting',
             timeOfDay: this.getTimeOfDay(),
@@ -1105,9 +1162,9 @@ class TravelBotApp {
 
     async geocodeDestination(query) {
         try {
-            // Use Nominatim geocoding service
+            // Nominatim via de backend-proxy
             const response = await fetch(
-                `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(query)}&limit=1&countrycodes=nl,be,de`
+                `/api/geocode/search?q=${encodeURIComponent(query)}&limit=1&countrycodes=nl,be,de`
             );
             
             const data = await response.json();
@@ -413,9 +413,9 @@ class ReverseGeocoder {
         }
 
         try {
-            // Use Nominatim (free OpenStreetMap service)
+            // Nominatim via de backend-proxy (gecachet per geo-cel)
             const response = await fetch(
-                `https://nominatim.openstreetmap.org/reverse?format=json&lat=${lat}&lon=${lng}&zoom=18&addressdetails=1&accept-language=nl`
+                `/api/geocode/reverse?lat=${lat}&lon=${lng}&zoom=18&accept-language=nl`
             );
 
             if (!response.ok) {
@@ -453,26 +453,15 @@ class ReverseGeocoder {
  */
 class PointOfInterestDetector {
     constructor() {
-        this.overpassUrl = 'https://overpass-api.de/api/interpreter';
+        // Overpass via de backend-proxy: één query per tegel voor alle gebruikers in de buurt
+        this.poiUrl = '/api/pois';
     }
 
     async findNearbyPOIs(location, radius = 200) {
         try {
-            // Query Overpass API for nearby POIs
-            const query = `
-                [out:json][timeout:5];
-                (
-                    node(around:${radius},${location.latitude},${location.longitude})[amenity~"^(restaurant|cafe|museum|theatre|cinema|attraction)$"];
-                    node(around:${radius},${location.latitude},${location.longitude})[tourism~"^(attraction|museum)$"];
-                );
-                out 10;
-            `;
-
-            const response = await fetch(this.overpassUrl, {
-                method: 'POST',
-                headers: { 'Content-Type': 'text/plain' },
-                body: query
-            });
+            const response = await fetch(
+                `${this.poiUrl}?lat=${location.latitude}&lon=${location.longitude}&radius=${radius}&limit=10`
+            );
 
             if (!response.ok) {
                 throw new Error(`POI query failed: ${response.status}`);
@@ -26,7 +26,6 @@ const PRECACHE_URLS = [
 
 // Runtime cache patterns
 const RUNTIME_CACHE_PATTERNS = [
-    /^https:\/\/nominatim\.openstreetmap\.org\//,
     /^\/api\//
 ];
 